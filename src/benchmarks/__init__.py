@@ -0,0 +1,10 @@
+'''
+Benchmarks for the engine's hot paths and for whole games.
+
+    python -m benchmarks [--out results.json] [--baseline baseline.json] [--threshold 0.15]
+
+Run from src/. micro.py times single calls (move generation, longest road, evaluation...) on
+fixed-seed positions from positions.py, games.py plays whole games per agent class, and
+compare.py checks a run against a stored baseline. Results are plain JSON, so a run saved with
+--out can be used as the baseline for the next one.
+'''
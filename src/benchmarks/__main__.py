@@ -0,0 +1,50 @@
+import sys
+import time
+import platform
+import argparse
+from benchmarks.micro import runMicro
+from benchmarks.games import runGames
+from benchmarks.compare import loadResults, saveResults, compare
+
+# python -m benchmarks [--out file] [--baseline file] [--threshold 0.15] [--skip-micro]
+#                      [--skip-games] [--games N] [--only name ...]
+# Exits with status 1 if anything regressed against the baseline
+
+def main():
+    parser = argparse.ArgumentParser(description='Catan engine benchmarks')
+    parser.add_argument('--out', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='fraction by which a metric may be worse than the baseline')
+    parser.add_argument('--games', type=int, default=3, help='games per agent class')
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--skip-games', action='store_true')
+    parser.add_argument('--only', nargs='+', help='only run these benchmarks or agent classes')
+    args = parser.parse_args()
+
+    results = {'meta': {'time': time.time(), 'python': platform.python_version(),
+                        'machine': platform.machine()}}
+    if not args.skip_micro:
+        results['micro'] = runMicro(args.only)
+        for name, seconds in sorted(results['micro'].items()):
+            print('%-36s %10.1f us' % (name, seconds * 1e6))
+    if not args.skip_games:
+        results['games'] = runGames(args.games, args.only)
+        for name, rates in sorted(results['games'].items()):
+            print('%-36s %8.3f games/s %10.1f turns/s' % (name, rates['gamesPerSec'], rates['turnsPerSec']))
+
+    if args.out:
+        saveResults(results, args.out)
+
+    if args.baseline:
+        rows, regressions = compare(results, loadResults(args.baseline), args.threshold)
+        print('')
+        for row in rows:
+            flag = '  REGRESSION' if row in regressions else ''
+            print('%-40s %+7.1f%%%s' % (row['metric'], -100 * row['change'], flag))
+        if regressions:
+            print('%d of %d metrics regressed by more than %d%%' % (len(regressions), len(rows), 100 * args.threshold))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+import json
+
+'''
+Comparison against a stored baseline. Micro results are seconds per call (lower is better),
+game results are rates (higher is better). A metric regresses when it is more than threshold
+(a fraction) worse than the baseline.
+'''
+
+def loadResults(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def saveResults(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+# Flatten results to {metric: (value, higherIsBetter)}
+def metrics(results):
+    flat = {}
+    for name, seconds in results.get('micro', {}).items():
+        flat['micro/' + name] = (seconds, False)
+    for name, rates in results.get('games', {}).items():
+        for rate, value in rates.items():
+            flat['games/%s/%s' % (name, rate)] = (value, True)
+    return flat
+
+# Returns a list of {'metric', 'baseline', 'current', 'change'} for every metric both runs have,
+# change being the fraction by which current is worse (negative when it is better), plus the
+# list of regressions among them
+def compare(results, baseline, threshold=0.15):
+    current, base = metrics(results), metrics(baseline)
+    rows, regressions = [], []
+    for metric in sorted(set(current) & set(base)):
+        value, higherIsBetter = current[metric]
+        baseValue = base[metric][0]
+        if not baseValue:
+            continue
+        if higherIsBetter:
+            change = (baseValue - value) / baseValue
+        else:
+            change = (value - baseValue) / baseValue
+        row = {'metric': metric, 'baseline': baseValue, 'current': value, 'change': change}
+        rows.append(row)
+        if change > threshold:
+            regressions.append(row)
+    return rows, regressions
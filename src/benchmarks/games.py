@@ -0,0 +1,32 @@
+import time
+from engine import Engine
+from players import WeightedAI, qAI, minimax
+from rng import spawnSeeds
+from benchmarks.positions import benchmarkPlayers, benchmarkWeights
+
+'''
+End-to-end throughput: whole seeded games per agent class, all four seats the same class.
+Most games run to the round cap, so turns per second is reported next to games per second.
+'''
+
+AGENT_CLASSES = [('WeightedAI', WeightedAI), ('qAI', qAI), ('minimax', minimax)]
+
+# Returns {'games': n, 'turns': total turns, 'seconds': wall time}
+def timeGames(cls, numGames, seed=0):
+    weights = benchmarkWeights()
+    turns, start = 0, time.time()
+    for gameSeed in spawnSeeds(seed, numGames):
+        result = Engine(benchmarkPlayers(cls, weights), seed=gameSeed).main()
+        turns += result['turns']
+    return {'games': numGames, 'turns': turns, 'seconds': time.time() - start}
+
+# Returns {'class': {'gamesPerSec': .., 'turnsPerSec': ..}}
+def runGames(numGames=3, names=None, seed=0):
+    results = {}
+    for name, cls in AGENT_CLASSES:
+        if names is not None and name not in names:
+            continue
+        timing = timeGames(cls, numGames, seed)
+        results[name] = {'gamesPerSec': timing['games'] / timing['seconds'],
+                         'turnsPerSec': timing['turns'] / timing['seconds']}
+    return results
@@ -0,0 +1,100 @@
+import time
+import copy
+from collections import defaultdict
+from benchmarks.positions import POSITIONS, buildPosition
+
+'''
+Microbenchmarks. Each benchmark takes a position and returns a callable that does one call of
+the code under test and leaves the position as it found it, so it can be called over and over.
+'''
+
+def benchGetPossibleActions(engine):
+    game, player = engine.game, engine.currentPlayer()
+    return lambda: game.getPossibleActions(player)
+
+def benchFindResourceCombos(engine):
+    game, player = engine.game, engine.currentPlayer()
+    return lambda: game.findResourceCombos(defaultdict(int), [], player)
+
+def benchGetRoadLocations(engine):
+    game, player = engine.game, engine.currentPlayer()
+    return lambda: game.getRoadLocations(player)
+
+def benchGetSettlementLocations(engine):
+    game, player = engine.game, engine.currentPlayer()
+    return lambda: game.getSettlementLocations(player)
+
+# Re-adds the player's last road. updateLongestRoad appends to the touching lists, so the dict
+# and its lists are rebuilt from a copy on every call, which is part of the time measured but
+# small next to the path search
+def benchUpdateLongestRoad(engine):
+    player = engine.currentPlayer()
+    road = player.roads[-1]
+    touching = dict((node, list(nodes)) for node, nodes in player.touching.items())
+    longest = player.longestRoadLength
+    def call():
+        player.touching = defaultdict(list, ((node, list(nodes)) for node, nodes in touching.items()))
+        player.updateLongestRoad(road)
+        player.longestRoadLength = longest
+    return call
+
+# Distributes a roll of 6 (never 7, which moves the robber) and takes the payouts back
+def benchDistributeResources(engine):
+    game, player = engine.game, engine.currentPlayer()
+    def call():
+        saved = [(p, dict(p.resources), p.numResources, p.numTimesOverSeven) for p in game.players]
+        game.distributeResources(6, None, player)
+        for p, resources, numResources, numTimesOverSeven in saved:
+            p.resources.update(resources)
+            p.numResources = numResources
+            p.numTimesOverSeven = numTimesOverSeven
+    return call
+
+def benchFeatureExtractor(engine):
+    game, player = engine.game, engine.currentPlayer()
+    return lambda: player.feature_extractor(game)
+
+# Evaluates buying a settlement on the first legal spot (or a road, if there is none)
+def benchEvaluateMoveValue(engine):
+    game, player = engine.game, engine.currentPlayer()
+    settlements = game.getSettlementLocations(player)
+    if settlements:
+        move = (('Settlement', 1), settlements[0])
+    else:
+        move = (('Road', 1), game.getRoadLocations(player)[0])
+    return lambda: player.evaluateMoveValue(game, move)
+
+BENCHMARKS = [('getPossibleActions', benchGetPossibleActions),
+              ('findResourceCombos', benchFindResourceCombos),
+              ('getRoadLocations', benchGetRoadLocations),
+              ('getSettlementLocations', benchGetSettlementLocations),
+              ('updateLongestRoad', benchUpdateLongestRoad),
+              ('distributeResources', benchDistributeResources),
+              ('feature_extractor', benchFeatureExtractor),
+              ('evaluateMoveValue', benchEvaluateMoveValue)]
+
+# Seconds per call: the best of repeat rounds, each timing calls for at least minTime seconds
+def timeCall(call, repeat=5, minTime=0.05):
+    call()
+    best = float('inf')
+    for i in range(repeat):
+        calls, start = 0, time.time()
+        while True:
+            call()
+            calls += 1
+            elapsed = time.time() - start
+            if elapsed >= minTime:
+                break
+        best = min(best, elapsed / calls)
+    return best
+
+# Returns {'benchmark/position': seconds per call}
+def runMicro(names=None, repeat=5, minTime=0.05):
+    results = {}
+    for position in sorted(POSITIONS):
+        engine = buildPosition(position)
+        for name, bench in BENCHMARKS:
+            if names is not None and name not in names:
+                continue
+            results['%s/%s' % (name, position)] = timeCall(bench(engine), repeat, minTime)
+    return results
@@ -0,0 +1,54 @@
+import random
+from collections import defaultdict
+from engine import Engine
+from log import DictLog
+from players import Player, WeightedAI
+
+'''
+Fixed-seed positions for the benchmarks. A position is an Engine a given number of turns into a
+seeded game between WeightedAIs with fixed weights, so every run measures the same states.
+'''
+
+# name: (seed, turns played after setup)
+POSITIONS = {'early': (1, 8),
+             'mid': (2, 60),
+             'late': (3, 200)}
+
+# Hand given to the player to move before timing, so move generation always has purchases and
+# trades to explore. The resource flow in real games is too thin to rely on
+BENCH_HAND = {'Ore': 3, 'Brick': 2, 'Wood': 2, 'Grain': 3, 'Wool': 2}
+
+COLORS = ['orange', 'red', 'green', 'blue']
+
+# Weights drawn the same way WeightedAI draws its random starting weights, from a fixed seed
+def benchmarkWeights(seed=0):
+    rng = random.Random(seed)
+    weights = {}
+    for feature in sorted(Player(0, '0', COLORS[0]).features):
+        weights[feature] = rng.randint(-3, 3)
+    weights['Score'] = abs(weights['Score'])
+    weights['Has Won'] = 1000
+    weights['Ratio roads to settlements'] = rng.randint(-5, -3)
+    weights['Squared distance to end'] = rng.randint(-1, 1)
+    return weights
+
+def benchmarkPlayers(cls=WeightedAI, weights=None):
+    if weights is None:
+        weights = benchmarkWeights()
+    return [cls(i, str(i), COLORS[i], DictLog(weights)) for i in range(4)]
+
+# Play a seeded game up to the position and give the player to move the benchmark hand
+def buildPosition(name):
+    seed, turns = POSITIONS[name]
+    engine = Engine(benchmarkPlayers(), seed=seed)
+    engine.setup()
+    for i in range(turns):
+        if engine.isOver():
+            break
+        engine.play_turn()
+
+    player = engine.currentPlayer()
+    for resource, count in BENCH_HAND.items():
+        player.resources[resource] = count
+    player.numResources = sum(BENCH_HAND.values())
+    return engine
@@ -15,6 +15,15 @@ class Node:
         self.occupyingPiece = None
         self.port = None
 
+    # Hash by position, so sets and dicts of nodes iterate in the same order in every run
+    def __hash__(self):
+        return hash((self.row, self.col))
+
+    # Copies and pickles are built with the position first, since they may be hashed into a dict
+    # before the rest of their state is filled in
+    def __getinitargs__(self):
+        return (self.row, self.col)
+
     def __str__(self):
         printStr = "Node: (" + str(self.row) + ", " + str(self.col) + ")"
         return printStr
@@ -0,0 +1,183 @@
+import os
+import re
+import json
+import atexit
+import weakref
+import threading
+import traceback
+from registry import writeAtomic
+
+'''
+Checkpoints of a long training run. A checkpoint is one JSON file holding everything needed to
+carry on: the iteration reached, every seat's weights, the win counts, random states and
+whatever else the trainer puts in. Files are written with writeAtomic (temporary file, fsync,
+rename), so a run killed in the middle of a checkpoint still has the one before it, and only the
+last keep checkpoints are kept.
+
+Given a BackgroundWriter, checkpoints (and anything else handed to the writer, like the weight
+registry's files) are serialized and written by its thread, so the training loop doesn't wait
+on the disk.
+
+    checkpoints = Checkpointer('checkpoints')
+    state = checkpoints.load()         # None if there's nothing to resume
+    ...
+    checkpoints.save(iteration, state)
+'''
+
+FILE_PATTERN = re.compile(r'^checkpoint-(\d+)\.json$')
+
+class Checkpointer(object):
+    """
+    The checkpoints in directory, oldest first by iteration.
+    """
+    def __init__(self, directory, keep=3, writer=None):
+        self.directory = directory
+        self.keep = keep
+        self.writer = writer
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, iteration):
+        return os.path.join(self.directory, 'checkpoint-%09d.json' % iteration)
+
+    # (iteration, path) of every checkpoint, oldest first
+    def checkpoints(self):
+        found = []
+        for fileName in os.listdir(self.directory):
+            match = FILE_PATTERN.match(fileName)
+            if match:
+                found.append((int(match.group(1)), os.path.join(self.directory, fileName)))
+        return sorted(found)
+
+    # Save a checkpoint. With a writer, state is written in the background and must not be
+    # changed afterwards; a checkpoint that is still waiting is replaced by a newer one
+    def save(self, iteration, state):
+        if self.writer is not None:
+            self.writer.write(self.directory, self.write, iteration, state)
+        else:
+            self.write(iteration, state)
+
+    def write(self, iteration, state):
+        state = dict(state, iteration=iteration)
+        writeAtomic(self.path(iteration), json.dumps(state))
+        for old, path in self.checkpoints()[:-self.keep]:
+            os.remove(path)
+
+    # The latest checkpoint that can be read, or None
+    def load(self):
+        for iteration, path in reversed(self.checkpoints()):
+            try:
+                with open(path) as f:
+                    return json.load(f)
+            except ValueError:
+                print('Skipping unreadable checkpoint ' + path)
+        return None
+
+#############################################################################
+#########################  Background writing  ##############################
+#############################################################################
+
+# Every BackgroundWriter that is still open, so that they can all be finished at exit
+_openWriters = weakref.WeakSet()
+
+class BackgroundWriter(object):
+    """
+    Thread that does writes handed to it with write. Each write has a key naming what it writes
+    (a file, say): a write waiting under a key is replaced by a newer one with the same key, so
+    only the latest snapshot of anything gets written. At most maxPending keys wait at a time;
+    beyond that, write blocks until the thread catches up. An error in the thread is raised by
+    the next write, flush or close.
+    """
+    def __init__(self, maxPending=16):
+        self.maxPending = maxPending
+        self.pending = {}
+        self.order = []
+        self.busy = False
+        self.error = None
+        self.closed = False
+        self.condition = threading.Condition()
+        self.written = 0
+        self.coalesced = 0
+        self.blocked = 0
+        _openWriters.add(self)
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # Call func(*args) in the background. Whatever args refer to must not change afterwards
+    def write(self, key, func, *args):
+        with self.condition:
+            self.check()
+            if key in self.pending:
+                self.pending[key] = (func, args)
+                self.coalesced += 1
+                return
+            if len(self.pending) >= self.maxPending:
+                self.blocked += 1
+                while len(self.pending) >= self.maxPending:
+                    self.condition.wait()
+                    self.check()
+            self.pending[key] = (func, args)
+            self.order.append(key)
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.order and not self.closed:
+                    self.condition.wait()
+                if not self.order:
+                    return
+                key = self.order.pop(0)
+                func, args = self.pending.pop(key)
+                self.busy = True
+                self.condition.notify_all()
+            try:
+                func(*args)
+            except Exception:
+                self.error = traceback.format_exc()
+            with self.condition:
+                self.busy = False
+                self.written += 1
+                self.condition.notify_all()
+
+    def check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise Exception('Background write failed:\n' + error)
+
+    # Wait until everything handed over so far is written
+    def flush(self):
+        with self.condition:
+            while self.order or self.busy:
+                self.condition.wait()
+            self.check()
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        _openWriters.discard(self)
+
+@atexit.register
+def closeOpenWriters():
+    for writer in list(_openWriters):
+        writer.close()
+
+# State of a random.Random (or the random module) in a form JSON can hold, and back
+def randomState(rng):
+    version, internal, gauss = rng.getstate()
+    return [version, list(internal), gauss]
+
+def setRandomState(rng, state):
+    version, internal, gauss = state
+    rng.setstate((version, tuple(internal), gauss))
+
+# JSON turns int keys into strings; this turns them back
+def intKeys(d):
+    return dict((int(key), value) for key, value in d.items())
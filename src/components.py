@@ -1,5 +1,3 @@
-from game import *
-import display
 import catanGameBoard
 from util import *
 
@@ -168,7 +166,7 @@ class Monopoly:
                     player.numResources -= numResources
                     total += numResources
 
-        if not player.isAI:
+        if not self.player.isAI:
             print("You stole a total of " + str(total) + " " + resource + " from the other players")
 
 class YearOfPlenty:
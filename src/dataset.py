@@ -0,0 +1,247 @@
+import os
+import sys
+import glob
+import json
+import multiprocessing
+import numpy as np
+from log import Log, DictLog
+from registry import writeAtomic
+from rng import GameRandom, spawnSeeds, playerRandom
+
+'''
+Training data recorded from games, to fit evaluators offline instead of only learning online
+while playing. With a DatasetWriter passed as the engine's dataset argument, every decision an AI
+player makes is recorded as one row: the game, the player, the turn, the player's feature vector
+at the time, the move it chose, and (filled in when the game ends) how the game turned out.
+
+A dataset is a directory of shards. Rows are buffered in memory and written shardRows at a time
+as an .npz file with one array per column; each writer keeps its own index file listing its
+shards and the feature names of the columns of their feature matrices. Shards and indexes are
+only ever added or replaced whole, so any number of writers (one per worker process, say) can
+add to the same dataset, and a reader never sees a half written shard.
+
+    writer = DatasetWriter('data', name='worker0')
+    Engine(players, dataset=writer).main()
+    ...
+    writer.close()
+
+    for batch in DatasetReader('data').batches(4096):
+        X, y = batch['features'], batch['won']
+
+Feature names can differ between players and grow as new ones turn up; the reader lines every
+shard up on the union of all of them, with 0 for a feature a row doesn't have.
+
+Datasets can also be generated from the command line, in a pool of worker processes:
+
+    python dataset.py generate data WeightedAI 1000 4 [weightsFile]
+'''
+
+# Shard columns other than the features, and their types
+COLUMNS = [('game', np.uint64),       # the game's seed
+           ('player', np.int8),       # the player's seat
+           ('turn', np.int16),        # the engine's turn number
+           ('action', np.int16),      # ACTIONS bits of the chosen move, 0 for none
+           ('won', np.int8),          # 1 if the player won the game
+           ('score', np.int8),        # the player's final score
+           ('decided', np.int8),      # 1 if the game had a winner
+           ('gameTurns', np.int16)]   # the number of turns the game lasted
+
+# The pieces of a move, one bit each in the action column. A trade is any (give, get) pair
+ACTIONS = ['Settlement', 'City', 'Road', 'buyDevCard', 'playDevCard', 'trade']
+
+# The action bits of a move, a dict or list of ((piece, count), locations)
+def actionCode(move):
+    code = 0
+    actions = move.keys() if isinstance(move, dict) else [action for action, locs in move]
+    for piece, count in actions:
+        code |= 1 << ACTIONS.index('trade' if isinstance(piece, tuple) else piece)
+    return code
+
+def actionNames(code):
+    return [name for i, name in enumerate(ACTIONS) if code & (1 << i)]
+
+def indexPath(path, name):
+    return os.path.join(path, 'index-%s.json' % name)
+
+class DatasetWriter(object):
+    """
+    Records decisions into the dataset at path. name tells this writer's shards and index apart
+    from other writers', and defaults to the process id. A game's rows are held until the engine
+    reports its result; rows of games that never finish are dropped.
+    """
+    def __init__(self, path, name=None, shardRows=50000):
+        self.path = path
+        self.name = name if name is not None else str(os.getpid())
+        self.shardRows = shardRows
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        # Carry on from an earlier run of a writer of the same name
+        self.index = {'features': [], 'shards': []}
+        if os.path.exists(indexPath(path, self.name)):
+            self.index = Log(indexPath(path, self.name)).readDict()
+        self.columns = dict((feature, i) for i, feature in enumerate(self.index['features']))
+
+        self.games = {}
+        self.rows = []
+
+    # One decision of a game in progress
+    def decision(self, game, player, turn, features, action):
+        row = [0.0] * len(self.columns)
+        for feature, value in features.items():
+            if feature not in self.columns:
+                self.columns[feature] = len(self.index['features'])
+                self.index['features'].append(feature)
+                row.append(0.0)
+            row[self.columns[feature]] = float(value)
+        self.games.setdefault(game, []).append((player, turn, action, row))
+
+    # The game is over: its rows get their outcomes and join the buffer
+    def endGame(self, game, result):
+        winner = result['winner']
+        for player, turn, action, row in self.games.pop(game, []):
+            outcome = (int(winner == player), result['scores'][player], int(winner is not None), result['turns'])
+            self.rows.append(((game, player, turn, action) + outcome, row))
+        if len(self.rows) >= self.shardRows:
+            self.flush()
+
+    # Write the buffered rows as a new shard
+    def flush(self):
+        if not self.rows:
+            return
+        numFeatures = len(self.index['features'])
+        features = np.zeros((len(self.rows), numFeatures), dtype=np.float32)
+        for i, (values, row) in enumerate(self.rows):
+            features[i, :len(row)] = row
+        arrays = {'features': features}
+        for column, (name, dtype) in enumerate(COLUMNS):
+            arrays[name] = np.array([values[column] for values, row in self.rows], dtype=dtype)
+
+        fileName = 'shard-%s-%05d.npz' % (self.name, len(self.index['shards']))
+        tmpPath = os.path.join(self.path, fileName + '.tmp')
+        with open(tmpPath, 'wb') as f:
+            np.savez(f, **arrays)
+        os.rename(tmpPath, os.path.join(self.path, fileName))
+
+        self.index['shards'].append({'file': fileName, 'rows': len(self.rows), 'features': numFeatures})
+        writeAtomic(indexPath(self.path, self.name), json.dumps(self.index))
+        self.rows = []
+
+    def close(self):
+        self.flush()
+
+class DatasetReader(object):
+    """
+    Reads every writer's shards of the dataset at path. self.features is the union of their
+    feature names, the columns of the feature matrices it returns, and self.rows the number of
+    rows written so far.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.features = []
+        self.shards = []
+        columns = {}
+        for fileName in sorted(glob.glob(indexPath(path, '*'))):
+            index = Log(fileName).readDict()
+            for feature in index['features']:
+                if feature not in columns:
+                    columns[feature] = len(self.features)
+                    self.features.append(feature)
+            for shard in index['shards']:
+                shard['columns'] = [columns[feature] for feature in index['features'][:shard['features']]]
+                self.shards.append(shard)
+        self.rows = sum(shard['rows'] for shard in self.shards)
+
+    # One shard's columns, with its features lined up on self.features
+    def readShard(self, shard):
+        with np.load(os.path.join(self.path, shard['file'])) as data:
+            arrays = dict((name, data[name]) for name, dtype in COLUMNS)
+            features = np.zeros((shard['rows'], len(self.features)), dtype=np.float32)
+            features[:, shard['columns']] = data['features']
+        arrays['features'] = features
+        return arrays
+
+    # Stream the dataset in batches of batchSize rows (the last one may be smaller), one shard in
+    # memory at a time. With shuffle, shards are read in random order and rows are shuffled
+    # within each shard, from a generator seeded with seed
+    def batches(self, batchSize, shuffle=False, seed=None):
+        rng = np.random.RandomState(seed)
+        order = range(len(self.shards))
+        if shuffle:
+            rng.shuffle(order)
+
+        pending = []
+        for i in order:
+            arrays = self.readShard(self.shards[i])
+            if shuffle:
+                permutation = rng.permutation(self.shards[i]['rows'])
+                arrays = dict((name, values[permutation]) for name, values in arrays.items())
+            pending.append(arrays)
+            while sum(len(part['turn']) for part in pending) >= batchSize:
+                batch, pending = takeRows(pending, batchSize)
+                yield batch
+        if pending:
+            yield takeRows(pending, sum(len(part['turn']) for part in pending))[0]
+
+    # The whole dataset in memory
+    def load(self):
+        return self.batches(self.rows).next() if self.rows else None
+
+# The first count rows of a list of column dicts, and the rest
+def takeRows(parts, count):
+    merged = dict((name, np.concatenate([part[name] for part in parts])) for name in parts[0])
+    batch = dict((name, values[:count]) for name, values in merged.items())
+    rest = dict((name, values[count:]) for name, values in merged.items())
+    return batch, [rest] if len(rest['turn']) else []
+
+#############################################################################
+#############################   Generation   ################################
+#############################################################################
+
+# Worker entry point: play the given games with playerClass in every seat, recording them as
+# writer name. Returns the number of rows written
+def generateGames(path, name, playerClass, weights, seeds, engineArgs):
+    from engine import Engine
+    from train import createPlayer
+    writer = DatasetWriter(path, name)
+    for seed in seeds:
+        players = [createPlayer(playerClass, seat, seat, DictLog(weights[seat]), rng=playerRandom(seed, seat))
+                   for seat in range(4)]
+        Engine(players, seed=seed, dataset=writer, **(engineArgs or {})).main()
+    writer.close()
+    return sum(shard['rows'] for shard in writer.index['shards'])
+
+def generateArgs(args):
+    return generateGames(*args)
+
+# Record numGames games into the dataset at path, in a pool of processes. weights is one dict
+# per seat. Games come from seed, so the same seed generates the same data
+def generate(path, playerClass, weights, numGames, processes=1, seed=None, engineArgs=None):
+    seed = seed if seed is not None else GameRandom().seed
+    seeds = spawnSeeds(seed, numGames)
+    jobs = [(path, '%d-%d' % (seed % 100000, i), playerClass, weights, seeds[i::processes], engineArgs)
+            for i in range(processes)]
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            pool.map(generateArgs, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        map(generateArgs, jobs)
+    return DatasetReader(path).rows
+
+def main():
+    command = sys.argv[1]
+    if command == 'generate':
+        path, playerClass, numGames = sys.argv[2], sys.argv[3], int(sys.argv[4])
+        processes = int(sys.argv[5]) if len(sys.argv) > 5 else 1
+        weights = Log(sys.argv[6]).readDict() if len(sys.argv) > 6 else {'DELETE ME': -1}
+        rows = generate(path, playerClass, dict((seat, weights) for seat in range(4)), numGames, processes)
+        print('%d rows in %s' % (rows, path))
+    else:
+        print('Unknown command ' + command)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+import util
+from collections import defaultdict
+
+'''
+Exact endgame solver. Once a player is close to 10 points, the evaluators often miss a win
+that is available by combining cities, settlements, longest road, a victory point card or the
+largest army. EndgameSolver searches every sequence of purchases, bank trades and a single dev
+card play open to the player this turn and returns one that reaches 10 points, or None if there
+is none within the step budget. nextTurnWinChance runs the same search for every producing roll
+of the player's next turn, assuming they keep their hand and the board doesn't change in between,
+and gives the chance that the roll leaves a forced win and the roll that does so most often.
+
+The search only uses moves whose outcome is known, so buying dev cards is never part of a plan.
+Everything else follows the rules as Game and Player implement them (costs, exchange rates,
+ports changing rates mid-turn, longest road via util.longestRoadLength, one dev card per turn).
+
+Plans are lists of (action, locations) steps in the format of a pickMove move, with trades as
+((give, get), rate) and dev card plays as ('playDevCard', 1) with the card type as the location.
+Steps have to be carried out in order.
+'''
+
+RESOURCES = ['Ore', 'Brick', 'Wood', 'Grain', 'Wool']
+
+SETTLEMENT_COST = {'Brick': 1, 'Wood': 1, 'Wool': 1, 'Grain': 1}
+CITY_COST = {'Ore': 3, 'Grain': 2}
+ROAD_COST = {'Brick': 1, 'Wood': 1}
+
+WINNING_SCORE = 10
+
+# Rolls that produce resources, for looking one turn ahead
+PRODUCING_ROLLS = [2, 3, 4, 5, 6, 8, 9, 10, 11, 12]
+
+class EndgamePosition(object):
+    """
+    The part of the game a plan can change, copied out of the real game so the search can try
+    steps without touching it. apply returns a new position, nothing is modified in place.
+    """
+    def __init__(self, game=None, player=None):
+        if game is None:
+            return
+        self.game = game
+        self.player = player
+        self.resources = dict((resource, player.resources[resource]) for resource in RESOURCES)
+        self.rates = dict(player.exchangeRates)
+        self.score = player.score
+        self.roads = list(player.roads)
+        self.builtRoads = set(frozenset(road) for road in game.roads)
+        self.newRoads = []
+        self.settlements = [node for node in player.occupyingNodes if node.occupyingPiece.pieceType == 'Settlement']
+        self.newNodes = []
+        self.holdsLongestRoad = player.holdsLongestRoad
+        self.longestRoad = game.longestRoad
+        self.numKnights = player.numKnights
+        self.devPlayed = False
+
+    def copy(self):
+        pos = EndgamePosition()
+        pos.__dict__.update(self.__dict__)
+        pos.resources = dict(self.resources)
+        pos.rates = dict(self.rates)
+        pos.settlements = list(self.settlements)
+        pos.newNodes = list(self.newNodes)
+        return pos
+
+    def key(self):
+        return (tuple(self.resources[resource] for resource in RESOURCES),
+                tuple(sorted(self.rates.items())),
+                self.score,
+                frozenset(frozenset(road) for road in self.roads),
+                frozenset(self.newNodes),
+                frozenset(self.settlements),
+                self.devPlayed)
+
+    def numCards(self):
+        return sum(self.resources.values())
+
+    def canAfford(self, cost):
+        for resource, count in cost.items():
+            if self.resources[resource] < count:
+                return False
+        return True
+
+    def isOccupied(self, node):
+        return node.isOccupied or node in self.newNodes
+
+    def isMine(self, node):
+        if node in self.newNodes:
+            return True
+        return node.isOccupied and node.occupyingPiece.player.turn_num == self.player.turn_num
+
+    # Same rules as Game.isValidSettlement, including our own settlements placed during the plan
+    def isValidSettlement(self, node):
+        if self.isOccupied(node):
+            return False
+        for neighbour in node.neighbours:
+            if self.isOccupied(neighbour):
+                return False
+        for node1, node2 in self.roads:
+            if node1 == node or node2 == node:
+                return True
+        return False
+
+    # Same rules as Game.getRoadLocations
+    def roadLocations(self):
+        locations = []
+        for road in self.roads:
+            for node in road:
+                for neighbour in node.neighbours:
+                    if frozenset((node, neighbour)) not in self.builtRoads and \
+                       (not self.isOccupied(neighbour) or self.isMine(neighbour)):
+                        locations.append((node, neighbour))
+        for node in self.player.occupyingNodes + self.newNodes:
+            for neighbour in node.neighbours:
+                if frozenset((node, neighbour)) not in self.builtRoads:
+                    locations.append((node, neighbour))
+
+        unique, seen = [], set()
+        for road in locations:
+            if frozenset(road) not in seen:
+                seen.add(frozenset(road))
+                unique.append(road)
+        return unique
+
+    # Knight.play counts the knight and awards the largest army on these terms
+    def knightGivesArmy(self):
+        numKnights = self.numKnights + 1
+        return numKnights >= 3 and numKnights > self.game.currMaxKnights
+
+    # Upper bound on the score this position can still reach. Every settlement or city costs at
+    # least four cards, longest road and a dev card add at most two points each
+    def maxScore(self):
+        bound = self.score + self.numCards() / 4
+        if not self.holdsLongestRoad and self.numCards() >= 2:
+            bound += 2
+        if not self.devPlayed:
+            bound += 2
+        return bound
+
+    # All steps open from this position, the ones that score first
+    def steps(self):
+        steps = []
+        if not self.devPlayed:
+            devCards = self.player.devCards
+            if devCards.get('Victory Point'):
+                steps.append((('playDevCard', 1), 'Victory Point'))
+            if devCards.get('Knight') and self.knightGivesArmy():
+                steps.append((('playDevCard', 1), 'Knight'))
+
+        if self.canAfford(CITY_COST):
+            for node in self.settlements:
+                steps.append((('City', 1), [node]))
+
+        if self.canAfford(SETTLEMENT_COST):
+            seen = set()
+            for road in self.roads:
+                for node in road:
+                    if node not in seen and self.isValidSettlement(node):
+                        steps.append((('Settlement', 1), [node]))
+                    seen.add(node)
+
+        if self.canAfford(ROAD_COST):
+            for road in self.roadLocations():
+                steps.append((('Road', 1), [road]))
+
+        for resource in RESOURCES:
+            rate = self.rates[resource]
+            if self.resources[resource] >= rate:
+                for newResource in RESOURCES:
+                    if newResource != resource:
+                        steps.append((((resource, newResource), rate), None))
+
+        return steps
+
+    def pay(self, cost):
+        for resource, count in cost.items():
+            self.resources[resource] -= count
+
+    def apply(self, step):
+        pos = self.copy()
+        (piece, count), locs = step
+
+        if isinstance(piece, tuple):
+            oldResource, newResource = piece
+            pos.resources[oldResource] -= count
+            pos.resources[newResource] += 1
+
+        elif piece == 'playDevCard':
+            pos.devPlayed = True
+            if locs == 'Victory Point':
+                pos.score += 1
+            elif locs == 'Knight':
+                pos.numKnights += 1
+                pos.score += 2
+
+        elif piece == 'City':
+            node = locs[0]
+            pos.pay(CITY_COST)
+            pos.settlements.remove(node)
+            pos.score += 1
+
+        elif piece == 'Settlement':
+            node = locs[0]
+            pos.pay(SETTLEMENT_COST)
+            pos.newNodes.append(node)
+            pos.settlements.append(node)
+            pos.score += 1
+            # Same port handling as Player.place_settlement
+            if node.port == 'Any':
+                for resource in pos.rates:
+                    pos.rates[resource] = 3
+                pos.rates['Desert'] = float('inf')
+            elif node.port:
+                pos.rates[node.port] = 2
+
+        elif piece == 'Road':
+            road = locs[0]
+            pos.pay(ROAD_COST)
+            pos.roads = self.roads + [road]
+            pos.newRoads = self.newRoads + [road]
+            pos.builtRoads = self.builtRoads | set([frozenset(road)])
+            # A road can't be longer than the number of roads, so only work out the length when
+            # the award is still up for grabs
+            if not pos.holdsLongestRoad and len(pos.roads) >= 5 and len(pos.roads) > pos.longestRoad:
+                length = pos.longestRoadLength()
+                # Same award rule as Player.place_road
+                if length > pos.longestRoad:
+                    pos.longestRoad = length
+                    if length >= 5:
+                        pos.holdsLongestRoad = True
+                        pos.score += 2
+
+        return pos
+
+    # Length of the player's longest road with the roads built during the plan, worked out as
+    # Player.updateLongestRoad would. Repeated entries in the player's touching lists are dropped
+    # first, they don't change the result but make the search much slower
+    def longestRoadLength(self):
+        touching = defaultdict(list)
+        for node, nodes in self.player.touching.items():
+            for other in nodes:
+                if other not in touching[node]:
+                    touching[node].append(other)
+
+        roads = list(self.player.roads)
+        for road in self.newRoads:
+            roads.append(road)
+            roadNodes = util.addTouchingRoad(touching, roads, road)
+        return util.longestRoadLength(touching, roadNodes)
+
+
+class EndgameSolver(object):
+    """
+    Bounded exact search for a win this turn. maxSteps limits the length of a plan, counting
+    trades and the dev card play as steps. A big hand can make the search explode, so it also
+    gives up (and reports no plan) after maxNodes positions. Solutions, and positions the search
+    showed have none, are cached by hand and position, so asking again about the same position is
+    free; a search that gave up is not cached.
+    """
+    def __init__(self, maxSteps=8, maxCached=10000, maxNodes=20000):
+        self.maxSteps = maxSteps
+        self.maxCached = maxCached
+        self.maxNodes = maxNodes
+        self.cache = {}
+        self.nodesSearched = 0
+
+    def positionKey(self, game, player):
+        devCards = player.devCards
+        return (player.getOppStateKey(player, game), player.score, player.holdsLongestRoad,
+                game.longestRoad, player.numKnights, game.currMaxKnights,
+                len(devCards.get('Victory Point') or []), len(devCards.get('Knight') or []))
+
+    # Returns a list of steps that wins this turn, or None
+    def solve(self, game, player):
+        key = self.positionKey(game, player)
+        if key in self.cache:
+            return self.cache[key]
+
+        pos = EndgamePosition(game, player)
+        self.nodesLeft = self.maxNodes
+        plan = self.search(pos, self.maxSteps, {})
+        if plan is None and self.nodesLeft <= 0:
+            return None
+        if len(self.cache) >= self.maxCached:
+            self.cache.clear()
+        self.cache[key] = plan
+        return plan
+
+    def search(self, pos, stepsLeft, failed):
+        self.nodesSearched += 1
+        self.nodesLeft -= 1
+        if pos.score >= WINNING_SCORE:
+            return []
+        if stepsLeft <= 0 or self.nodesLeft <= 0 or pos.maxScore() < WINNING_SCORE:
+            return None
+
+        key = pos.key()
+        if failed.get(key, -1) >= stepsLeft:
+            return None
+
+        for step in pos.steps():
+            plan = self.search(pos.apply(step), stepsLeft - 1, failed)
+            if plan is not None:
+                return [step] + plan
+
+        failed[key] = stepsLeft
+        return None
+
+    # Probability that the player has a forced win at the start of their next turn if they keep
+    # their hand, assuming the board doesn't change in between, and the most likely roll that
+    # gives one (None if no roll does)
+    def nextTurnWinChance(self, game, player):
+        chance, bestRoll = 0.0, None
+        for roll in PRODUCING_ROLLS:
+            gained = [(resource, num) for owner, resource, num in game.getRollProduction(roll) if owner is player]
+            for resource, num in gained:
+                player.resources[resource] += num
+                player.numResources += num
+
+            if self.solve(game, player) is not None:
+                chance += util.rollProb(roll)
+                if bestRoll is None or util.rollProb(roll) > util.rollProb(bestRoll):
+                    bestRoll = roll
+
+            for resource, num in gained:
+                player.resources[resource] -= num
+                player.numResources -= num
+
+        return chance, bestRoll
@@ -0,0 +1,543 @@
+import time
+from game import Game
+from catanGameBoard import Board, Tile
+from util import rollDice
+from ponder import Ponderer
+from endgame import EndgameSolver
+from rng import GameRandom
+from stats import Stats
+from events import EventRecorder
+from dataset import actionCode
+
+# Number of rounds after which a game is stopped without a winner
+MAX_ROUNDS = 150
+
+class Engine(object):
+
+    #############################################################################
+    ############################  Initialization ################################
+    #############################################################################
+    """
+    Headless game engine
+
+    Owns board generation, the setup turns, the turn loop and end-of-game detection. The
+    engine never prints and never touches pygame: anything visual goes through ui, an
+    optional object with the Display interface (placeSettlement, placeCity, placeRoad,
+    placeRobber, update) that Play plugs in. AI-only games (training, testing, rollouts)
+    should use the Engine directly.
+
+    Human players need input, so their turns are left to Play, which subclasses the Engine.
+
+    All randomness (board, dice, dev card deck and the players' own choices) comes from the
+    game's GameRandom, so a game played with the same seed and players is the same game.
+
+    Time spent per phase and counts of the expensive operations are kept per player (see
+    stats.py) and come back with the result.
+
+    Besides somebody reaching 10 points, a game ends when it runs past maxRounds rounds or
+    maxSeconds seconds, or when nobody has built, bought or scored anything for stallRounds
+    rounds. The result records which of these happened. A game that ends without a winner can
+    be adjudicated: 'score' gives it to the single highest score, and any callable taking the
+    engine and returning a turn_num (or None) can be used instead, rollout.RolloutAdjudicator
+    for example.
+
+    With record set, the game is recorded as a compact event stream (see events.py) that comes
+    back with the result, and replay.Replayer can rebuild any position of the game from it.
+    Only AI turns of a game the engine starts itself can be recorded.
+
+    With dataset set to a dataset.DatasetWriter, every AI decision is written to it as a
+    training example: the player's features before the move, the move, and the game's outcome.
+
+    With endgame set, every AI player gets an endgame.EndgameSolver and plays out a forced win
+    whenever one exists this turn; ponder likewise gives them a ponder.Ponderer.
+    """
+    # If game is given, play continues from that game (and its board) instead of a new one. It
+    # keeps its own random streams unless a seed is given
+    def __init__(self, players, ui=None, ponder=False, game=None, maxRounds=MAX_ROUNDS, seed=None,
+                 maxSeconds=None, stallRounds=None, adjudicate=None, record=False, dataset=None,
+                 endgame=False):
+        self.turnNum = 0
+        self.num_players = len(players)
+        self.players = players
+        self.ui = ui
+        self.maxRounds = maxRounds
+        self.maxSeconds = maxSeconds
+        self.stallRounds = stallRounds
+        self.adjudicate = adjudicate
+        self.startTime = None
+        self.lastProgress = None
+        self.lastProgressRound = 0
+
+        if game is None:
+            self.rng = GameRandom(seed)
+            self.board = self.generate_board()
+            # Initialize the game
+            init_robber_tile = (2, 5)
+            self.game = Game(self.players, self.board, init_robber_tile, self.rng)
+        else:
+            if seed is not None:
+                game.rng = GameRandom(seed)
+            self.rng = game.rng
+            self.board = game.board
+            self.game = game
+
+        for player in self.players:
+            player.rng = self.rng.agent(player.turn_num)
+
+        self.agentStats = dict((player.turn_num, Stats()) for player in self.players)
+
+        self.dataset = dataset
+
+        # Pondering keeps its copies of the game up to date from the event stream, so it is
+        # recorded for that too. unrecorded is set by whatever the stream misses (human turns)
+        self.recording = record
+        self.recorder = None
+        self.unrecorded = False
+        if record:
+            assert game is None, "Only new games can be recorded"
+        if record or ponder:
+            self.recorder = EventRecorder(self.players, self.board, self.rng.seed)
+
+        if ponder:
+            for player in self.players:
+                if player.isAI:
+                    player.ponderer = Ponderer(player)
+
+        if endgame:
+            for player in self.players:
+                if player.isAI:
+                    player.endgameSolver = EndgameSolver()
+
+    # Build a board with random values and resources for each tile
+    def generate_board(self):
+        board = Board()
+
+        # Simulate all possible die rolls and tile types
+        tile_types = [['Ore'] * 3,
+                      ['Brick'] * 3,
+                      ['Wood'] * 4,
+                      ['Grain'] * 4,
+                      ['Wool'] * 4]
+
+        self.setTileIds()
+
+        # Select random values and resource for each tile and create it
+        tile_pool = [tile for tileType in tile_types for tile in tileType]
+        tile_vals = [2,3,3,4,4,5,5,6,6,8,8,9,9,10,10,11,11,12]
+        self.rng.board.shuffle(tile_vals)
+        for i in range(19):
+            # Grab a random value and assign it to the tile
+            if i != 9:
+                value = tile_vals.pop()
+                rand_tile = self.rng.board.randint(0, len(tile_pool) - 1)
+                resource = tile_pool.pop(rand_tile)
+
+                # Create the tile to store its information
+                tile = Tile(resource, value, False, self.tileIds[i])
+                board.tiles.append(tile)
+            else:
+                tile = Tile('Desert', 0, True, self.tileIds[i])
+                board.tiles.append(tile)
+
+            board.setTouchingTiles(tile)
+
+        return board
+
+    # Set the tile ids
+    # Each tile is defined by the coordinates of its peak node (0, 1), (0, 3), etc
+    # tileIds contains the coordinates of each tile 0-18 in the above specified form
+    def setTileIds(self):
+        self.tileIds = []
+        for i in range(1, 7, 2): self.tileIds.append((0, i))
+        for i in range(1, 9, 2): self.tileIds.append((1, i))
+        for i in range(1, 11, 2): self.tileIds.append((2, i))
+        for i in range(2, 9, 2): self.tileIds.append((3, i))
+        for i in range(2, 7, 2): self.tileIds.append((4, i))
+        assert len(self.tileIds) == 19
+
+    # Forward a call to the ui, if there is one
+    def show(self, method, *args):
+        if self.ui is not None:
+            getattr(self.ui, method)(*args)
+
+    # Forward a call to the event recorder, if the game is being recorded
+    def record(self, method, *args):
+        if self.recorder is not None:
+            getattr(self.recorder, method)(*args)
+
+    # Add a decision of player to the dataset, if there is one. features are the player's features
+    # from before the move
+    def collect(self, player, features, move):
+        if self.dataset is not None and features is not None:
+            self.dataset.decision(self.rng.seed, player.turn_num, self.turnNum, features, actionCode(move or {}))
+
+    # Hands and robber to record what a roll or a card changed, if the game is being recorded
+    def snapshot(self):
+        if self.recorder is not None:
+            return self.recorder.snapshot(self.game)
+
+#############################################################################
+#################################  Main  ####################################
+#############################################################################
+
+    # Play a full game: setup turns, then turns until somebody wins. Returns the result
+    def main(self):
+        self.startTime = time.time()
+        self.setup()
+        return self.run()
+
+    # Initialize player resources and run the first two turns
+    def setup(self):
+        for player in self.players:
+            player.resources['Ore'] = 0
+            player.resources['Brick'] = 0
+            player.resources['Wood'] = 0
+            player.resources['Grain'] = 0
+            player.resources['Wool'] = 0
+
+        self.first_two_turns()
+
+    # Play turns until the game is over
+    def run(self):
+        if self.startTime is None:
+            self.startTime = time.time()
+        while not self.isOver():
+            self.play_turn()
+        return self.endGame()
+
+    def isOver(self):
+        return self.endReason() is not None
+
+    # Why the game is over: 'win', 'maxRounds', 'stall' or 'timeLimit', or None if it isn't
+    def endReason(self):
+        if self.game.currMaxScore >= 10:
+            return 'win'
+        if self.turnNum / self.num_players > self.maxRounds:
+            return 'maxRounds'
+        if self.stallRounds is not None and self.turnNum / self.num_players - self.lastProgressRound >= self.stallRounds:
+            return 'stall'
+        if self.maxSeconds is not None and self.startTime is not None and time.time() - self.startTime > self.maxSeconds:
+            return 'timeLimit'
+        return None
+
+    # Everything a turn can change apart from the cards in hand. If this stays the same for a
+    # whole round, nobody did anything with their cards
+    def progressKey(self):
+        return (len(self.game.devCards),
+                tuple((player.score, len(player.roads), len(player.cities_and_settlements),
+                       player.numKnights, sum(len(cards) for cards in player.devCards.values() if cards))
+                      for player in self.players))
+
+    # Called at the end of every round for stall detection
+    def checkProgress(self):
+        key = self.progressKey()
+        if key != self.lastProgress:
+            self.lastProgress = key
+            self.lastProgressRound = self.turnNum / self.num_players
+
+    def currentPlayer(self):
+        return self.players[self.turnNum % self.num_players]
+
+    # Play a single turn for the current player
+    def play_turn(self):
+        curr_player = self.currentPlayer()
+        self.beginTurn(curr_player)
+
+        # Play the given turn
+        if curr_player.isAI:
+            self.run_AI_turn(curr_player)
+        else:
+            self.run_human_turn(curr_player)
+            self.unrecorded = True
+
+        self.finishTurn(curr_player)
+
+    # Start curr_player's turn: pondering, the roll and its resources (or the robber)
+    def beginTurn(self, curr_player):
+        stats = self.useStats(curr_player)
+        stats.count('turns')
+
+        # Everyone else ponders from the position at the start of this turn
+        start = time.time()
+        self.start_pondering(curr_player)
+        stats.addTime('pondering', start)
+
+        self.record('turn', curr_player)
+        start = time.time()
+        roll = rollDice(self.rng.dice)
+        self.record('roll', roll)
+
+        # Distribute resources given the last roll
+        before = self.snapshot()
+        self.game.distributeResources(roll, self.ui, curr_player)
+        if roll == 7:
+            self.record('recordSeven', self.game, before)
+        stats.addTime('robber' if roll == 7 else 'dice', start)
+
+    # End curr_player's turn and move on to the next player
+    def finishTurn(self, curr_player):
+        # Update curMaxScore
+        if curr_player.score > self.game.currMaxScore:
+            self.game.currMaxScore = curr_player.score
+
+        self.turnNum += 1
+        if self.turnNum % self.num_players == 0:
+            self.checkProgress()
+
+    def run_human_turn(self, curr_player):
+        raise Exception("The headless engine can't run human turns, use Play instead")
+
+    # Charge everything recorded from now on to player
+    def useStats(self, player):
+        self.game.stats = self.agentStats[player.turn_num]
+        return self.game.stats
+
+#############################################################################
+############################  First Two Turns  ##############################
+#############################################################################
+
+    # Main function for first two turns logic
+    def first_two_turns(self):
+        # Players place their first settlement
+        for i in range(self.num_players):
+            self.initial_placements(self.players[i])
+
+        # Players place second settlement from last to first
+        for i in range(self.num_players - 1, -1, -1):
+            self.initial_placements(self.players[i])
+
+    # Handle placements logic during the first 2 turns
+    def initial_placements(self, player):
+        stats = self.useStats(player)
+        start = time.time()
+        if player.isAI:
+            # Run first turn logic AI
+            self.AI_first_turn(player)
+        else:
+            # Run first turn logic Human
+            possible_settlements = self.game.getSettlementLocations(player, True)
+            self.Human_first_turn(player, possible_settlements)
+            self.unrecorded = True
+        stats.addTime('setup', start)
+
+    # Define logic for an AI's first turn
+    def AI_first_turn(self, player):
+        # Place single settlement
+        settlementLoc = player.pick_settlement_position(self.game)
+        player.place_settlement(settlementLoc, self.game, True)
+        self.record('settlement', player, settlementLoc, True)
+        self.show('placeSettlement', settlementLoc, player)
+
+        # Place single road
+        roadLoc = player.pick_road_position(settlementLoc, self.game)
+        player.place_road(roadLoc, self.game, True)
+        self.record('road', player, roadLoc, True)
+        self.show('placeRoad', roadLoc[0], roadLoc[1], player)
+
+    def Human_first_turn(self, player, possible_settlements):
+        raise Exception("The headless engine can't run human turns, use Play instead")
+
+#############################################################################
+########################  Functions for AI turns  ###########################
+#############################################################################
+    """
+    This will take an AI player and allow them to pick among all possible moves for a given gamestate
+    """
+    def run_AI_turn(self, player):
+        stats = self.game.stats
+
+        # If the endgame solver finds a forced win this turn, play it out step by step. An empty
+        # plan keeps the hand for a forced win next turn
+        start = time.time()
+        features = player.feature_extractor(self.game) if self.dataset is not None else None
+        solver = player.endgameSolver
+        nodes = solver.nodesSearched if solver is not None else 0
+        plan = player.pickEndgamePlan(self.game)
+        if solver is not None:
+            stats.count('endgameNodes', solver.nodesSearched - nodes)
+        stats.addTime('endgame', start)
+        if plan is not None:
+            self.collect(player, features, plan)
+            start = time.time()
+            for action, locs in plan:
+                self.apply_AI_action(player, action, locs)
+            self.game.updateDevCards(player)
+            self.record('ready', player)
+            stats.addTime('apply', start)
+            return
+
+        #Pick and play a devCard. Often won't do anything if no available cards
+        start = time.time()
+        devCard = player.pickDevCard()
+
+        if devCard: self.play_devcard(devCard, player)
+        stats.addTime('devCards', start)
+
+        # Get move from AI player
+        start = time.time()
+        move = player.pickMove(self.game)
+        stats.addTime('search', start)
+        self.collect(player, features, move)
+
+        if not move:
+            return
+
+        # Act on move by placing pieces and updating graphics
+        start = time.time()
+        for action, locs in move.items():
+            self.apply_AI_action(player, action, locs)
+
+        self.game.updateDevCards(player)
+        self.record('ready', player)
+        stats.addTime('apply', start)
+
+    # Carry out one (action, locations) entry of an AI move
+    def apply_AI_action(self, player, action, locs):
+        piece, count = action
+
+        #Exchange resources
+        if isinstance(piece, tuple):
+            oldResource, newResource = piece
+            player.resources[oldResource] -= count
+            player.numResources -= count
+            player.resources[newResource] += 1
+            player.numResources += 1
+            assert player.resources[oldResource] >= 0
+            self.record('trade', player, oldResource, newResource, count)
+        #Buying DevCard
+        elif piece == 'buyDevCard':
+            deckSize = len(self.game.devCards)
+            card = self.game.devCards[-1] if deckSize else None
+            self.game.buyDevCard(player)
+            if len(self.game.devCards) < deckSize:
+                self.record('buy', player, card)
+        #Playing a DevCard, the location is the type of card
+        elif piece == 'playDevCard':
+            self.play_devcard(locs, player)
+
+        #Place piece
+        else:
+            for loc in locs:
+                if piece == 'Settlement':
+                    player.place_settlement(loc, self.game)
+                    self.record('settlement', player, loc, False)
+                    self.show('placeSettlement', loc, player)
+                elif piece == 'City':
+                    player.place_city(loc, self.game)
+                    self.record('city', player, loc)
+                    self.show('placeCity', loc, player)
+                elif piece == 'Road':
+                    player.place_road(loc, self.game)
+                    self.record('road', player, loc, False)
+                    self.show('placeRoad', loc[0], loc[1], player)
+
+    # Place a road for free (Road Building)
+    def buy_and_place_road(self, curr_player, devCard = False):
+        if self.game.canBuyRoad(curr_player) or devCard:
+            possiblePlacements = self.game.getRoadLocations(curr_player)
+            if len(possiblePlacements) == 0:
+                return
+            roadLoc = curr_player.pick_road_devcard_ai(possiblePlacements)
+            if not roadLoc:
+                return
+            curr_player.place_road(roadLoc, self.game, True)
+            self.record('road', curr_player, roadLoc, True)
+            self.show('placeRoad', roadLoc[0], roadLoc[1], curr_player)
+
+#############################################################################
+###########################   Play Devcard   ################################
+#############################################################################
+
+    # Initiate the logic that plays a given devcard. Returns False if the player doesn't
+    # have one to play
+    def play_devcard(self, type, currPlayer):
+        #Make sure they have some of this devCard
+        if not (type in currPlayer.devCards and currPlayer.devCards[type]):
+            return False
+
+        card = currPlayer.devCards[type].pop(0)
+        self.record('devCard', currPlayer, type)
+        before = self.snapshot()
+        if type == 'Knight':
+            card.play(self.ui, self.game)
+            self.record('recordKnight', self.game, currPlayer, before)
+        elif type == 'Road Building':
+            currPlayer.devCardsPlayed['Road Building'] += 1
+            for i in range(2):
+                self.buy_and_place_road(currPlayer, True)
+        else:
+            card.play()
+            if type != 'Victory Point':
+                self.record('recordChoices', currPlayer, type, before)
+        return True
+
+#############################################################################
+###########################   End Game  #####################################
+#############################################################################
+
+    # Ends the game and returns the result: the winner's turn_num (None if nobody won and the
+    # game wasn't adjudicated), why the game ended, whether the winner was adjudicated, the number
+    # of turns played, everybody's score, the seed to replay it with, and the timings and counters
+    # for the whole game and for each player, plus the event stream if the game was recorded
+    def endGame(self):
+        self.stop_pondering()
+
+        winner = None
+        for player in self.players:
+            if player.score >= 10:
+                winner = player.turn_num
+
+        adjudicated = winner is None and self.adjudicate is not None
+        if adjudicated:
+            winner = self.adjudicateWinner()
+
+        result = {'winner': winner,
+                  'endReason': self.endReason() or 'stopped',
+                  'adjudicated': adjudicated,
+                  'turns': self.turnNum,
+                  'scores': dict((player.turn_num, player.score) for player in self.players),
+                  'seed': self.rng.seed,
+                  'stats': self.statsReport()}
+        if self.recording:
+            result['events'] = self.recorder.stream
+        if self.dataset is not None:
+            self.dataset.endGame(self.rng.seed, result)
+        return result
+
+    def adjudicateWinner(self):
+        if self.adjudicate == 'score':
+            best = max(player.score for player in self.players)
+            leaders = [player.turn_num for player in self.players if player.score == best]
+            return leaders[0] if len(leaders) == 1 else None
+        return self.adjudicate(self)
+
+    def statsReport(self):
+        total = Stats()
+        for stats in self.agentStats.values():
+            total.merge(stats)
+        return {'game': total.asDict(),
+                'agents': dict((turn_num, stats.asDict()) for turn_num, stats in self.agentStats.items())}
+
+#############################################################################
+###########################   Pondering  ####################################
+#############################################################################
+
+    # Bring every pondering player except the one about to move up to date and have them ponder
+    # from here. The one about to move stops pondering. After something the event stream missed,
+    # every ponderer starts over from a new copy of the game
+    def start_pondering(self, curr_player):
+        for player in self.players:
+            if getattr(player, 'ponderer', None) is None:
+                continue
+            if self.unrecorded:
+                player.ponderer.stop()
+            if player is curr_player:
+                player.ponderer.pause()
+            else:
+                player.ponderer.update(self.game, self.recorder.stream)
+        self.unrecorded = False
+
+    def stop_pondering(self):
+        for player in self.players:
+            if getattr(player, 'ponderer', None) is not None:
+                player.ponderer.stop()
@@ -0,0 +1,440 @@
+import time
+import traceback
+import multiprocessing
+import numpy as np
+import players as playerClasses
+from engine import Engine
+from players import AiPlayer
+from catanGameBoard import Board
+from log import DictLog
+from rng import GameRandom, deriveSeed, spawnSeeds, playerRandom
+
+'''
+Reinforcement learning environments. A CatanEnv is one game seen from one seat, the learner:
+the other seats are played by AI opponents, and the learner makes its setup placements and then
+one action per step (build, buy, play a card, trade, or end the turn). A VecEnv steps many of
+them together and returns everything stacked into NumPy arrays, so a policy can score all the
+games in one batched call. Its games can live in this process or be sharded over worker
+processes.
+
+Actions are indices into a fixed list (see actionName):
+
+    END_TURN                  end the turn
+    SETTLEMENT + node         build a settlement, also the setup settlements
+    CITY + node               build a city
+    ROAD + edge               build a road, also the setup roads
+    BUY_DEV                   buy a dev card
+    PLAY_DEV + card           play a dev card (one per turn)
+    TRADE + give * 5 + get    trade with the bank at the player's exchange rate
+
+Every observation comes with a mask of the legal actions. Observations are float vectors of
+OBS_SIZE, with every player ordered relative to the learner (the learner first). The reward is 1
+when the learner wins, -1 when somebody else does and 0 otherwise, and only comes at the end of
+a game. The robber, discards and steals are left to the learner's AiPlayer defaults.
+'''
+
+RESOURCES = ['Ore', 'Brick', 'Wood', 'Grain', 'Wool']
+TILE_RESOURCES = RESOURCES + ['Desert']
+DEV_CARDS = ['Knight', 'Victory Point', 'Monopoly', 'Road Building', 'Year of Plenty']
+NUM_PLAYERS = 4
+
+# The node and edge numbering, taken from an empty board
+_layout = Board()
+NODES = [(node.row, node.col) for row in sorted(_layout.nodes) for node in _layout.nodes[row]]
+NODE_INDEX = dict((coords, i) for i, coords in enumerate(NODES))
+EDGES = sorted(set(tuple(sorted([(node.row, node.col), (neighbour.row, neighbour.col)]))
+                   for row in _layout.nodes.values() for node in row for neighbour in node.neighbours))
+EDGE_INDEX = dict((edge, i) for i, edge in enumerate(EDGES))
+del _layout
+
+END_TURN = 0
+SETTLEMENT = 1
+CITY = SETTLEMENT + len(NODES)
+ROAD = CITY + len(NODES)
+BUY_DEV = ROAD + len(EDGES)
+PLAY_DEV = BUY_DEV + 1
+TRADE = PLAY_DEV + len(DEV_CARDS)
+NUM_ACTIONS = TRADE + len(RESOURCES) ** 2
+
+# Observation layout
+TILE_FEATURES = len(TILE_RESOURCES) + 2
+NODE_FEATURES = 2 * NUM_PLAYERS
+PLAYER_FEATURES = 7
+OBS_SIZE = (19 * TILE_FEATURES + len(NODES) * NODE_FEATURES + len(EDGES) * NUM_PLAYERS
+            + 3 * len(RESOURCES) + 2 * len(DEV_CARDS) + NUM_PLAYERS * PLAYER_FEATURES + 6)
+
+# Phases of the learner's decisions
+SETUP_SETTLEMENT, SETUP_ROAD, MAIN = range(3)
+
+def edgeKey(roadLoc):
+    return tuple(sorted([(roadLoc[0].row, roadLoc[0].col), (roadLoc[1].row, roadLoc[1].col)]))
+
+# Readable description of an action index
+def actionName(action):
+    if action == END_TURN:
+        return 'end turn'
+    if action < CITY:
+        return 'settlement %s' % (NODES[action - SETTLEMENT],)
+    if action < ROAD:
+        return 'city %s' % (NODES[action - CITY],)
+    if action < BUY_DEV:
+        return 'road %s' % (EDGES[action - ROAD],)
+    if action == BUY_DEV:
+        return 'buy dev card'
+    if action < TRADE:
+        return 'play ' + DEV_CARDS[action - PLAY_DEV]
+    give, get = divmod(action - TRADE, len(RESOURCES))
+    return 'trade %s for %s' % (RESOURCES[give], RESOURCES[get])
+
+# An opponent of the given class from players.py. Classes that learn weights get a copy of
+# weights, or random weights drawn from rng if there are none
+def makeOpponent(opponentClass, turn_num, weights=None, rng=None):
+    log = DictLog(weights if weights is not None else {'DELETE ME': -1})
+    return getattr(playerClasses, opponentClass)(turn_num, str(turn_num), None, log, rng=rng)
+
+# Weights for opponents of a class that learns them, drawn at random from seed when none are
+# given. They are drawn once up front and shared by every game
+def opponentWeightsFor(opponentClass, weights=None, seed=None):
+    if weights is not None:
+        return weights
+    opponent = makeOpponent(opponentClass, 0, rng=playerRandom(seed, 0))
+    return dict(opponent.weights) if hasattr(opponent, 'weights') else None
+
+class CatanEnv(object):
+    """
+    A single game from the learner's seat. reset starts a new game and returns (observation,
+    mask); step plays one action and returns (observation, mask, reward, done, info), with the
+    Engine result and the learner's seat in info once the game is over.
+
+    Every game is seeded from seed and the episode number, so the same seed plays out the same
+    games for the same actions. The learner takes seat learnerSeat, or seats in turn if it is
+    None. A turn is ended for the learner after maxActions actions. Opponents all use
+    opponentWeights, or one set of random weights drawn here. engineArgs are passed on to the
+    Engine, e.g. {'maxRounds': 50}.
+    """
+    def __init__(self, seed=None, opponentClass='WeightedAI', opponentWeights=None, learnerSeat=None,
+                 maxActions=30, engineArgs=None):
+        self.seed = seed if seed is not None else GameRandom().seed
+        self.opponentClass = opponentClass
+        self.opponentWeights = opponentWeightsFor(opponentClass, opponentWeights, self.seed)
+        self.learnerSeat = learnerSeat
+        self.maxActions = maxActions
+        self.engineArgs = engineArgs or {}
+        self.episode = -1
+        self.engine = None
+
+    def reset(self):
+        self.episode += 1
+        self.seat = self.learnerSeat if self.learnerSeat is not None else self.episode % NUM_PLAYERS
+
+        players = []
+        for seat in range(NUM_PLAYERS):
+            if seat == self.seat:
+                self.learner = AiPlayer(seat, str(seat), None)
+                players.append(self.learner)
+            else:
+                players.append(makeOpponent(self.opponentClass, seat, self.opponentWeights))
+
+        self.engine = Engine(players, seed=deriveSeed(self.seed, 'episode%d' % self.episode), **self.engineArgs)
+        self.game = self.engine.game
+        self.engine.startTime = time.time()
+        for player in players:
+            for resource in RESOURCES:
+                player.resources[resource] = 0
+
+        self.setupOrder = range(NUM_PLAYERS) + range(NUM_PLAYERS - 1, -1, -1)
+        self.lastSettlement = None
+        self.devPlayed = False
+        self.actions = 0
+        self.advance()
+        return self.observe(), self.legalMask()
+
+    def step(self, action):
+        assert self.phase is not None, "The game is over, call reset"
+        assert self.legalMask()[action], "Illegal action: " + actionName(action)
+
+        self.applyAction(action)
+        self.actions += 1
+        if self.phase == MAIN and action != END_TURN and self.actions >= self.maxActions:
+            self.applyAction(END_TURN)
+
+        if self.learner.score > self.game.currMaxScore:
+            self.game.currMaxScore = self.learner.score
+        if self.phase == MAIN and self.engine.isOver():
+            self.phase = None
+        else:
+            self.advance()
+
+        if self.phase is not None:
+            return self.observe(), self.legalMask(), 0.0, False, {}
+
+        result = self.engine.endGame()
+        if result['winner'] is None:
+            reward = 0.0
+        else:
+            reward = 1.0 if result['winner'] == self.seat else -1.0
+        return self.observe(), self.legalMask(), reward, True, {'result': result, 'seat': self.seat}
+
+    # Let the opponents play until the learner has a decision to make, or the game is over
+    def advance(self):
+        while self.setupOrder:
+            if self.setupOrder[0] == self.seat:
+                self.phase = SETUP_ROAD if self.lastSettlement is not None else SETUP_SETTLEMENT
+                return
+            self.engine.initial_placements(self.engine.players[self.setupOrder.pop(0)])
+
+        if self.phase == MAIN and self.engine.currentPlayer() is self.learner:
+            return
+        while not self.engine.isOver():
+            player = self.engine.currentPlayer()
+            if player is self.learner:
+                self.engine.beginTurn(player)
+                self.phase, self.devPlayed, self.actions = MAIN, False, 0
+                return
+            self.engine.play_turn()
+        self.phase = None
+
+    def applyAction(self, action):
+        engine, player = self.engine, self.learner
+        if self.phase == SETUP_SETTLEMENT:
+            node = self.node(action - SETTLEMENT)
+            player.place_settlement(node, self.game, True)
+            engine.record('settlement', player, node, True)
+            self.lastSettlement = node
+        elif self.phase == SETUP_ROAD:
+            roadLoc = self.road(action - ROAD)
+            player.place_road(roadLoc, self.game, True)
+            engine.record('road', player, roadLoc, True)
+            self.lastSettlement = None
+            self.setupOrder.pop(0)
+        elif action == END_TURN:
+            self.game.updateDevCards(player)
+            engine.record('ready', player)
+            engine.finishTurn(player)
+        elif action < CITY:
+            engine.apply_AI_action(player, ('Settlement', 1), [self.node(action - SETTLEMENT)])
+        elif action < ROAD:
+            engine.apply_AI_action(player, ('City', 1), [self.node(action - CITY)])
+        elif action < BUY_DEV:
+            engine.apply_AI_action(player, ('Road', 1), [self.road(action - ROAD)])
+        elif action == BUY_DEV:
+            engine.apply_AI_action(player, ('buyDevCard', 1), None)
+        elif action < TRADE:
+            engine.play_devcard(DEV_CARDS[action - PLAY_DEV], player)
+            self.devPlayed = True
+        else:
+            give, get = divmod(action - TRADE, len(RESOURCES))
+            give, get = RESOURCES[give], RESOURCES[get]
+            engine.apply_AI_action(player, ((give, get), player.exchangeRates[give]), None)
+
+    def node(self, index):
+        return self.game.board.getNode(NODES[index])
+
+    # Road locations are oriented the way the game lists them, from the player's side
+    def road(self, index):
+        first, second = EDGES[index]
+        for roadLoc in self.roadLocations():
+            if edgeKey(roadLoc) == (first, second):
+                return roadLoc
+        return (self.game.board.getNode(first), self.game.board.getNode(second))
+
+    def roadLocations(self):
+        if self.phase == SETUP_ROAD:
+            taken = set(edgeKey(road) for road in self.game.roads)
+            return [(self.lastSettlement, neighbour) for neighbour in self.lastSettlement.neighbours
+                    if edgeKey((self.lastSettlement, neighbour)) not in taken]
+        return self.game.getRoadLocations(self.learner)
+
+    #############################################################################
+    ##########################  Masks and observations  #########################
+    #############################################################################
+
+    def legalMask(self):
+        mask = np.zeros(NUM_ACTIONS, dtype=bool)
+        game, player = self.game, self.learner
+        if self.phase == SETUP_SETTLEMENT:
+            for node in game.getSettlementLocations(player, True):
+                mask[SETTLEMENT + NODE_INDEX[(node.row, node.col)]] = True
+        elif self.phase == SETUP_ROAD:
+            for roadLoc in self.roadLocations():
+                mask[ROAD + EDGE_INDEX[edgeKey(roadLoc)]] = True
+        elif self.phase == MAIN:
+            mask[END_TURN] = True
+            if game.canBuySettlement(player):
+                for node in game.getSettlementLocations(player):
+                    mask[SETTLEMENT + NODE_INDEX[(node.row, node.col)]] = True
+            if game.canBuyCity(player):
+                for node in game.getCityLocations(player):
+                    mask[CITY + NODE_INDEX[(node.row, node.col)]] = True
+            if game.canBuyRoad(player):
+                for roadLoc in game.getRoadLocations(player):
+                    mask[ROAD + EDGE_INDEX[edgeKey(roadLoc)]] = True
+            mask[BUY_DEV] = game.canBuyDevCard(player)
+            if not self.devPlayed:
+                for i, card in enumerate(DEV_CARDS):
+                    mask[PLAY_DEV + i] = bool(card in player.devCards and player.devCards[card])
+            for i, give in enumerate(RESOURCES):
+                if player.resources[give] >= player.exchangeRates[give]:
+                    for j in range(len(RESOURCES)):
+                        mask[TRADE + i * len(RESOURCES) + j] = i != j
+        return mask
+
+    # Seat of a player counted from the learner
+    def relative(self, player):
+        return (player.turn_num - self.seat) % NUM_PLAYERS
+
+    def observe(self):
+        game, learner = self.game, self.learner
+        obs = np.zeros(OBS_SIZE, dtype=np.float32)
+        i = 0
+
+        for tile in game.board.tiles:
+            obs[i + TILE_RESOURCES.index(tile.resource)] = 1
+            obs[i + len(TILE_RESOURCES)] = tile.value / 12.0
+            obs[i + len(TILE_RESOURCES) + 1] = tile.id == game.robber_location
+            i += TILE_FEATURES
+
+        for coords in NODES:
+            node = game.board.getNode(coords)
+            if node.isOccupied:
+                piece = node.occupyingPiece
+                obs[i + 2 * self.relative(piece.player) + (piece.pieceType == 'City')] = 1
+            i += NODE_FEATURES
+
+        for player in game.players:
+            for road in player.roads:
+                obs[i + EDGE_INDEX[edgeKey(road)] * NUM_PLAYERS + self.relative(player)] = 1
+        i += len(EDGES) * NUM_PLAYERS
+
+        for resource in RESOURCES:
+            obs[i] = learner.resources[resource] / 10.0
+            obs[i + 1] = 4.0 / learner.exchangeRates[resource]
+            i += 2
+        for card in DEV_CARDS:
+            obs[i] = len(learner.devCards[card]) if card in learner.devCards and learner.devCards[card] else 0
+            obs[i + 1] = len(learner.newDevCards[card]) if card in learner.newDevCards and learner.newDevCards[card] else 0
+            i += 2
+        for resource in RESOURCES:
+            obs[i] = learner.resources[resource] >= learner.exchangeRates[resource]
+            i += 1
+
+        for player in sorted(game.players, key = self.relative):
+            obs[i:i + PLAYER_FEATURES] = [player.score / 10.0, player.numResources / 10.0, player.numKnights / 5.0,
+                                          player.longestRoadLength / 10.0, len(player.roads) / 15.0,
+                                          player.hasLargestArmy, player.holdsLongestRoad]
+            i += PLAYER_FEATURES
+
+        obs[i:i + 6] = [self.phase == SETUP_SETTLEMENT, self.phase == SETUP_ROAD, self.phase == MAIN,
+                        self.devPlayed, len(game.devCards) / 25.0,
+                        float(self.engine.turnNum / NUM_PLAYERS) / self.engine.maxRounds]
+        assert i + 6 == OBS_SIZE
+        return obs
+
+#############################################################################
+###########################  Batched environments  ##########################
+#############################################################################
+
+class EnvShard(object):
+    """
+    A group of CatanEnvs stepped together in one process. Finished games are reset right away:
+    the observation returned for them is the new game's, and the last one of the finished game
+    is in its info under 'observation'.
+    """
+    def __init__(self, seeds, envArgs):
+        self.envs = [CatanEnv(seed, **envArgs) for seed in seeds]
+
+    def reset(self):
+        results = [env.reset() for env in self.envs]
+        return np.stack([obs for obs, mask in results]), np.stack([mask for obs, mask in results])
+
+    def step(self, actions):
+        obs = np.zeros((len(self.envs), OBS_SIZE), dtype=np.float32)
+        masks = np.zeros((len(self.envs), NUM_ACTIONS), dtype=bool)
+        rewards = np.zeros(len(self.envs), dtype=np.float32)
+        dones = np.zeros(len(self.envs), dtype=bool)
+        infos = []
+        for i, env in enumerate(self.envs):
+            obs[i], masks[i], rewards[i], dones[i], info = env.step(int(actions[i]))
+            if dones[i]:
+                info['observation'] = obs[i].copy()
+                obs[i], masks[i] = env.reset()
+            infos.append(info)
+        return obs, masks, rewards, dones, infos
+
+# Worker process entry point: serves one shard's reset and step calls until told to close
+def shardWorker(conn, seeds, envArgs):
+    shard = EnvShard(seeds, envArgs)
+    while True:
+        command, args = conn.recv()
+        if command == 'close':
+            break
+        try:
+            conn.send(getattr(shard, command)(*args))
+        except Exception:
+            conn.send({'error': traceback.format_exc()})
+    conn.close()
+
+class VecEnv(object):
+    """
+    numGames CatanEnvs stepped as a batch. reset returns (observations, masks) and step, with one
+    action per game, (observations, masks, rewards, dones, infos), all stacked along the first
+    axis. Games that finish are reset straight away (see EnvShard).
+
+    With processes > 1 the games are split into that many shards, each stepped in its own worker
+    process, and every call goes to all the shards at once. Game seeds come from seed either way,
+    so both backends play the same games. The other keyword arguments are passed on to every
+    CatanEnv; random opponent weights are drawn once for all of them.
+    """
+    def __init__(self, numGames, seed=None, processes=1, **envArgs):
+        self.numGames = numGames
+        self.seed = seed if seed is not None else GameRandom().seed
+        opponentClass = envArgs.get('opponentClass', 'WeightedAI')
+        envArgs['opponentWeights'] = opponentWeightsFor(opponentClass, envArgs.get('opponentWeights'), self.seed)
+        seeds = spawnSeeds(self.seed, numGames)
+
+        self.local = None
+        self.workers = []
+        if processes <= 1:
+            self.local = EnvShard(seeds, envArgs)
+            return
+
+        bounds = [numGames * i / processes for i in range(processes + 1)]
+        for start, end in zip(bounds, bounds[1:]):
+            conn, childConn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=shardWorker, args=(childConn, seeds[start:end], envArgs))
+            process.daemon = True
+            process.start()
+            self.workers.append((conn, process, start, end))
+
+    # Send a call to every shard, then collect and join the results
+    def call(self, command, *args):
+        if self.local is not None:
+            return getattr(self.local, command)(*args)
+        for conn, process, start, end in self.workers:
+            conn.send((command, tuple(arg[start:end] for arg in args)))
+        results = []
+        for conn, process, start, end in self.workers:
+            result = conn.recv()
+            if isinstance(result, dict) and 'error' in result:
+                raise Exception('Env worker failed:\n' + result['error'])
+            results.append(result)
+        joined = []
+        for parts in zip(*results):
+            if isinstance(parts[0], list):
+                joined.append([item for part in parts for item in part])
+            else:
+                joined.append(np.concatenate(parts))
+        return tuple(joined)
+
+    def reset(self):
+        return self.call('reset')
+
+    def step(self, actions):
+        assert len(actions) == self.numGames
+        return self.call('step', list(actions))
+
+    def close(self):
+        for conn, process, start, end in self.workers:
+            conn.send(('close', ()))
+            process.join()
+        self.workers = []
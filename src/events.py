@@ -0,0 +1,217 @@
+from array import array
+
+'''
+Compact event stream of a game. The engine records one small integer record per thing that
+happened: the seed and board, then per turn the roll and every placement, trade, dev card bought
+or played, robber move, discard, steal and resource choice. Together they pin down everything
+random or chosen in the game, so replay.py can rebuild the game state at any point from the
+stream alone, without running the agents again.
+
+A record is its kind followed by a fixed number of arguments (ARITY), all stored flat in one
+array of unsigned 16 bit ints. Players are seat indices, nodes are row * 16 + col, tiles are
+indices into board.tiles, and resources and dev cards are indices into RESOURCES and DEV_CARDS.
+'''
+
+# Record kinds
+GAME = 0         # seed (four 16 bit words, low first), number of players
+TILE = 1         # tile index, resource, value
+TURN = 2         # player
+ROLL = 3         # value
+SETTLEMENT = 4   # player, node, free
+CITY = 5         # player, node
+ROAD = 6         # player, node, node, free
+TRADE = 7        # player, resource given, resource received, number given
+BUY = 8          # player, dev card
+DEVCARD = 9      # player, dev card played
+ROBBER = 10      # tile
+DISCARD = 11     # player, resource
+STEAL = 12       # player robbed, player robbing, resource
+CHOOSE = 13      # player, resource picked for Monopoly or Year of Plenty
+READY = 14       # player, whose new dev cards become playable
+
+ARITY = {GAME: 5, TILE: 3, TURN: 1, ROLL: 1, SETTLEMENT: 3, CITY: 2, ROAD: 4, TRADE: 4,
+         BUY: 2, DEVCARD: 2, ROBBER: 1, DISCARD: 2, STEAL: 3, CHOOSE: 2, READY: 1}
+
+NAMES = {GAME: 'game', TILE: 'tile', TURN: 'turn', ROLL: 'roll', SETTLEMENT: 'settlement',
+         CITY: 'city', ROAD: 'road', TRADE: 'trade', BUY: 'buy', DEVCARD: 'devCard',
+         ROBBER: 'robber', DISCARD: 'discard', STEAL: 'steal', CHOOSE: 'choose', READY: 'ready'}
+
+RESOURCES = ['Ore', 'Brick', 'Wood', 'Grain', 'Wool', 'Desert']
+DEV_CARDS = ['Knight', 'Victory Point', 'Monopoly', 'Road Building', 'Year of Plenty']
+
+def nodeCode(node):
+    return node.row * 16 + node.col
+
+def nodeCoords(code):
+    return code / 16, code % 16
+
+def seedWords(seed):
+    assert 0 <= seed < 2 ** 64
+    return [(seed >> shift) & 0xffff for shift in (0, 16, 32, 48)]
+
+def wordsSeed(words):
+    return sum(word << shift for word, shift in zip(words, (0, 16, 32, 48)))
+
+class EventStream(object):
+    """
+    An event stream, recorded by the engine (see Engine's record argument) or loaded from a file.
+    self.data is the flat array of records; iterating gives (kind, args) pairs.
+    """
+    def __init__(self, data=None):
+        self.data = data if data is not None else array('H')
+
+    def add(self, kind, *args):
+        assert len(args) == ARITY[kind]
+        self.data.append(kind)
+        self.data.extend(args)
+
+    def __iter__(self):
+        data, i = self.data, 0
+        while i < len(data):
+            kind = data[i]
+            end = i + 1 + ARITY[kind]
+            yield kind, tuple(data[i + 1:end])
+            i = end
+
+    def __len__(self):
+        return sum(1 for record in self)
+
+    def records(self):
+        return list(self)
+
+    # Number of bytes the stream takes up
+    def size(self):
+        return len(self.data) * self.data.itemsize
+
+    # One line per record, for reading a game by eye
+    def describe(self):
+        lines = []
+        for kind, args in self:
+            lines.append(NAMES[kind] + ' ' + ' '.join(str(arg) for arg in args))
+        return '\n'.join(lines)
+
+    def save(self, filename):
+        f = open(filename, 'wb')
+        self.data.tofile(f)
+        f.close()
+
+    @staticmethod
+    def load(filename):
+        f = open(filename, 'rb')
+        data = array('H', f.read())
+        f.close()
+        return EventStream(data)
+
+    # The pickled form is the raw bytes, which keeps results sent between processes small
+    def __getstate__(self):
+        return self.data.tostring()
+
+    def __setstate__(self, state):
+        self.data = array('H', state)
+
+#############################################################################
+#############################   Recording   #################################
+#############################################################################
+
+class EventRecorder(object):
+    """
+    Records a game into an EventStream. The engine calls it as the game goes: the placements,
+    trades and cards it applies are recorded directly, while the outcomes that are decided inside
+    the game code (robber moves, discards, steals and Monopoly/Year of Plenty choices) are found by
+    comparing the hands and robber before and after, with snapshot and the record* methods.
+    """
+    def __init__(self, players, board, seed):
+        self.stream = EventStream()
+        self.players = players
+        self.seats = dict((id(player), seat) for seat, player in enumerate(players))
+        self.board = board
+        self.stream.add(GAME, *(seedWords(seed) + [len(players)]))
+        for i, tile in enumerate(board.tiles):
+            self.stream.add(TILE, i, RESOURCES.index(tile.resource), tile.value)
+
+    def seat(self, player):
+        return self.seats[id(player)]
+
+    def tileIndex(self, location):
+        for i, tile in enumerate(self.board.tiles):
+            if tile.id == location:
+                return i
+
+    def add(self, kind, *args):
+        self.stream.add(kind, *args)
+
+    def turn(self, player):
+        self.add(TURN, self.seat(player))
+
+    def roll(self, value):
+        self.add(ROLL, value)
+
+    def settlement(self, player, node, free):
+        self.add(SETTLEMENT, self.seat(player), nodeCode(node), int(free))
+
+    def city(self, player, node):
+        self.add(CITY, self.seat(player), nodeCode(node))
+
+    def road(self, player, roadLoc, free):
+        self.add(ROAD, self.seat(player), nodeCode(roadLoc[0]), nodeCode(roadLoc[1]), int(free))
+
+    def trade(self, player, oldResource, newResource, count):
+        self.add(TRADE, self.seat(player), RESOURCES.index(oldResource), RESOURCES.index(newResource), count)
+
+    def buy(self, player, card):
+        self.add(BUY, self.seat(player), DEV_CARDS.index(card))
+
+    def devCard(self, player, card):
+        self.add(DEVCARD, self.seat(player), DEV_CARDS.index(card))
+
+    def ready(self, player):
+        self.add(READY, self.seat(player))
+
+    # Everybody's hand and the robber's position, to compare against after a roll or a card
+    def snapshot(self, game):
+        return self.hands(), game.robber_location
+
+    def hands(self):
+        return [[player.resources[resource] for resource in RESOURCES[:-1]] for player in self.players]
+
+    def recordRobber(self, game, before):
+        if game.robber_location != before[1]:
+            self.add(ROBBER, self.tileIndex(game.robber_location))
+
+    # Cards each player lost since the snapshot, as (seat, resource, count)
+    def losses(self, before):
+        after = self.hands()
+        for seat, (old, new) in enumerate(zip(before[0], after)):
+            for resource in range(len(old)):
+                if new[resource] < old[resource]:
+                    yield seat, resource, old[resource] - new[resource]
+
+    def gains(self, player, before):
+        seat = self.seat(player)
+        old, new = before[0][seat], self.hands()[seat]
+        for resource in range(len(old)):
+            for i in range(new[resource] - old[resource]):
+                yield resource
+
+    # A 7: the robber's move and everybody's discards
+    def recordSeven(self, game, before):
+        self.recordRobber(game, before)
+        for seat, resource, count in self.losses(before):
+            for i in range(count):
+                self.add(DISCARD, seat, resource)
+
+    # A Knight: the robber's move and a card stolen from each player who lost one
+    def recordKnight(self, game, player, before):
+        self.recordRobber(game, before)
+        for seat, resource, count in self.losses(before):
+            for i in range(count):
+                self.add(STEAL, seat, self.seat(player), resource)
+
+    # Monopoly or Year of Plenty: the resources picked. A Monopoly that took nothing is recorded
+    # as picking the first resource, which leaves the game the same
+    def recordChoices(self, player, card, before):
+        picked = list(self.gains(player, before))
+        if card == 'Monopoly':
+            picked = picked[:1] or [0]
+        for resource in picked:
+            self.add(CHOOSE, self.seat(player), resource)
@@ -0,0 +1,187 @@
+import numpy as np
+
+'''
+Experience replay for the qAI learners. Online, every transition (the features of one decision,
+the features of the next, and the reward) is used for one update and thrown away. A
+ReplayBuffer keeps the last capacity transitions in preallocated NumPy arrays, overwriting the
+oldest, and trains a weights dict on mini-batches drawn from them between games, so each game
+played goes into many updates.
+
+Batches are drawn uniformly, or with prioritized set, in proportion to |TD error| ** alpha, so
+that transitions the weights get most wrong come up most often. Priorities live in a SumTree,
+which samples and updates in O(log capacity); the bias this sampling brings in is corrected with
+importance sampling weights, (size * P(i)) ** -beta scaled to at most 1.
+
+    buffer = ReplayBuffer(100000, prioritized=True)
+    buffer.addAll(player.transitions)
+    buffer.train(player.weights, batchSize=64, updates=32)
+'''
+
+class SumTree(object):
+    """
+    Binary tree over capacity leaves (rounded up to a power of two) where each node holds the
+    sum of the leaves below it. sample finds the leaves for a batch of points in [0, total)
+    walking all of them down the tree together.
+    """
+    def __init__(self, capacity):
+        self.leaves = 1
+        while self.leaves < capacity:
+            self.leaves *= 2
+        self.tree = np.zeros(2 * self.leaves)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, indices):
+        return self.tree[self.leaves + np.asarray(indices)]
+
+    def update(self, indices, priorities):
+        for index, priority in zip(np.asarray(indices).tolist(), np.asarray(priorities, dtype=np.float64).tolist()):
+            node = self.leaves + index
+            change = priority - self.tree[node]
+            while node >= 1:
+                self.tree[node] += change
+                node //= 2
+
+    # The leaf under each point, where leaf i covers its share of [0, total) in order
+    def find(self, points):
+        nodes = np.ones(len(points), dtype=np.int64)
+        points = np.array(points, dtype=np.float64)
+        while nodes[0] < self.leaves:
+            left = 2 * nodes
+            leftSums = self.tree[left]
+            goRight = points >= leftSums
+            points = np.where(goRight, points - leftSums, points)
+            nodes = np.where(goRight, left + 1, left)
+        return nodes - self.leaves
+
+    # Leaves for batchSize points, one in each of batchSize equal slices of the total
+    def sample(self, batchSize, rng):
+        bounds = np.arange(batchSize) * (self.total() / batchSize)
+        points = bounds + rng.uniform(0, self.total() / batchSize, batchSize)
+        return self.find(np.minimum(points, np.nextafter(self.total(), 0)))
+
+class ReplayBuffer(object):
+    """
+    Ring buffer of transitions. Features are stored as vectors over self.names, which grow as new
+    features turn up; features holds the decision's vector, nextFeatures the next decision's
+    (zero for the last one of a game), reward the reward and terminal whether the game ended.
+    """
+    def __init__(self, capacity, numFeatures=64, prioritized=False, alpha=0.6, beta=0.4, epsilon=1e-3, seed=None):
+        self.capacity = capacity
+        self.prioritized = prioritized
+        self.alpha = alpha
+        self.beta = beta
+        self.epsilon = epsilon
+        self.rng = np.random.RandomState(seed)
+
+        self.names = []
+        self.index = {}
+        self.features = np.zeros((capacity, numFeatures), dtype=np.float32)
+        self.nextFeatures = np.zeros((capacity, numFeatures), dtype=np.float32)
+        self.reward = np.zeros(capacity, dtype=np.float32)
+        self.terminal = np.zeros(capacity, dtype=np.float32)
+        self.size = 0
+        self.next = 0
+
+        self.tree = SumTree(capacity) if prioritized else None
+        self.maxPriority = 1.0
+
+    def __len__(self):
+        return self.size
+
+    # Column of each feature, widening the arrays when there are more features than columns
+    def columns(self, features):
+        for name in features:
+            if name not in self.index:
+                self.index[name] = len(self.names)
+                self.names.append(name)
+        width = self.features.shape[1]
+        if len(self.names) > width:
+            grow = max(len(self.names), 2 * width) - width
+            self.features = np.hstack([self.features, np.zeros((self.capacity, grow), dtype=np.float32)])
+            self.nextFeatures = np.hstack([self.nextFeatures, np.zeros((self.capacity, grow), dtype=np.float32)])
+        return [self.index[name] for name in features]
+
+    def vector(self, features):
+        columns = self.columns(features or {})
+        x = np.zeros(self.features.shape[1], dtype=np.float32)
+        x[columns] = [float(value) for value in (features or {}).values()]
+        return x
+
+    # Add a transition, given as feature dicts. nextFeatures is None for the end of a game
+    def add(self, features, nextFeatures, reward, terminal):
+        x = self.vector(features)
+        nextX = self.vector(nextFeatures)
+        i = self.next
+        self.features[i, :] = 0
+        self.features[i, :len(x)] = x
+        self.nextFeatures[i, :] = 0
+        self.nextFeatures[i, :len(nextX)] = nextX
+        self.reward[i] = reward
+        self.terminal[i] = float(terminal)
+        if self.tree is not None:
+            self.tree.update([i], [self.maxPriority])
+        self.next = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    # Add (features, nextFeatures, reward, terminal) tuples, as qAI players collect them
+    def addAll(self, transitions):
+        for transition in transitions:
+            self.add(*transition)
+
+    # Indices of a batch and their importance sampling weights
+    def sample(self, batchSize):
+        if self.tree is None:
+            return self.rng.randint(0, self.size, batchSize), np.ones(batchSize)
+        # Rounding in the tree's sums can land a point just past the last filled leaf
+        indices = np.minimum(self.tree.sample(batchSize, self.rng), self.size - 1)
+        probabilities = self.tree.get(indices) / self.tree.total()
+        weights = (self.size * probabilities) ** -self.beta
+        return indices, weights / weights.max()
+
+    def updatePriorities(self, indices, errors):
+        priorities = (np.abs(errors) + self.epsilon) ** self.alpha
+        self.maxPriority = max(self.maxPriority, priorities.max())
+        self.tree.update(indices, priorities)
+
+    # Run updates TD(0) mini-batch updates of the linear weights in the dict weights, with step
+    # size stepSize / (mean x . x) like the 'normalized' schedule of td.py. Returns the mean
+    # |TD error| of the last batch
+    def train(self, weights, batchSize=64, updates=32, stepSize=0.01, gamma=1.0):
+        if self.size == 0:
+            return None
+        self.columns(weights)
+        width = self.features.shape[1]
+        w = np.zeros(width)
+        w[:len(self.names)] = [weights.get(name, 0.0) for name in self.names]
+
+        for update in range(updates):
+            indices, isWeights = self.sample(batchSize)
+            X = self.features[indices].astype(np.float64)
+            nextX = self.nextFeatures[indices].astype(np.float64)
+            targets = self.reward[indices] + gamma * (1 - self.terminal[indices]) * np.dot(nextX, w)
+            errors = targets - np.dot(X, w)
+            scale = max(np.mean((X * X).sum(axis=1)), 1.0)
+            w += stepSize / scale * np.dot(X.T, isWeights * errors) / batchSize
+            if self.tree is not None:
+                self.updatePriorities(indices, errors)
+
+        weights.update(zip(self.names, w[:len(self.names)].tolist()))
+        return float(np.abs(errors).mean())
+
+class SeatReplay(object):
+    """
+    A ReplayBuffer per seat of a training run. learn adds a game's transitions for a seat and
+    trains that seat's weights on its buffer.
+    """
+    def __init__(self, seats, capacity, prioritized=False, batchSize=64, updates=32, stepSize=0.01):
+        self.buffers = dict((seat, ReplayBuffer(capacity, prioritized=prioritized, seed=seat)) for seat in seats)
+        self.batchSize = batchSize
+        self.updates = updates
+        self.stepSize = stepSize
+
+    def learn(self, seat, transitions, weights):
+        buffer = self.buffers[seat]
+        buffer.addAll(transitions)
+        return buffer.train(weights, self.batchSize, self.updates, self.stepSize)
@@ -0,0 +1,188 @@
+import sys
+import numpy as np
+from log import Log
+from dataset import DatasetReader
+
+'''
+Offline fitting of linear evaluator weights from a recorded dataset (see dataset.py). The online
+learners (qAI.updateWeights and endGameUpdate) take one SGD step per position with a tiny fixed
+eta; here every position of the dataset is used at once, with NumPy doing the work a batch at a
+time, so a million positions fit in minutes.
+
+Features are standardized with their mean and standard deviation over the dataset before
+fitting, and the weights are mapped back to the raw features afterwards, with the intercept going
+to the 'offset' feature (players without that feature just leave out a constant, which doesn't
+change the moves they pick). The result is an ordinary weights dict, written with Log.log_dict so
+any player can load it.
+
+Targets are 'score', the player's final score capped at 10 (what endGameUpdate trains towards),
+or 'won', 1 if the player won. Methods:
+
+- lstsq: least squares, from the normal equations accumulated in one pass
+- ridge: the same with an L2 penalty of ridge
+- logistic: logistic regression of 'won' by Newton's method, one pass per iteration
+- sgd: mini-batch SGD on the squared loss ('score') or log loss ('won'), with ridge as L2
+
+    python fit.py data fittedWeights.txt [-m method] [-t target] [-l ridge] [-e epochs] [-b batchSize] [-r learningRate]
+'''
+
+METHODS = ['lstsq', 'ridge', 'logistic', 'sgd']
+
+# Rows read at a time
+BATCH_SIZE = 65536
+
+# The target column of a batch, and which of its rows to use. Games without a winner say nothing
+# about who wins, so they're left out of 'won' targets
+def targets(batch, target):
+    if target == 'won':
+        return batch['won'].astype(np.float64), batch['decided'] == 1
+    return np.minimum(batch['score'], 10).astype(np.float64), np.ones(len(batch['score']), dtype=bool)
+
+class Scaler(object):
+    """
+    Mean and standard deviation of each feature over the rows used for fitting. Features that
+    never change get a scale of 1 and end up with a weight of 0.
+    """
+    def __init__(self, reader, target):
+        count, total, squares = 0, 0.0, 0.0
+        for batch in reader.batches(BATCH_SIZE):
+            y, rows = targets(batch, target)
+            X = batch['features'][rows].astype(np.float64)
+            count += len(X)
+            total = total + X.sum(axis=0)
+            squares = squares + (X * X).sum(axis=0)
+        assert count > 0, "No rows to fit"
+        self.count = count
+        self.mean = total / count
+        std = np.sqrt(np.maximum(squares / count - self.mean ** 2, 0.0))
+        self.std = np.where(std > 1e-9, std, 1.0)
+
+    # Standardized features with a leading column of ones for the intercept
+    def transform(self, X):
+        Z = (X.astype(np.float64) - self.mean) / self.std
+        return np.hstack([np.ones((len(Z), 1)), Z])
+
+    # Weights for the raw features from weights for the standardized ones
+    def weights(self, features, coef):
+        raw = coef[1:] / self.std
+        intercept = coef[0] - np.dot(raw, self.mean)
+        weights = dict(zip(features, raw.tolist()))
+        weights['offset'] = weights.get('offset', 0.0) + intercept
+        return weights
+
+# Batches of (standardized features, target) for the rows used for fitting
+def scaledBatches(reader, scaler, target, batchSize=BATCH_SIZE, shuffle=False, seed=None):
+    for batch in reader.batches(batchSize, shuffle=shuffle, seed=seed):
+        y, rows = targets(batch, target)
+        if rows.any():
+            yield scaler.transform(batch['features'][rows]), y[rows]
+
+def sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+# L2 penalty matrix, leaving the intercept alone
+def penalty(size, ridge):
+    P = ridge * np.eye(size)
+    P[0, 0] = 0.0
+    return P
+
+# Least squares, or ridge regression with ridge > 0
+def fitLinear(reader, scaler, target, ridge=0.0):
+    size = len(reader.features) + 1
+    A, b = np.zeros((size, size)), np.zeros(size)
+    for Z, y in scaledBatches(reader, scaler, target):
+        A += np.dot(Z.T, Z)
+        b += np.dot(Z.T, y)
+    A += penalty(size, ridge * scaler.count)
+    return np.linalg.lstsq(A, b, rcond=-1)[0]
+
+# Logistic regression by Newton's method (iteratively reweighted least squares)
+def fitLogistic(reader, scaler, target, ridge=0.0, iterations=25, tolerance=1e-6):
+    size = len(reader.features) + 1
+    P = penalty(size, max(ridge, 1e-6) * scaler.count)
+    coef = np.zeros(size)
+    for i in range(iterations):
+        H, g = P.copy(), np.dot(P, coef)
+        for Z, y in scaledBatches(reader, scaler, target):
+            p = sigmoid(np.dot(Z, coef))
+            g += np.dot(Z.T, p - y)
+            H += np.dot(Z.T * (p * (1 - p)), Z)
+        step = np.linalg.solve(H, g)
+        coef -= step
+        if np.abs(step).max() < tolerance:
+            break
+    return coef
+
+# Mini-batch SGD. The learning rate falls with the square root of the epoch
+def fitSgd(reader, scaler, target, ridge=0.0, epochs=10, batchSize=256, learningRate=0.05, seed=0):
+    coef = np.zeros(len(reader.features) + 1)
+    decay = np.ones(len(coef))
+    decay[0] = 0.0
+    for epoch in range(epochs):
+        rate = learningRate / np.sqrt(epoch + 1)
+        for Z, y in scaledBatches(reader, scaler, target, BATCH_SIZE, shuffle=True, seed=seed + epoch):
+            for start in range(0, len(y), batchSize):
+                Zb, yb = Z[start:start + batchSize], y[start:start + batchSize]
+                pred = np.dot(Zb, coef)
+                if target == 'won':
+                    pred = sigmoid(pred)
+                gradient = np.dot(Zb.T, pred - yb) / len(yb) + ridge * decay * coef
+                coef -= rate * gradient
+    return coef
+
+# How well coef fits the data: mean squared error, and for 'won' log loss and accuracy
+def evaluate(reader, scaler, target, coef, logistic):
+    count, squares, logLoss, correct = 0, 0.0, 0.0, 0
+    for Z, y in scaledBatches(reader, scaler, target):
+        pred = np.dot(Z, coef)
+        if logistic:
+            pred = sigmoid(pred)
+            clipped = np.clip(pred, 1e-12, 1 - 1e-12)
+            logLoss -= (y * np.log(clipped) + (1 - y) * np.log(1 - clipped)).sum()
+        if target == 'won':
+            correct += ((pred > 0.5) == (y > 0.5)).sum()
+        squares += ((pred - y) ** 2).sum()
+        count += len(y)
+    report = {'rows': count, 'mse': squares / count}
+    if logistic:
+        report['logLoss'] = logLoss / count
+    if target == 'won':
+        report['accuracy'] = float(correct) / count
+    return report
+
+# Fit weights to the dataset at path. Returns the weights dict and a report on the fit
+def fit(path, method='ridge', target='score', ridge=1e-3, epochs=10, batchSize=256, learningRate=0.05, seed=0):
+    assert method in METHODS, "Unknown method " + method
+    assert method != 'logistic' or target == 'won', "Logistic regression needs the 'won' target"
+    reader = DatasetReader(path)
+    scaler = Scaler(reader, target)
+
+    if method == 'lstsq':
+        coef = fitLinear(reader, scaler, target)
+    elif method == 'ridge':
+        coef = fitLinear(reader, scaler, target, ridge)
+    elif method == 'logistic':
+        coef = fitLogistic(reader, scaler, target, ridge)
+    else:
+        coef = fitSgd(reader, scaler, target, ridge, epochs, batchSize, learningRate, seed)
+
+    logistic = method == 'logistic' or (method == 'sgd' and target == 'won')
+    report = evaluate(reader, scaler, target, coef, logistic)
+    report.update({'method': method, 'target': target, 'features': len(reader.features)})
+    return scaler.weights(reader.features, coef), report
+
+def main():
+    path, outPath = sys.argv[1], sys.argv[2]
+    options = dict(zip(sys.argv[3::2], sys.argv[4::2]))
+    weights, report = fit(path,
+                          method=options.get('-m', 'ridge'),
+                          target=options.get('-t', 'score'),
+                          ridge=float(options.get('-l', 1e-3)),
+                          epochs=int(options.get('-e', 10)),
+                          batchSize=int(options.get('-b', 256)),
+                          learningRate=float(options.get('-r', 0.05)))
+    Log(outPath).log_dict(weights)
+    print(report)
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,18 @@
-import random
+import copy
 from collections import deque, defaultdict
 from components import *
-from players import *
 from log import *
 from util import *
+from rng import GameRandom
+from stats import Stats
 
 class Game(object):
     """
     Represents a game of Catan. Each game has players and a board. 
 
     """
-    def __init__(self, players, board, robber_tile):
+    # rng is the game's GameRandom. The dev card deck is shuffled with its deck stream
+    def __init__(self, players, board, robber_tile, rng=None):
 
         self.currMaxRoad = 0
         self.currMaxKnights = 0
@@ -20,6 +22,9 @@ class Game(object):
         self.currPlayerWithLongestRoad = None
         self.playerWithLargestArmy = None
         self.board = board
+        self.rng = rng if rng is not None else GameRandom()
+        # Timing and counters, the Engine swaps in the current player's Stats every turn
+        self.stats = Stats()
         self.turn_num = 0 #TODO: Remove fields that aren't used, like turn_num here
         self.devCards = self.initialize_dev_cards()
         self.gameStart = False
@@ -68,7 +73,7 @@ class Game(object):
         devCards += ['Road Building'] * 2
         devCards += ['Monopoly'] * 2
         devCards += ['Year of Plenty'] * 2
-        random.shuffle(devCards)
+        self.rng.deck.shuffle(devCards)
         return deque(devCards)
 
 
@@ -94,13 +99,12 @@ class Game(object):
 
             name = cur_player.name
 
-        else:
+        elif not cur_player.isAI:
             if not self.devCards:
                 print("Sorry there are no devcards left to buy")
             else:
                 print("You don't have enough resources to buy a devCard")
 
-            # catan_log.log("Couldn't buy devCard")
     
     #Return a devCard
     def returnDevCard(self, cur_player):
@@ -129,7 +133,8 @@ class Game(object):
         newRobberTile = self.board.getTileForNode(self.robber_location[0], self.robber_location[1])
         newRobberTile.has_robber = True
 
-        display.placeRobber(location)
+        if display is not None:
+            display.placeRobber(location)
 
     ################################################################
     ######################   Get Actions   #########################
@@ -201,8 +206,7 @@ class Game(object):
     def findResourceCombos(self, pieces, ans, curr_player, depth=3):
 
         if not areValidResources(curr_player.resources):
-            print curr_player.resources
-            print "depth: ", depth
+            self.stats.count('invalidResources')
 
         #Only recurse 5 levels to limit running time
         if depth <= 0:
@@ -243,12 +247,13 @@ class Game(object):
             self.updateDevCardResources(curr_player, add=True)
             cur_pieces['buyDevCard'] -= 1
 
-        # Check if you can exchange any of your resources
-        for resource, count in curr_player.resources.items():
+        # Check if you can exchange any of your resources. Resources are gone through in sorted
+        # order, since the dict's own order changes when a game is copied or pickled
+        for resource, count in sorted(curr_player.resources.items()):
             if count >= curr_player.exchangeRates[resource]:
                 curr_player.resources[resource] -= curr_player.exchangeRates[resource]
                 #Add a new resource
-                for addResource in curr_player.resources:
+                for addResource in sorted(curr_player.resources):
                     if addResource != resource:
                         curr_player.resources[addResource] += 1
                         # Store exchanges in form (trade in, recieve): exchange rate
@@ -336,8 +341,7 @@ class Game(object):
             if cur_action:
                 actions.append(cur_action)
 
-        # catan_log.log("Found possible actions for " + player.name)
-
+        self.stats.count('moveGenerations')
         return actions
     
     # Get valid road locations
@@ -434,6 +438,13 @@ class Game(object):
                 if player.numResources > 7:
                     player.over_seven()
 
+        for player, resource, resourceNum in self.getRollProduction(roll):
+            player.resources[resource] += resourceNum
+            player.numResources += resourceNum
+
+    # Returns the (player, resource, count) payouts for a roll without handing them out
+    def getRollProduction(self, roll):
+        production = []
         # Loop over nodes and see if they are touching a tile with the rolled value
         for row in self.board.nodes.values():
             for node in row:
@@ -443,5 +454,5 @@ class Game(object):
                         # If tile value was rolled and its not blocked, give out resources
                         if tile.value == roll and not tile.hasRobber and tile.resource != 'Desert':
                             resourceNum = 2 if node.occupyingPiece == City else 1
-                            node.occupyingPiece.player.resources[tile.resource] += resourceNum
-                            node.occupyingPiece.player.numResources += resourceNum
+                            production.append((node.occupyingPiece.player, tile.resource, resourceNum))
+        return production
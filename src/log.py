@@ -1,4 +1,9 @@
+import os
 import json
+import time
+import atexit
+import weakref
+import threading
 
 class Log:
 
@@ -41,4 +46,147 @@ class Log:
 
         return in_dict
 
-catan_log = Log("log.txt")
+# Log that keeps its dict in memory instead of a file. Lets players be built from a weights
+# snapshot (in a worker process, say) without touching the weight files
+class DictLog(Log):
+
+    def __init__(self, in_dict=None):
+        Log.__init__(self, None)
+        self.in_dict = dict(in_dict or {})
+
+    def log_dict(self, out_dict):
+        self.in_dict = dict(out_dict)
+
+    def readDict(self):
+        return dict(self.in_dict)
+
+#############################################################################
+##############################  Buffered Log  ###############################
+#############################################################################
+
+# Every BufferedLog that is still open, so that they can all be flushed at exit
+_openLogs = weakref.WeakSet()
+
+class BufferedLog(Log):
+    """
+    Log that keeps its file open and writes in batches instead of opening the file on every
+    call. Appended lines are kept in memory, and log and log_dict, which replace the whole
+    file, only keep the latest content, so a weights file rewritten after every game is written
+    once per flush. A flush happens once maxBytes of lines are waiting or flushInterval seconds
+    have gone by since the last one (checked on every write, or every flushInterval seconds by
+    a thread with background set), on flush and close, and at exit. append_json writes JSON
+    lines. readlines and readDict see everything written so far.
+
+    Only the process that opened the log writes to it: a forked worker never flushes the
+    parent's buffer.
+    """
+    def __init__(self, filepath, maxBytes=64 * 1024, flushInterval=5.0, background=False):
+        Log.__init__(self, filepath)
+        self.maxBytes = maxBytes
+        self.flushInterval = flushInterval
+        self.lock = threading.RLock()
+        self.pending = []
+        self.pendingBytes = 0
+        # Latest content replacing the file: a string from log, or a dict from log_dict
+        self.snapshot = None
+        self.file = open(filepath, 'a')
+        self.pid = os.getpid()
+        self.lastFlush = time.time()
+        self.closed = False
+        _openLogs.add(self)
+
+        self.thread = None
+        if background and flushInterval:
+            self.thread = threading.Thread(target=self.flushLoop)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def log(self, message):
+        with self.lock:
+            self.snapshot = message + '\n'
+            self.pending, self.pendingBytes = [], 0
+        self.maybeFlush()
+
+    def log_dict(self, out_dict):
+        with self.lock:
+            self.snapshot = dict(out_dict)
+            self.pending, self.pendingBytes = [], 0
+        self.maybeFlush()
+
+    def write(self, text):
+        with self.lock:
+            self.pending.append(text)
+            self.pendingBytes += len(text)
+        self.maybeFlush()
+
+    def append(self, message):
+        self.write(message + '\n')
+
+    def append_dict(self, out_dict):
+        self.write(json.dumps(out_dict))
+
+    def log_dict_second(self, out_dict, score):
+        self.write(json.dumps(out_dict) + " " + str(score) + '\n')
+
+    # One JSON record per line
+    def append_json(self, record):
+        self.write(json.dumps(record) + '\n')
+
+    def readlines(self):
+        self.flush()
+        return Log.readlines(self)
+
+    def readDict(self):
+        with self.lock:
+            if isinstance(self.snapshot, dict) and not self.pending:
+                return dict(self.snapshot)
+        self.flush()
+        return Log.readDict(self)
+
+    def maybeFlush(self):
+        if self.pendingBytes >= self.maxBytes or \
+                (self.flushInterval is not None and time.time() - self.lastFlush >= self.flushInterval):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.closed or os.getpid() != self.pid:
+                return
+            if self.snapshot is not None:
+                self.file.seek(0)
+                self.file.truncate()
+                if isinstance(self.snapshot, dict):
+                    self.file.write(json.dumps(self.snapshot))
+                else:
+                    self.file.write(self.snapshot)
+                self.snapshot = None
+            if self.pending:
+                self.file.write(''.join(self.pending))
+                self.pending, self.pendingBytes = [], 0
+            self.file.flush()
+            self.lastFlush = time.time()
+
+    def flushLoop(self):
+        while not self.closed:
+            time.sleep(self.flushInterval)
+            self.flush()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.file.close()
+        _openLogs.discard(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+@atexit.register
+def flushOpenLogs():
+    for log in list(_openLogs):
+        log.flush()
@@ -1,79 +1,32 @@
-from game import *
-from catanGameBoard import *
+from engine import *
 from players import *
-from display import *
-import time
+from util import *
+from gameUI import *
 
-class Play:
+class Play(Engine):
 
     #############################################################################
     ############################  Initialization ################################
     #############################################################################
     """
-    Class for the main game logic
+    Interactive shell around the Engine
 
-    In this place we will start the game by initializng the board,
-    the players, and the resources, and allowing the players to
-    allocate their first settlements and roads. After this we will
-    run the game until an end state has been found (i.e. a player has
-    ten points.)
+    Adds the pygame display and everything human players need: reading clicks and typed
+    commands for placements, purchases and dev cards, and printing stats along the way.
+    The game itself (board, setup turns, turn loop, AI turns) is run by the Engine.
     """
     # New updates: logs is passed in as a dict from the player number to the current Log containing the weight
     # dicts for each player. At the start, they will contain a placeholder dict, overwritten by the player
     # Each AI player will be passed the log for their weights, which will be updated over time. 
     # This update is assuming that there is a higher level being run in test.py, where the actual log objects are stored.
     # Player types must be constant from one run to the next (e.g. P1 = human, P2 = AI, P3 = AI, P4 = Human for all runs in test.py)
-    def __init__(self, players):
-        # Initialize the board and give values and resources to tiles
-        self.board = Board()
-        self.turnNum = 0
-        self.num_players = 4
-        self.players = players
-        # Simulate all possible die rolls and tile types
-        tile_types = [['Ore'] * 3,
-                      ['Brick'] * 3,
-                      ['Wood'] * 4,
-                      ['Grain'] * 4,
-                      ['Wool'] * 4]
-    
-        # Set the tile ids
-        # Each tile is defined by the coordinates of its peak node (0, 1), (0, 3), etc
-        # tileIds contains the coordinates of each tile 0-18 in the above specified form
-        self.tileIds = []
-        for i in range(1, 7, 2): self.tileIds.append((0, i))
-        for i in range(1, 9, 2): self.tileIds.append((1, i))
-        for i in range(1, 11, 2): self.tileIds.append((2, i))
-        for i in range(2, 9, 2): self.tileIds.append((3, i))
-        for i in range(2, 7, 2): self.tileIds.append((4, i))
-        assert len(self.tileIds) == 19
-
-        # Select random values and resource for each tile and create it
-        tile_pool = [tile for tileType in tile_types for tile in tileType]
-        tile_vals = [2,3,3,4,4,5,5,6,6,8,8,9,9,10,10,11,11,12]
-        random.shuffle(tile_vals)
-        for i in range(19):
-            # Grab a random value and assign it to the tile
-            if i != 9:
-                value = tile_vals.pop()
-                rand_tile = random.randint(0, len(tile_pool) - 1)
-                resource = tile_pool.pop(rand_tile)
-
-                # Create the tile to store its information
-                tile = Tile(resource, value, False, self.tileIds[i])
-
-                # Need to figure out how to map tiles to nodes
-                self.board.tiles.append(tile)
-            else:
-                tile = Tile('Desert', 0, True, self.tileIds[i])
-                self.board.tiles.append(tile)
+    # With ponder set, AI players keep searching their likely next positions while the others play
+    def __init__(self, players, ponder=False, seed=None):
+        Engine.__init__(self, players, ponder=ponder, seed=seed)
 
-            self.board.setTouchingTiles(tile)  
-        # Initialize the game
-        init_robber_tile = (2, 5)
-        self.game = Game(self.players, self.board, init_robber_tile)
-        
         # Initialize the display with the generated tiles
-        self.display = Display(self.board, init_robber_tile)
+        self.display = Display(self.board, self.game.robber_location)
+        self.ui = self.display
 
 #############################################################################
 #################################  Main  ####################################
@@ -86,97 +39,17 @@ class Play:
         # Show the display in its initialized state
         self.display.update()
 
-        # Initialize player resources
-        for player in self.players:
-            player.resources['Ore'] = 0
-            player.resources['Brick'] = 0
-            player.resources['Wood'] = 0
-            player.resources['Grain'] = 0
-            player.resources['Wool'] = 0
-
-        # Run first two turns
-        self.first_two_turns()
-
-        while True:
-            print(str(self.turnNum % self.num_players) + ' ' + str(self.players[self.turnNum % self.num_players].resources))
-
-            if self.turnNum/4 > 150:
-                return self.endGame()
-
-            # Check if game is over
-            if self.game.currMaxScore >= 10:
-                # print self.turnNum
-                return self.endGame()
-            else:
-                curr_turn = self.turnNum
-                curr_player = self.players[curr_turn % self.num_players]
-                for resource in curr_player.resources:
-                    if curr_player.resources[resource] < 0:
-                        print curr_player.resources
-
-                print_player_stats(curr_player)
+        return Engine.main(self)
 
-                roll = rollDice()
-
-                # raw_input("")
-
-                # Distribute resources given the last roll
-                self.game.distributeResources(roll, self.display, curr_player)
-                
-                # Play the given turn
-                if curr_player.isAI:
-                    self.run_AI_turn(curr_player)
-                else: 
-                    self.run_human_turn(curr_player)
-
-                # Update curMaxScore
-                if curr_player.score > self.game.currMaxScore:
-                    self.game.currMaxScore = curr_player.score
-                
-                self.turnNum += 1
-
-                # print "-----End Turn-----"
-                
+    # Print the current player's stats before each turn
+    def play_turn(self):
+        print_player_stats(self.currentPlayer())
+        Engine.play_turn(self)
 
 #############################################################################
 ############################  First Two Turns  ##############################
 #############################################################################
 
-    # Main function for first two turns logic
-    def first_two_turns(self):
-        # Four players place their first settlement
-        for i in range(4):
-            self.initial_placements(self.players[i])
-
-        # Players place second settlement from last to first
-        for i in range(3, -1, -1):
-            self.initial_placements(self.players[i])
-
-
-    # Handle placements logic during the first 2 turns
-    def initial_placements(self, player):
-        # Get all possible options
-
-        if player.isAI:
-            # Run first turn logic AI
-            self.AI_first_turn(player)
-        else:
-            # Run first turn logic Human
-            possible_settlements = self.game.getSettlementLocations(player, True)
-            self.Human_first_turn(player, possible_settlements)
-
-    # Define logic for an AI's first turn
-    def AI_first_turn(self, player):
-        # Place single settlement
-        settlementLoc = player.pick_settlement_position(self.game)
-        player.place_settlement(settlementLoc, self.game, True)
-        self.display.placeSettlement(settlementLoc, player)
-        
-        # Place single road
-        roadLoc = player.pick_road_position(settlementLoc, self.game)
-        player.place_road(roadLoc, self.game, True)
-        self.display.placeRoad(roadLoc[0], roadLoc[1], player)
-
     # Define logic for a Human's first turn
     def Human_first_turn(self, player, possible_settlements):
         self.display.printPlayerStats(player)
@@ -191,64 +64,6 @@ class Play:
         player.place_road(roadLoc, self.game, True)
         self.display.placeRoad(roadLoc[0], roadLoc[1], player)
 
-#############################################################################
-########################  Functions for AI turns  ###########################
-#############################################################################
-    """
-    This will take an AI player and allow them to pick among all possible moves for a given gamestate
-    """
-    def run_AI_turn(self, player):
-
-        #Pick and play a devCard. Often won't do anything if no available cards
-        devCard = player.pickDevCard()
-
-        if devCard: self.play_devcard(devCard, player)
-
-        # Get all possible moves player can make and send to AI for decision making
-        resources = player.resources
-
-        # Get move from AI player
-        move = player.pickMove(self.game)
-
-        # Print move for debugging purposes
-        if not move:
-            # print player.color,  "No move selected"
-            return
-        
-
-        # Act on move by placing pieces and updating graphics
-        for action, locs in move.items():
-            piece, count = action
-
-            #Exchange resources
-            if isinstance(piece, tuple):
-                oldResource, newResource = piece
-                player.resources[oldResource] -= count
-                player.numResources -= count
-                player.resources[newResource] += 1
-                player.numResources += 1
-                assert player.resources[oldResource] >= 0
-            #Buying DevCard
-            elif piece == 'buyDevCard':
-                self.game.buyDevCard(player)
-
-            #Place piece
-            else:
-                # Might want to flip structure of for loop and if statements
-                for loc in locs:
-                    if piece == 'Settlement':
-                        player.place_settlement(loc, self.game)
-                        self.display.placeSettlement(loc, player)
-                    elif piece == 'City':
-                        player.place_city(loc, self.game)
-                        self.display.placeCity(loc, player)
-                    elif piece == 'Road':
-                        player.place_road(loc, self.game)
-                        self.display.placeRoad(loc[0], loc[1], player)
-
-        self.game.updateDevCards(player)
-
-
 #############################################################################
 ############ Location finders for city, settlement and road #################
 #############################################################################
@@ -422,37 +237,12 @@ class Play:
 
     # Initiate the logic that plays a given devcard
     def play_devcard(self, type, currPlayer):
-        #Make sure they have some of this devCard
-        if type in currPlayer.devCards and currPlayer.devCards[type]:
-            card = currPlayer.devCards[type].pop(0)
-            if type == 'Knight':
-                card.play(self.display, self.game)
-            elif type == 'Road Building':
-                currPlayer.devCardsPlayed['Road Building'] += 1
-                for i in range(2):
-                    self.buy_and_place_road(currPlayer, True)
-            else:
-                card.play()
-
-            for player in self.players:
-                if not areValidResources(player.resources):
-                    print type                    
-                    print "Someone is invalid after devCard in play_devcard"
-                    print currPlayer.turn_num, player.turn_num
-                    raw_input("")
-
-        else:
+        if not Engine.play_devcard(self, type, currPlayer):
             print("Sorry you do not have that dev card")
             return False
+        return True
 
-#############################################################################
-###########################   End Game  #####################################
-#############################################################################
-    """
-    Ends the game and returns the winner
-    """
-    def endGame(self):
-        pass
-
-play = Play(AiPlayer)
-play.main()
+if __name__ == '__main__':
+    colors = ['orange', 'red', 'green', 'blue']
+    play = Play([AiPlayer(i, str(i), colors[i]) for i in range(4)])
+    play.main()
@@ -5,6 +5,7 @@ import random
 import copy
 import util
 from log import *
+from td import TdLearner
 import numpy as np
 
 '''
@@ -13,7 +14,7 @@ mostly useful for initialization and establishing values that the player stores.
 '''
 
 class Player:
-    def __init__(self, turn_num, name, color):
+    def __init__(self, turn_num, name, color, rng=None):
 
         if 3 < turn_num < 0:
             raise Exception("Turn number must be between 0 and 3 inclusive")
@@ -22,6 +23,11 @@ class Player:
         self.name = name
         self.color = color
         self.score = 0
+        # Random stream for this player's choices. The Engine replaces it with one from the game's
+        # GameRandom so that seeded games are reproducible; rng is used until then, for anything
+        # drawn while the player is built (WeightedAI's random starting weights), and should be
+        # seeded for that to be reproducible too
+        self.rng = rng if rng is not None else random.Random()
 
         # Storing these in dict to make it easy to figure out how many they have. {"item": [obj,obj,...]}
         self.resources = defaultdict(int)
@@ -117,8 +123,10 @@ class Player:
         settlement_to_add = Settlement(self, node)
         node.set_occupying_piece(settlement_to_add)
 
-        #Updates exchange rates when you place on a port
+        #Updates exchange rates when you place on a port. The old rates are kept for
+        #remove_settlement
         if node.port:
+            settlement_to_add.prevRates = dict(self.exchangeRates)
             if node.port == "Any":
                 for resource in self.exchangeRates:
                     self.exchangeRates[resource] = 3
@@ -145,9 +153,16 @@ class Player:
         # it was located at a different memory address than the original owner of the city, and so list.remove(x) would throw and error
         prev_settlement = node.get_occupying_piece()
         origLen = len(self.cities_and_settlements)
+        prevIndex = None
+        for i, c_or_s in enumerate(self.cities_and_settlements):
+            if str(c_or_s.location) == str(node):
+                prevIndex = i
         self.cities_and_settlements = [c_or_s for c_or_s in self.cities_and_settlements if str(c_or_s.location) != str(node)]
         # self.cities_and_settlements.remove(prev_settlement)
         city_to_add = City(self, node)
+        #What the city replaced and where it was in our list, for remove_city. The search also
+        #places cities on opponents' settlements (see search_opp_move)
+        city_to_add.replaced = (prev_settlement, prevIndex)
         node.set_occupying_piece(city_to_add)
         self.cities_and_settlements.append(city_to_add)
         self.incrementScore(1)
@@ -163,33 +178,9 @@ class Player:
 
     # Should be called whenever a road is built.
     def updateLongestRoad(self, road):
-        # Update the 'touching' dict (self.touching)
-        roadNodes = list(set(list(sum(self.roads, ())))) # Flatten the roads into a (unique) list of nodes 
-        nn1, nn2 = road # new node 1, 2 (for the new node)
-        for node in roadNodes:
-            # If a road exists between the two, they are touching
-            if (nn1, node) in self.roads or (node, nn1) in self.roads:
-                self.touching[nn1].append(node)
-                self.touching[node].append(nn1)
-            if (nn2, node) in self.roads or (node, nn2) in self.roads:
-                self.touching[nn2].append(node)
-                self.touching[node].append(nn2)
-        
-        # Use the touching dict to get the longest path
-        longestPaths = []
-        for startNode in roadNodes:
-            visited = []
-            
-            def longestPath(node, length, last, path):
-                toVisit = [n for n in self.touching[node] if n != last]
-                if node in visited or len(toVisit) == 0:
-                    return length
-                visited.append(node)
-                return max(longestPath(neighbor, length + 1, node, path + [neighbor]) for neighbor in toVisit) 
-
-            longestPaths.append(longestPath(startNode, 0, None, [startNode]))
-
-        self.longestRoadLength = max(longestPaths)
+        # Update the 'touching' dict (self.touching) and use it to get the longest path
+        roadNodes = util.addTouchingRoad(self.touching, self.roads, road)
+        self.longestRoadLength = util.longestRoadLength(self.touching, roadNodes)
 
 #############################################################################
 #############################   Human Player    #############################
@@ -200,8 +191,8 @@ class HumanPlayer(Player):
 
     (Add more stuff)
     """
-    def __init__(self, turn_num, name, color):
-        Player.__init__(self, turn_num, name, color)
+    def __init__(self, turn_num, name, color, rng=None):
+        Player.__init__(self, turn_num, name, color, rng)
         self.isAI = False
 
     '''
@@ -246,12 +237,41 @@ class AiPlayer(Player):
     of pick_*_position and other methods using real features
     """
 
-    def __init__(self, turn_num, name, color, weightsLog=None):
-        Player.__init__(self, turn_num, name, color)
+    def __init__(self, turn_num, name, color, weightsLog=None, rng=None):
+        Player.__init__(self, turn_num, name, color, rng)
         self.isAI = True
 
         #Used for unchoosing a devCard
         self.prevDevCards = []
+
+        #Best responses from guess_opp_move, keyed by getOppStateKey. Only valid within a single
+        #decision, so pickMove implementations that search should clear it before searching. The
+        #ponderer refills it with responses from the same position (see getEvalKey)
+        self.oppMoveCache = {}
+
+        #Values of the placements at the position a decision starts from, keyed by action and
+        #util.locationKey (see locationValues). Set by the ponderer, None otherwise
+        self.evalCache = None
+
+        #Beam widths for pruneMoves. beamWidth is the number of locations kept per piece type and
+        #bundleBeam the number of purchase bundles kept, both ranked by a static prior. None
+        #disables pruning. Every pruneAuditRate-th pruned decision of a game is also searched
+        #unpruned, and the game's stats count how often pruning changed the chosen move
+        #('prunedDecisions', 'pruneAudits', 'pruneChanges'; 0 turns auditing off)
+        self.beamWidth = None
+        self.bundleBeam = None
+        self.pruneAuditRate = 0
+
+        #Set to a ponder.Ponderer to search during the other players' turns
+        self.ponderer = None
+
+        #Set to an endgame.EndgameSolver to look for a forced win before anything else within
+        #endgameMargin points of winning. Without one this turn, the player holds their hand for
+        #next turn if that gives a forced win with at least endgameHoldChance (None never holds).
+        #Hands over 7 cards are never held, a 7 would halve them
+        self.endgameSolver = None
+        self.endgameMargin = 3
+        self.endgameHoldChance = 0.5
        
     '''
     These functions are used for pregame positions
@@ -266,14 +286,14 @@ class AiPlayer(Player):
     #Including game in case we want to get more information about road locations
     def pick_road_position(self, settlementLoc, game):
         possible_roads = [(settlementLoc, neighbor) for neighbor in settlementLoc.neighbours]
-        return random.choice(possible_roads)
+        return self.rng.choice(possible_roads)
 
     def pick_road_devcard_ai(self, possRoads):
-        return random.choice(possRoads)
+        return self.rng.choice(possRoads)
    
     def pick_settlement_position(self, game):
         possible_settlements = game.getSettlementLocations(self, True)
-        return random.choice(possible_settlements)
+        return self.rng.choice(possible_settlements)
     
     '''Functions for the robber logic'''
 
@@ -329,11 +349,6 @@ class AiPlayer(Player):
             else:
                 break
 
-        if not util.areValidResources(self.resources):
-            print "Invalid resources over seven"
-            print self.numResources
-            print "over seven resources", self.resources
-
     '''
     Given a list of all possible moves, pick a move. This simple implementation picks 
     a random move and returns it. 
@@ -358,7 +373,7 @@ class AiPlayer(Player):
                     return move
         
         #Get a random move 
-        move = random.choice(possible_moves)
+        move = self.rng.choice(possible_moves)
         if not move: return move
 
         for action, locations in move.items():
@@ -369,7 +384,7 @@ class AiPlayer(Player):
                 move[action] = None
             #Handle selecting a random move
             else:
-                random.shuffle(move[action])
+                self.rng.shuffle(move[action])
                 move[action] = move[action][:count]
 
         return move 
@@ -377,20 +392,22 @@ class AiPlayer(Player):
     #Randomly pick and play a devCard
     def pickDevCard(self):
         options = []
-        for devType, cards in self.devCards.items():
+        for devType, cards in sorted(self.devCards.items()):
             if cards:
                 options.append(devType)
         if not options:
             return None
 
-        return random.choice(options)
+        return self.rng.choice(options)
         
     #Function used for the monopoly devcard to get the resource you want
     def getFavResource(self, giving):
             
-        resources = [resource for resource in self.resources if self.resources[resource] > 0]
+        # Sorted, like give_card, so the choice doesn't depend on the dict's order, which changes
+        # when a game is copied or pickled
+        resources = [resource for resource in sorted(self.resources) if self.resources[resource] > 0]
         if giving and resources:
-            return random.choice(resources)
+            return self.rng.choice(resources)
         elif giving and not resources:
             return None
         else:   
@@ -402,11 +419,13 @@ class AiPlayer(Player):
     def give_card(self, oppPlayer):
         if self.numResources > 0:
 
-            #Randomly select a resource to give up
-            resource = random.choice(self.resources.keys())
-            while(self.resources[resource] < 1):
-                resource = random.choice(self.resources.keys())
-            
+            #Randomly select a resource to give up. numResources can be out of step with the
+            #actual cards, so only pick among resources we really hold
+            held = [resource for resource in sorted(self.resources) if self.resources[resource] > 0]
+            if not held:
+                return
+            resource = self.rng.choice(held)
+
             self.resources[resource] -= 1
             self.numResources -= 1
             oppPlayer.resources[resource] += 1
@@ -422,7 +441,8 @@ class AiPlayer(Player):
     #Updates a game after a move so the new gamestate s' can be used in Eval(s')
     def do_move(self, game, move, firstTurn=False):
         if not move: return
-       
+        game.stats.count('do_move')
+
         action, loc = move
         piece, count = action
 
@@ -450,7 +470,8 @@ class AiPlayer(Player):
     #Undoes a move, return s' to state s. Assumes move you are undoing was the last move made.
     def undo_move(self, game, move, firstTurn=False):
         if not move: return
-        
+        game.stats.count('undo_move')
+
         piece, count = move[0]
         loc = move[1]
 
@@ -489,18 +510,15 @@ class AiPlayer(Player):
     #Helper to remove settlements
     def remove_settlement(self, node, game, firstTurn=False):
         # print "Cities and Settlements: ", self.cities_and_settlements
+        prevRates = getattr(node.occupyingPiece, 'prevRates', None)
+        if prevRates is not None:
+            self.exchangeRates.update(prevRates)
         node.occupyingPiece = None
         node.isOccupied = False
-        if self.cities_and_settlements: del self.cities_and_settlements[-1]
-        else: 
-            print "Removing player num: ", self.turn_num
-            print self.cities_and_settlements
-            print game.currMaxScore
-            raw_input("Broken city list")
-        if self.occupyingNodes: del self.occupyingNodes[-1]
-        else: 
-            print "Broken"
-            raw_input("")
+        assert self.cities_and_settlements, "Broken city list for player %d" % self.turn_num
+        del self.cities_and_settlements[-1]
+        assert self.occupyingNodes, "Broken node list for player %d" % self.turn_num
+        del self.occupyingNodes[-1]
         self.score -= 1
 
         if firstTurn:
@@ -513,11 +531,15 @@ class AiPlayer(Player):
         else:
             game.updateSettlementResources(self, True)
 
-    #Helper to remove cities
+    #Helper to remove cities. Puts back the piece the city replaced, whoever it belongs to, and
+    #our settlement at its place in our list
     def remove_city(self, node, game):
-        del node.occupyingPiece
-        node.occupyingPiece = Settlement(self, node)
+        prev_settlement, prevIndex = node.occupyingPiece.replaced
+        node.occupyingPiece = prev_settlement
+        node.isOccupied = prev_settlement is not None
         del self.cities_and_settlements[-1]
+        if prevIndex is not None:
+            self.cities_and_settlements.insert(prevIndex, prev_settlement)
         # self.occupyingNodes.append(node)
         self.score -= 1
 
@@ -532,6 +554,7 @@ class AiPlayer(Player):
         return self.weights
 
     def expectimax_value(self, game, action_list, depth=1):
+        game.stats.count('searchNodes')
         #Do all of the actions in action_list
         for action in action_list:
             game = game.players[self.turn_num].do_move(game, action)
@@ -555,17 +578,11 @@ class AiPlayer(Player):
         #Find value of your estimated future state
         expected_features = self.feature_extractor(game)
         expected_score = util.dotProduct(expected_features, self.weights)
-    
-        for i in range(len(game.players)):
-            player = game.players[i]
-            print "cities and settlements: ", player.turn_num, player.cities_and_settlements
-        print "total actions list: ", total_action_list
 
         #Undo moves the player made
         for i in range(len(total_action_list)-1, -1, -1):
             to_undo = total_action_list[i]
             opp_num, opp_action = to_undo
-            print "Loop cities and settles: ",opp_num, game.players[opp_num].cities_and_settlements
             game = game.players[opp_num].undo_move(game, opp_action)
 
         #Undo moves the player made
@@ -574,9 +591,82 @@ class AiPlayer(Player):
 
         return expected_score
 
-    #Use original pick move logic to guess the opposing players move
+    #Returns the part of the game state that an opponent's guessed move depends on: their hand,
+    #exchange rates and roads, the dev card deck, and the occupancy of every node and edge that
+    #getPossibleActions looks at from their roads and settlements. Any move that touches the
+    #opponent's reachable nodes, edges or resources changes the key.
+    def getOppStateKey(self, opp, game):
+        frontier = set(opp.occupyingNodes)
+        for road in opp.roads:
+            frontier.update(road)
+
+        reachable = set(frontier)
+        for node in frontier:
+            reachable.update(node.neighbours)
+
+        nodeKey = []
+        for node in reachable:
+            if node.isOccupied and node.occupyingPiece is not None:
+                piece = node.occupyingPiece
+                nodeKey.append((node.row, node.col, piece.player.turn_num, piece.pieceType))
+            else:
+                nodeKey.append((node.row, node.col, -1, None))
+
+        edgeKey = []
+        for node1, node2 in game.roads:
+            if node1 in frontier or node2 in frontier:
+                edgeKey.append((node1.row, node1.col, node2.row, node2.col))
+
+        roadKey = [(node1.row, node1.col, node2.row, node2.col) for node1, node2 in opp.roads]
+
+        return (opp.turn_num,
+                tuple(sorted(opp.resources.items())),
+                tuple(sorted(opp.exchangeRates.items())),
+                len(game.devCards),
+                tuple(sorted(roadKey)),
+                tuple(sorted(nodeKey)),
+                tuple(sorted(edgeKey)))
+
+    #A player's roads and buildings, for the keys below
+    def getPiecesKey(self, player):
+        roadKey = [(node1.row, node1.col, node2.row, node2.col) for node1, node2 in player.roads]
+        nodeKey = [(node.row, node.col, node.occupyingPiece.pieceType) for node in player.occupyingNodes]
+        return tuple(sorted(roadKey)), tuple(sorted(nodeKey))
+
+    #Our own part of the state that a guessed opponent move depends on. search_opp_move ranks the
+    #opponent's locations with our evaluateMoveValue, which plays them as ours and scores our
+    #feature_extractor, so the key holds everything that reads: our hand, pieces, ports and score,
+    #and the counters behind the dev card, discard and award features. Evaluators that read more
+    #of the game add it in their override
+    def getSearcherKey(self, game):
+        return (tuple(sorted(self.resources.items())),
+                self.score,
+                self.getPiecesKey(self),
+                tuple(sorted(self.exchangeRates.items())),
+                tuple(sorted((card, n) for card, n in self.devCardsPlayed.items() if n)),
+                self.numTimesOverSeven,
+                self.numCardsDiscarded,
+                self.longestRoadLength,
+                self.holdsLongestRoad,
+                self.hasLargestArmy)
+
+    #Use original pick move logic to guess the opposing players move. Responses are cached in
+    #oppMoveCache, so candidates that leave both our and the opponent's slice of the state alone
+    #share one guess
     def guess_opp_move(self, opp, game):
-        possible_moves = game.getPossibleActions(opp)
+        key = (self.getOppStateKey(opp, game), self.getSearcherKey(game))
+        if key in self.oppMoveCache:
+            game.stats.count('oppMoveCacheHits')
+            return self.oppMoveCache[key]
+
+        game.stats.count('oppMoveSearches')
+        bestMove = self.search_opp_move(opp, game)
+        self.oppMoveCache[key] = bestMove
+        return bestMove
+
+    #Uncached search behind guess_opp_move
+    def search_opp_move(self, opp, game):
+        possible_moves = self.pruneMoves(game, game.getPossibleActions(opp), opp)
 
         bestMoveScore, bestMove = float('-inf'), None
         for possibleMove in possible_moves:
@@ -606,6 +696,158 @@ class AiPlayer(Player):
 
         return bestMove
 
+    #Returns a plan of steps that wins this turn (see endgame.py), an empty plan to hold the hand
+    #for a likely forced win next turn, or None
+    def pickEndgamePlan(self, game):
+        if self.endgameSolver is None or self.score < 10 - self.endgameMargin:
+            return None
+        plan = self.endgameSolver.solve(game, self)
+        if plan is not None or self.endgameHoldChance is None or self.numResources > 7:
+            return plan
+        chance, bestRoll = self.endgameSolver.nextTurnWinChance(game, self)
+        if chance >= self.endgameHoldChance:
+            game.stats.count('endgameHolds')
+            return []
+        return None
+
+    #Everything the evaluators read apart from the cards in hand: every player's pieces, score,
+    #ports and dev cards, the counters behind the discard and award features, the leading score
+    #and the deck. Placing a piece doesn't look at the hand, so the values of the placements at a
+    #position, and the opponent responses guessed from it, hold for every hand it can come with
+    def getEvalKey(self, game):
+        players = tuple((player.score,
+                         self.getPiecesKey(player),
+                         tuple(sorted(player.exchangeRates.items())),
+                         len(player.devCards),
+                         tuple(sorted(player.devCardsPlayed.items())),
+                         player.numTimesOverSeven,
+                         player.numCardsDiscarded,
+                         player.longestRoadLength,
+                         player.holdsLongestRoad,
+                         player.hasLargestArmy) for player in game.players)
+        return (players, game.currMaxScore, len(game.devCards))
+
+    #Returns (found, move) for a move the ponderer already searched in this exact position. On a
+    #miss, the ponderer still fills evalCache and oppMoveCache from what it searched here
+    def ponderedMove(self, game):
+        self.evalCache = None
+        if self.ponderer is None:
+            return False, None
+        return self.ponderer.lookup(game)
+
+    #Learning done at the start of every decision, before the search (see ponder.py)
+    def startDecision(self, game):
+        pass
+
+    #The state the player learns into, for a copy to search and learn as the player would
+    def learningState(self):
+        return None
+
+    def setLearningState(self, state):
+        pass
+
+    ################################################################
+    ###############   Static priors and beam pruning   #############
+    ################################################################
+
+    #Static value of settling a node: pips of the touching tiles (as in BasicStrategy.getLocScore,
+    #with every resource weighted equally), plus a bonus for ports
+    def getNodePrior(self, node):
+        score = 0
+        for tile in node.touchingTiles:
+            if tile.resource != 'Desert':
+                score += util.rollProb(tile.value)
+        if node.port == 'Any':
+            score += util.ANY_PORT_PRIOR
+        elif node.port:
+            score += util.PORT_PRIOR
+        return score
+
+    #Static value of a road for player (who builds it): how much it grows their frontier, i.e. the
+    #open settlement spots it reaches and the new nodes it touches
+    def getRoadPrior(self, game, road, player):
+        score = 0
+        for node in road:
+            if node in player.occupyingNodes or any(node in r for r in player.roads):
+                continue
+            if not node.isOccupied and not any(n.isOccupied for n in node.neighbours):
+                score += self.getNodePrior(node)
+            score += util.FRONTIER_PRIOR
+        return score
+
+    #Static prior for player placing a single piece at a location
+    def getLocationPrior(self, game, piece, loc, player):
+        if piece == 'Road':
+            return self.getRoadPrior(game, loc, player)
+        return self.getNodePrior(loc)
+
+    #Static prior for player buying a bundle: the fixed value of each piece plus the prior of its
+    #best locations
+    def getBundlePrior(self, game, move, player):
+        score = 0
+        for (piece, count), locations in move.items():
+            if isinstance(piece, tuple):
+                continue
+            score += util.PIECE_PRIORS.get(piece, 0) * count
+            if piece in ('Road', 'Settlement', 'City') and locations:
+                priors = sorted([self.getLocationPrior(game, piece, loc, player) for loc in locations], reverse=True)
+                score += sum(priors[:count])
+        return score
+
+    #Keep the beamWidth best locations for a piece (never fewer than the count being placed)
+    def pruneLocations(self, game, piece, count, locations, player):
+        if self.beamWidth is None or len(locations) <= max(self.beamWidth, count):
+            return locations
+        ranked = sorted(locations, key=lambda loc: self.getLocationPrior(game, piece, loc, player), reverse=True)
+        return ranked[:max(self.beamWidth, count)]
+
+    #First stage of the decision pipeline. Ranks the output of getPossibleActions by static priors
+    #and returns copies holding only the top bundleBeam bundles and the top beamWidth locations per
+    #piece, so that only those get the full evaluation or search. player is whoever the moves are
+    #for (an opponent, when guessing their reply), this player by default.
+    def pruneMoves(self, game, possible_moves, player=None):
+        if self.beamWidth is None and self.bundleBeam is None:
+            return possible_moves
+        if player is None:
+            player = self
+
+        pruned = []
+        for possibleMove in possible_moves:
+            if not possibleMove:
+                pruned.append(possibleMove)
+                continue
+            move = {}
+            for action, locations in possibleMove.items():
+                piece, count = action
+                if piece in ('Road', 'Settlement', 'City'):
+                    move[action] = self.pruneLocations(game, piece, count, locations, player)
+                else:
+                    move[action] = locations
+            pruned.append(move)
+
+        if self.bundleBeam is not None:
+            bundles = [move for move in pruned if move]
+            if len(bundles) > self.bundleBeam:
+                bundles.sort(key=lambda move: self.getBundlePrior(game, move, player), reverse=True)
+                pruned = [move for move in pruned if not move] + bundles[:self.bundleBeam]
+
+        return pruned
+
+    #Runs search (a function from a list of possible moves to the chosen move) over the pruned
+    #moves, and on audited decisions also over the full list to record whether pruning mattered
+    def searchPruned(self, game, possible_moves, search):
+        candidates = self.pruneMoves(game, possible_moves)
+        bestMove = search(game, candidates)
+        if candidates is possible_moves:
+            return bestMove
+
+        game.stats.count('prunedDecisions')
+        if self.pruneAuditRate and game.stats.counts['prunedDecisions'] % self.pruneAuditRate == 0:
+            game.stats.count('pruneAudits')
+            if not util.sameMove(bestMove, search(game, possible_moves)):
+                game.stats.count('pruneChanges')
+        return bestMove
+
     '''Random AI doesn't have a feature extractor, but we want it to be compatible with test'''
     def feature_extractor(self, game=None):
         pass
@@ -613,8 +855,8 @@ class AiPlayer(Player):
       
 class WeightedAI(AiPlayer):
   
-    def __init__(self, turn_num, name, color, weightsLog):
-        AiPlayer.__init__(self, turn_num, name, color, weightsLog)
+    def __init__(self, turn_num, name, color, weightsLog, rng=None):
+        AiPlayer.__init__(self, turn_num, name, color, weightsLog, rng)
         self.weightsLog = weightsLog
         self.weights = defaultdict(float, weightsLog.readDict())
         if 'DELETE ME' in self.weights.keys():
@@ -622,11 +864,11 @@ class WeightedAI(AiPlayer):
             weights = self.features # Get the list of features
             for k in weights:
                 # Initialize each feature to a random weight
-                weights[k] = random.randint(-3, 3)
+                weights[k] = self.rng.randint(-3, 3)
             weights['Score'] = abs(weights['Score'])
             weights['Has Won'] = 1000
-            weights['Ratio roads to settlements'] = random.randint(-5, -3)
-            weights['Squared distance to end'] = random.randint(-1, 1)
+            weights['Ratio roads to settlements'] = self.rng.randint(-5, -3)
+            weights['Squared distance to end'] = self.rng.randint(-1, 1)
 
             self.weights = weights
             # Overwrite the log with the randomized weights dict
@@ -657,7 +899,7 @@ class WeightedAI(AiPlayer):
         self.prevScore = None
         self.prevFeatures = None
 
-        self.__init__(turn_num, name, color, weightsLog)
+        self.__init__(turn_num, name, color, weightsLog, rng=self.rng)
 
     # Use the weights to determine the value of a given roll
     def evaluateMoveValue(self, game, move):
@@ -665,7 +907,24 @@ class WeightedAI(AiPlayer):
         futureFeatures = game.players[self.turn_num].feature_extractor(game)
         score = util.dotProduct(futureFeatures, self.weights)
         game = self.undo_move(game, move)
+        game.stats.count('evaluations')
         return score
+
+    #evaluateMoveValue of action at each of locations, for the position the decision starts from.
+    #Values already in evalCache are reused, the rest are added to it
+    def locationValues(self, game, action, locations):
+        cache = self.evalCache
+        if cache is None:
+            return [self.evaluateMoveValue(game, (action, location)) for location in locations]
+        values = []
+        for location in locations:
+            key = (action, util.locationKey(location))
+            if key in cache:
+                game.stats.count('evalCacheHits')
+            else:
+                cache[key] = self.evaluateMoveValue(game, (action, location))
+            values.append(cache[key])
+        return values
     
     # Figure out how many of each resource we would expect per roll
     def expected_resources_per_roll(self):
@@ -697,7 +956,7 @@ class WeightedAI(AiPlayer):
         return city, settlement
 
     def pick_settlement_position(self, game):
-        possible_settlements = game.getSettlementLocations(self, True)
+        possible_settlements = self.pruneLocations(game, 'Settlement', 1, game.getSettlementLocations(self, True), self)
         maxScore, maxLocation = float('-inf'), None
         for settlement in possible_settlements:
             action = ('Settlement', 1)
@@ -742,9 +1001,26 @@ class WeightedAI(AiPlayer):
       
     
     def pickMove(self, game):
+        found, move = self.ponderedMove(game)
+        if found:
+            return move
+        return self.searchMove(game)
+
+    #The search behind pickMove, which the ponderer also runs on its copy of the game
+    def searchMove(self, game):
         # TODO: Optimize this. Try to avoid using get_successor for cheap/uncomplicated moves
         possible_moves = game.getPossibleActions(self)
         # print "In pick move :", self.resources
+        return self.searchPruned(game, possible_moves, self.scoreMoves)
+
+    def learningState(self):
+        return dict(self.weights)
+
+    def setLearningState(self, state):
+        self.weights = defaultdict(float, state)
+
+    #Fully evaluates every location of every possible move and returns the best move
+    def scoreMoves(self, game, possible_moves):
         bestMoveScore, bestMove = float('-inf'), None
         for possibleMove in possible_moves:
             if not possibleMove: continue
@@ -752,7 +1028,8 @@ class WeightedAI(AiPlayer):
             tempMove = {}
             for action in possibleMove:
                 piece, count = action
-                mostValuableActions = [(action, location, self.evaluateMoveValue(game, (action, location))) for location in possibleMove[action]]
+                values = self.locationValues(game, action, possibleMove[action])
+                mostValuableActions = [(action, location, value) for location, value in zip(possibleMove[action], values)]
                 mostValuableActions.sort(key = lambda a: a[2], reverse = True) # Sort by value
                 totalValueOfAction = sum([mva[2] for mva in mostValuableActions[:count]])
                 scoreForMove += totalValueOfAction
@@ -764,8 +1041,8 @@ class WeightedAI(AiPlayer):
 
 class qAI(WeightedAI):
 
-    def __init__(self,turn_num, name, color, weightsLog):
-        AiPlayer.__init__(self, turn_num, name, color, weightsLog)
+    def __init__(self,turn_num, name, color, weightsLog, rng=None):
+        AiPlayer.__init__(self, turn_num, name, color, weightsLog, rng)
         self.weightsLog = weightsLog
 
         self.weights = defaultdict(float, weightsLog.readDict())
@@ -777,6 +1054,16 @@ class qAI(WeightedAI):
         self.prevFeatures = None
         self.eta = .00000005
 
+        #TD(lambda) learner, see useTd. Without one, the weights are learned by TD(0)
+        self.td = None
+
+        #(features, next features, reward, terminal) of every step of the game, for experience replay
+        self.transitions = []
+
+    #Learn with TD(lambda) from here on instead of TD(0). Arguments go to TdLearner
+    def useTd(self, **tdArgs):
+        self.td = TdLearner(self.weights, **tdArgs)
+
     #Same as superclass feature extractor, but adding some more adversarial features
     def feature_extractor(self, game=None):
         expectedResources = self.expected_resources_per_roll() 
@@ -823,6 +1110,16 @@ class qAI(WeightedAI):
         # print game
         #Get current score
         cur_features = self.feature_extractor(game)
+        if self.prevFeatures:
+            self.transitions.append((self.prevFeatures, cur_features, 0.0, False))
+
+        if self.td is not None:
+            self.td.observe(cur_features)
+            self.td.copyTo(self.weights)
+            self.prevFeatures = cur_features
+            self.prevScore = util.dotProduct(cur_features, self.weights)
+            return
+
         target = util.dotProduct(cur_features, self.weights)
         pred = self.prevScore
         
@@ -846,19 +1143,47 @@ class qAI(WeightedAI):
     def pickMove(self, game):
 
         #Update weights
-        self.updateWeights(game)
+        self.startDecision(game)
 
         return WeightedAI.pickMove(self, game)
 
+    def startDecision(self, game):
+        self.updateWeights(game)
+
+    #The weights, the previous decision's prediction and the TD(lambda) learner, if any
+    def learningState(self):
+        return WeightedAI.learningState(self), self.prevFeatures, self.prevScore, copy.deepcopy(self.td)
+
+    def setLearningState(self, state):
+        weights, self.prevFeatures, self.prevScore, self.td = state
+        WeightedAI.setLearningState(self, weights)
+        self.transitions = []
+
+    #What the value of the final position is trained towards
+    def gameTarget(self):
+        return min(self.score,10)
+
+    #The game's transitions, ending with the one from the last decision to the final target
+    def gameTransitions(self):
+        if not self.prevFeatures:
+            return list(self.transitions)
+        return self.transitions + [(self.prevFeatures, None, self.gameTarget(), True)]
+
     #Does the end game update for each player
     def endGameUpdate(self, game, eta = .000003):
-        target = min(self.score,10)
+        target = self.gameTarget()
+
+        if self.td is not None:
+            diff = self.td.endGame(target)
+            self.td.copyTo(self.weights)
+            self.weightsLog.log_dict(self.weights)
+            return diff
+
         pred = self.prevScore
 
         features = self.prevFeatures
 
         diff = pred - target
-        print self.turn_num, " pred: ", pred, "target: ", target, "diff: ", diff
         for feature, val in features.items():
             # print feature, val,  diff
             self.weights[feature] -= eta * diff * val
@@ -870,15 +1195,27 @@ class qAI(WeightedAI):
         
 class minimax(qAI):
 
-    def __init__(self,turn_num, name, color, weightsLog, depth = 1):
-        qAI.__init__(self, turn_num, name, color, weightsLog)
+    def __init__(self,turn_num, name, color, weightsLog, depth = 1, rng=None):
+        qAI.__init__(self, turn_num, name, color, weightsLog, rng)
         self.depth = depth
 
     def pickMove(self, game, depth = 1):
-        self.updateWeights(game)
+        self.startDecision(game)
+
+        #Opponent responses are computed once per decision and shared between our candidates
+        self.oppMoveCache = {}
+
+        found, move = self.ponderedMove(game)
+        if found:
+            return move
+        return self.searchMove(game)
 
+    def searchMove(self, game):
         possible_moves = game.getPossibleActions(self)
+        return self.searchPruned(game, possible_moves, self.searchMoves)
 
+    #Runs expectimax on the best placement of every possible move and returns the best move
+    def searchMoves(self, game, possible_moves):
         bestMoveScore, bestMove = float('-inf'), None
         for possibleMove in possible_moves:
             if not possibleMove: continue
@@ -894,7 +1231,8 @@ class minimax(qAI):
                 if isinstance(piece[0], tuple):
                     cur_action_list.append((action, None))
                 else:
-                    mostValuableActions = [(action, location, self.evaluateMoveValue(game, (action, location))) for location in possibleMove[action]]
+                    values = self.locationValues(game, action, possibleMove[action])
+                    mostValuableActions = [(action, location, value) for location, value in zip(possibleMove[action], values)]
                     mostValuableActions.sort(key = lambda a: a[2], reverse = True) # Sort by value
                     
                     tempMove[action] = [mva[1] for mva in mostValuableActions[:count]]
@@ -914,13 +1252,18 @@ class minimax(qAI):
 
 class qAI_improved(qAI):
 
+    def gameTarget(self):
+        return int(self.score >= 10)
+
     def endGameUpdate(self, game, eta = .000003):
-        target = int(self.score >= 10)
+        if self.td is not None:
+            return qAI.endGameUpdate(self, game, eta)
+
+        target = self.gameTarget()
         pred = self.prevScore
         features = self.prevFeatures
 
         diff = pred - target
-        print self.turn_num, " pred: ", pred, "target: ", target, "diff: ", diff
         for feature, val in features.items():
             # print feature, val,  diff
             self.weights[feature] -= eta * diff * val
@@ -932,6 +1275,12 @@ class qAI_improved(qAI):
 
 class qAI_more_features(qAI):
 
+    #The features below also count every player's open locations and whether we lead, so every
+    #player's pieces and the leading score go into the key too
+    def getSearcherKey(self, game):
+        pieces = tuple((player.turn_num, self.getPiecesKey(player)) for player in game.players)
+        return (qAI.getSearcherKey(self, game), pieces, game.currMaxScore)
+
     def feature_extractor(self, game):
         expectedResources = self.expected_resources_per_roll() 
         features = expectedResources 
@@ -980,13 +1329,18 @@ class qAI_more_features(qAI):
         return features    
 
 class qAI_more_features_win(qAI_more_features):
+    def gameTarget(self):
+        return int(self.score >= 10)
+
     def endGameUpdate(self, game, eta = .000003):
-        target = int(self.score >= 10)
+        if self.td is not None:
+            return qAI.endGameUpdate(self, game, eta)
+
+        target = self.gameTarget()
         pred = self.prevScore
         features = self.prevFeatures
 
         diff = pred - target
-        print self.turn_num, " pred: ", pred, "target: ", target, "diff: ", diff
         for feature, val in features.items():
             # print feature, val,  diff
             self.weights[feature] -= eta * diff * val
@@ -998,8 +1352,8 @@ class qAI_more_features_win(qAI_more_features):
 
 class BasicStrategy(AiPlayer):
     
-    def __init__(self, turn_num, name, color, log):
-        AiPlayer.__init__(self, turn_num, name, color, log)
+    def __init__(self, turn_num, name, color, log, rng=None):
+        AiPlayer.__init__(self, turn_num, name, color, log, rng)
 
         #These keep track of weights for each resource in the pregame setup
         self.weights_log = Log("../logs/win_test_log_" + str(self.turn_num) +".txt")
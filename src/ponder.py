@@ -0,0 +1,324 @@
+import os
+import copy
+import threading
+import multiprocessing
+import Queue
+import util
+from events import EventStream
+
+'''
+Pondering for AI players. While the other players take their turns, a Ponderer searches the
+positions the AI is likely to face at the start of its own turn (one per dice roll, most likely
+rolls first) and keeps what the search worked out: the move it would pick in each position, the
+values of the placements it evaluated and the opponent responses it guessed. When the AI's turn
+comes, pickMove reuses the move if the real position (after the roll) was pondered. Otherwise it
+searches as usual, starting with the placement values and opponent responses (see
+AiPlayer.evalCache and oppMoveCache) that were already worked out from the same position.
+
+Moves are matched with positionKey. Placement values and responses are matched with the player's
+getEvalKey, which leaves out the cards in hand, so they serve every hand the position comes
+with. Everything is kept with the weights it was worked out with and only reused while the
+player's weights are still the same. Each update hands the worker the player's learning state,
+and the worker makes the same update at the start of its search that a learner (qAI) makes at
+the start of its pickMove, so a learner hits as long as its update comes out the same.
+
+Each Ponderer has one long-lived worker, a process by default or a thread with useProcess off,
+holding one copy of the game made when pondering starts. At the start of every other player's
+turn the engine hands it the records of the game's event stream (see events.py) since the last
+update, and the worker plays them into its copy with a replay.Replayer. Human turns aren't
+recorded, so after one the engine has the worker start over from a new copy.
+
+Nothing waits for the worker. A new update, or the player's own turn coming (pause), makes it
+drop the rest of its round once the position it is on is searched, and whatever it has found is
+picked up from its queue when it is there. A process has a core of its own when there is one
+to spare, and otherwise only the time nobody else wants. Under the GIL a thread takes its time
+from whoever is moving, so it only pays off while the mover is blocked, like a human player
+waiting on input. On one core, the seeded 84 turn minimax game (seed 3, maxRounds 20) takes
+0.15s without pondering, 0.44s pondering in processes and 0.8s in threads.
+'''
+
+# Rolls to ponder, most likely first. 7 is left out since it never produces resources
+PONDER_ROLLS = [6, 8, 5, 9, 4, 10, 3, 11, 2, 12]
+
+# Key for everything pickMove depends on: the player's own slice of the state (the same one
+# AiPlayer.getOppStateKey uses for opponents) plus the opponents' scores and piece counts
+def positionKey(player, game):
+    others = []
+    for opp in game.players:
+        if opp.turn_num != player.turn_num:
+            others.append((opp.turn_num, opp.score, len(opp.roads), len(opp.cities_and_settlements),
+                           sum(len(cards) for cards in opp.devCards.values() if cards),
+                           sum(opp.devCardsPlayed.values())))
+    return (player.getOppStateKey(player, game), player.score, tuple(others))
+
+# The player's weights, to tell whether a move was picked with the weights it has now. Zero
+# weights are left out, since reading a missing feature from a defaultdict adds one
+def weightsKey(player):
+    weights = getattr(player, 'weights', None)
+    if weights is None:
+        return None
+    return tuple(sorted((feature, weight) for feature, weight in weights.items() if weight))
+
+# Moves hold Node objects, which only mean something for one copy of the board. These convert a
+# move to and from (row, col) coordinates so it can be moved between copies
+def encodeMove(move):
+    if not move:
+        return move
+    encoded = {}
+    for action, locations in move.items():
+        piece = action[0]
+        if piece == 'Road':
+            encoded[action] = [tuple((node.row, node.col) for node in road) for road in locations]
+        elif piece in ('Settlement', 'City'):
+            encoded[action] = [(node.row, node.col) for node in locations]
+        else:
+            encoded[action] = None
+    return encoded
+
+def decodeMove(encoded, game):
+    if not encoded:
+        return encoded
+    move = {}
+    for action, locations in encoded.items():
+        piece = action[0]
+        if piece == 'Road':
+            move[action] = [tuple(game.board.getNode(coords) for coords in road) for road in locations]
+        elif piece in ('Settlement', 'City'):
+            move[action] = [game.board.getNode(coords) for coords in locations]
+        else:
+            move[action] = None
+    return move
+
+# Opponent responses (oppMoveCache) are lists of (action, location), converted the same way
+def encodeResponses(responses):
+    encoded = {}
+    for key, actions in responses.items():
+        if actions is not None:
+            actions = [(action, util.locationKey(location)) for action, location in actions]
+        encoded[key] = actions
+    return encoded
+
+def decodeLocation(key, game):
+    if key is None:
+        return None
+    if isinstance(key[0], tuple):
+        return tuple(game.board.getNode(coords) for coords in key)
+    return game.board.getNode(key)
+
+def decodeResponses(encoded, game):
+    responses = {}
+    for key, actions in encoded.items():
+        if actions is not None:
+            actions = [(action, decodeLocation(location, game)) for action, location in actions]
+        responses[key] = actions
+    return responses
+
+# One round of pondering from the position game is in: the player's learning, then a search of
+# the hand they would hold after each roll. found maps (eval key, weights key) to the placement
+# values and opponent responses worked out from there, which every roll shares, and the keys of
+# those already sent. After each position, puts (position key, weights key, encoded move,
+# (eval key, weights key), new values, new encoded responses) on results. Stops early once
+# interrupted() is true
+def ponderPositions(game, player, found, interrupted, results):
+    player.startDecision(game)
+    weights = weightsKey(player)
+    evalKey = (player.getEvalKey(game), weights)
+    if evalKey not in found:
+        found[evalKey] = ({}, {}, set(), set())
+    values, responses, sentValues, sentResponses = found[evalKey]
+    player.evalCache, player.oppMoveCache = values, responses
+
+    seen = set()
+    for roll in PONDER_ROLLS:
+        if interrupted():
+            return
+
+        gained = [(resource, num) for owner, resource, num in game.getRollProduction(roll) if owner is player]
+        for resource, num in gained:
+            player.resources[resource] += num
+            player.numResources += num
+
+        key = positionKey(player, game)
+        if key not in seen:
+            seen.add(key)
+            move = player.searchMove(game)
+            newValues = dict((k, v) for k, v in values.items() if k not in sentValues)
+            newResponses = dict((k, v) for k, v in responses.items() if k not in sentResponses)
+            sentValues.update(newValues)
+            sentResponses.update(newResponses)
+            results.put((key, weights, encodeMove(move), evalKey, newValues, encodeResponses(newResponses)))
+
+        for resource, num in gained:
+            player.resources[resource] -= num
+            player.numResources -= num
+
+# Body of the worker. Plays the updates it receives (records of the event stream, and the
+# player's learning state) into its copy of the game, and ponders from every position it catches
+# up to, unless paused is set or more updates are waiting. Returns when it receives None
+def ponderLoop(game, turn_num, receive, waiting, paused, results, maxCached):
+    from replay import Replayer
+    replayer = Replayer(EventStream(), game)
+    player = game.players[turn_num]
+    found = {}
+    while True:
+        update = receive()
+        if update is None:
+            return
+        records, state = update
+        replayer.extend(EventStream(records))
+        replayer.run()
+        player.setLearningState(state)
+
+        if not waiting() and not paused.is_set():
+            if len(found) >= maxCached:
+                found.clear()
+            ponderPositions(game, player, found, lambda: paused.is_set() or waiting(), results)
+
+# A worker process gets its updates through a pipe, and exits without waiting for the results
+# nobody is going to read. It runs at the lowest priority, so it only gets the time no one else
+# wants, whatever the number of cores
+def ponderProcess(game, turn_num, inbox, paused, results, maxCached):
+    os.nice(19)
+    results.cancel_join_thread()
+    ponderLoop(game, turn_num, inbox.recv, inbox.poll, paused, results, maxCached)
+
+def ponderThread(game, turn_num, inbox, paused, results, maxCached):
+    ponderLoop(game, turn_num, inbox.get, lambda: not inbox.empty(), paused, results, maxCached)
+
+def _noPonderer():
+    return None
+
+# Copy of the game to ponder on. The players' weight logs stay behind: they can hold open files,
+# locks and background writers, and the search never writes to them
+def copyForPondering(game):
+    memo = {}
+    for player in game.players:
+        if getattr(player, 'weightsLog', None) is not None:
+            memo[id(player.weightsLog)] = None
+    return copy.deepcopy(game, memo)
+
+class Ponderer(object):
+    """
+    Runs ponderLoop for one AI player in a background process (or thread, if useProcess is off)
+    and keeps what it finds: moves by position key, placement values and opponent responses by
+    eval key, up to maxCached of each.
+    """
+    def __init__(self, player, useProcess=True, maxCached=1000):
+        self.player = player
+        self.useProcess = useProcess
+        self.maxCached = maxCached
+        self.moves = {}
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.worker = None
+        self.inbox = None
+        self.send = None
+        self.paused = None
+        self.results = None
+        self.sent = 0
+
+    # Copies of the game (for searching, or to send to a worker process) must not take the
+    # ponderer or its worker with them
+    def __deepcopy__(self, memo):
+        return None
+
+    def __reduce__(self):
+        return (_noPonderer, ())
+
+    def isRunning(self):
+        return self.worker is not None
+
+    # Start a worker on a copy of the game as it is now. stream is the game's event stream, which
+    # updates carry on from. A worker process is forked, so the game it starts with is already
+    # its own
+    def start(self, game, stream):
+        self.stop()
+        if self.useProcess:
+            self.inbox, sendEnd = multiprocessing.Pipe(False)
+            self.send = sendEnd.send
+            self.paused = multiprocessing.Event()
+            self.results = multiprocessing.Queue()
+            self.worker = multiprocessing.Process(target=ponderProcess, args=(game, self.player.turn_num, self.inbox,
+                                                                             self.paused, self.results, self.maxCached))
+        else:
+            self.inbox = Queue.Queue()
+            self.send = self.inbox.put
+            self.paused = threading.Event()
+            self.results = Queue.Queue()
+            self.worker = threading.Thread(target=ponderThread, args=(copyForPondering(game), self.player.turn_num,
+                                                                      self.inbox, self.paused, self.results, self.maxCached))
+        self.worker.daemon = True
+        self.worker.start()
+        self.sent = len(stream.data)
+
+    # Hand the worker what happened since the last update and have it ponder from there,
+    # starting one if there is none. A worker whose copy the stream can't bring up to date (it
+    # missed a human's turn) has to be stopped first
+    def update(self, game, stream):
+        if self.worker is None:
+            self.start(game, stream)
+        records = stream.data[self.sent:]
+        self.sent = len(stream.data)
+        self.paused.clear()
+        self.send((records, self.player.learningState()))
+
+    # Have the worker stop pondering once the position it is on is searched. Doesn't wait for it
+    def pause(self):
+        if self.paused is not None:
+            self.paused.set()
+
+    # Shut the worker down. Like pause, it finishes the position it is on and nothing waits for it
+    def stop(self):
+        if self.worker is None:
+            return
+        self.paused.set()
+        self.send(None)
+        self.collect()
+        self.worker, self.inbox, self.send, self.paused, self.results = None, None, None, None, None
+
+    # Pick up whatever the worker has found so far
+    def collect(self):
+        while True:
+            try:
+                key, weights, move, evalKey, values, responses = self.results.get_nowait()
+            except Queue.Empty:
+                return
+            if len(self.moves) >= self.maxCached:
+                self.moves.clear()
+            self.moves[key] = (weights, move)
+            if evalKey not in self.values:
+                if len(self.values) >= self.maxCached:
+                    self.values.clear()
+                self.values[evalKey] = ({}, {})
+            self.values[evalKey][0].update(values)
+            self.values[evalKey][1].update(responses)
+
+    # Returns (found, move) for the current position. The cached move may itself be None (no
+    # purchase), so found tells that apart from a position that was never pondered, or pondered
+    # with other weights. Either way, hands the player the placement values and opponent responses
+    # worked out from this position with its current weights
+    def lookup(self, game):
+        self.pause()
+        if self.results is not None:
+            self.collect()
+        weights = weightsKey(self.player)
+
+        found = self.values.get((self.player.getEvalKey(game), weights))
+        if found is not None:
+            values, responses = found
+            self.player.evalCache = values
+            self.player.oppMoveCache.update(decodeResponses(responses, game))
+
+        key = positionKey(self.player, game)
+        if key not in self.moves:
+            self.misses += 1
+            return False, None
+        moveWeights, move = self.moves.pop(key)
+        if moveWeights != weights:
+            self.stale += 1
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, decodeMove(move, game)
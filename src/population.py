@@ -0,0 +1,255 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import traceback
+import multiprocessing
+from engine import Engine
+from players import Player
+from log import Log
+from registry import writeAtomic
+from rng import GameRandom, deriveSeed, spawnSeeds
+from tournament import matchPlayer, NUM_PLAYERS
+
+'''
+Population based training for WeightedAI. train.py trains WeightedAI by pulling three players
+towards the fourth inside one sequential game at a time. Here a population of size weight sets
+is evolved instead:
+
+- Every generation, the population is shuffled into tables of four, and each table plays a game
+  from every seat rotation, so every member plays every seat. This is repeated rounds times.
+  The games are independent, so they are played in a pool of worker processes.
+- Members are ranked by win rate, then mean score. Early generations stall a lot and many members
+  tie, so remaining ties are broken at random rather than by member id, which would always cull
+  the newest members.
+- The schedule (see Schedule) then replaces the bottom cull fraction with mutated copies of
+  members drawn from the top elite fraction. Mutation adds Gaussian noise of mutation times a
+  weight's size (at least 1) to each weight with probability mutationRate, and the mutation scale
+  decays every generation.
+
+Every generation's ranking is printed and written to report.txt, and every member's weights to
+member<id>.txt, in the output directory; the best member's weights also go to bestWeights.txt
+there. Games, tables and mutations all come from seed, so a run with the same seed is the same
+run with any number of processes.
+
+    python population.py [size] [generations] [processes] [rounds] [outDir] [seed]
+'''
+
+# Engine arguments for population games: stalled games are cut short and given to the leader
+ENGINE_ARGS = {'stallRounds': 20, 'adjudicate': 'score'}
+
+class Schedule(object):
+    """
+    Selection and mutation schedule. For generation g, the bottom cull fraction of the ranking is
+    replaced by children of the top elite fraction, mutated with scale
+    max(mutation * decay ** g, minMutation).
+    """
+    def __init__(self, elite=0.25, cull=0.25, mutation=0.5, decay=0.95, minMutation=0.05, mutationRate=0.3):
+        assert elite + cull <= 1.0
+        self.elite = elite
+        self.cull = cull
+        self.mutation = mutation
+        self.decay = decay
+        self.minMutation = minMutation
+        self.mutationRate = mutationRate
+
+    def mutationScale(self, generation):
+        return max(self.mutation * self.decay ** generation, self.minMutation)
+
+    # Numbers of members kept as parents and replaced, out of size
+    def counts(self, size):
+        return max(1, int(round(self.elite * size))), int(round(self.cull * size))
+
+# Random starting weights, drawn the way WeightedAI draws them for an uninitialized weights log
+def randomWeights(rng):
+    features = Player(0, '0', None).features
+    weights = dict((feature, rng.randint(-3, 3)) for feature in features)
+    weights['Score'] = abs(weights['Score'])
+    weights['Has Won'] = 1000
+    weights['Ratio roads to settlements'] = rng.randint(-5, -3)
+    weights['Squared distance to end'] = rng.randint(-1, 1)
+    return weights
+
+def mutate(weights, scale, rate, rng):
+    child = dict(weights)
+    for feature, weight in weights.items():
+        if feature != 'Has Won' and rng.random() < rate:
+            child[feature] = weight + rng.gauss(0, scale * max(abs(weight), 1.0))
+    return child
+
+# Worker entry point: plays one game and catches any error so that it reaches the trainer
+def playPopulationGame(args):
+    try:
+        return populationGame(*args)
+    except Exception:
+        return {'error': traceback.format_exc()}
+
+# One game between the members in members, in seat order, with the given weights
+def populationGame(members, weights, seed, engineArgs):
+    players = [matchPlayer('WeightedAI', seat, weights[seat]) for seat in range(NUM_PLAYERS)]
+    result = Engine(players, seed=seed, **(engineArgs or {})).main()
+    return {'members': members, 'winner': result['winner'], 'turns': result['turns'],
+            'scores': [result['scores'][seat] for seat in range(NUM_PLAYERS)]}
+
+class PopulationTrainer(object):
+    """
+    Evolves a population of WeightedAI weight sets, see the module docstring. members maps a
+    member id to its weights; without it, size random members are drawn.
+    """
+    def __init__(self, size=16, processes=1, rounds=2, schedule=None, seed=None, members=None,
+                 engineArgs=ENGINE_ARGS, outDir=None):
+        assert size >= NUM_PLAYERS, "A population needs at least %d members" % NUM_PLAYERS
+        self.seed = seed if seed is not None else GameRandom().seed
+        self.processes = processes
+        self.rounds = rounds
+        self.schedule = schedule or Schedule()
+        self.engineArgs = engineArgs
+        self.outDir = outDir
+        self.generation = 0
+
+        rng = random.Random(deriveSeed(self.seed, 'initial'))
+        self.members = members or dict((i, randomWeights(rng)) for i in range(size))
+        self.nextId = max(self.members) + 1
+        self.parents = dict((member, None) for member in self.members)
+        self.born = dict((member, 0) for member in self.members)
+        self.history = []
+
+    # Tables of four for one round: the shuffled population, with the last table filled up
+    # from the start of the shuffle
+    def tables(self, rng):
+        order = sorted(self.members)
+        rng.shuffle(order)
+        short = -len(order) % NUM_PLAYERS
+        order += order[:short]
+        return [order[i:i + NUM_PLAYERS] for i in range(0, len(order), NUM_PLAYERS)]
+
+    # Every game of this generation: each table plays every rotation of its seats
+    def games(self):
+        rng = random.Random(deriveSeed(self.seed, 'tables%d' % self.generation))
+        tables = [table for i in range(self.rounds) for table in self.tables(rng)]
+        seeds = spawnSeeds(deriveSeed(self.seed, 'games%d' % self.generation), len(tables) * NUM_PLAYERS)
+        for i, table in enumerate(tables):
+            for rotation in range(NUM_PLAYERS):
+                members = table[rotation:] + table[:rotation]
+                yield (members, [self.members[member] for member in members], seeds[i * NUM_PLAYERS + rotation],
+                       self.engineArgs)
+
+    def play(self):
+        if self.processes > 1:
+            pool = multiprocessing.Pool(self.processes)
+            try:
+                results = pool.map(playPopulationGame, list(self.games()))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(playPopulationGame, self.games())
+        for result in results:
+            if 'error' in result:
+                raise Exception('Population game failed:\n' + result['error'])
+        return results
+
+    # Members ranked best first, with their records. Ties are broken at random
+    def rank(self, results):
+        rng = random.Random(deriveSeed(self.seed, 'rank%d' % self.generation))
+        tieBreak = dict((member, rng.random()) for member in sorted(self.members))
+        records = dict((member, {'member': member, 'games': 0, 'wins': 0, 'score': 0,
+                                 'parent': self.parents[member], 'born': self.born[member]})
+                       for member in self.members)
+        for result in results:
+            for seat, member in enumerate(result['members']):
+                record = records[member]
+                record['games'] += 1
+                record['score'] += result['scores'][seat]
+                record['wins'] += int(result['winner'] == seat)
+        for record in records.values():
+            record['winRate'] = float(record['wins']) / record['games'] if record['games'] else 0.0
+            record['meanScore'] = float(record['score']) / record['games'] if record['games'] else 0.0
+        return sorted(records.values(), key = lambda r: (-r['winRate'], -r['meanScore'], tieBreak[r['member']]))
+
+    # Replace the bottom of the ranking with mutated children of the top
+    def evolve(self, ranking):
+        rng = random.Random(deriveSeed(self.seed, 'evolve%d' % self.generation))
+        keep, cull = self.schedule.counts(len(ranking))
+        parents = [record['member'] for record in ranking[:keep]]
+        scale = self.schedule.mutationScale(self.generation)
+        for record in ranking[len(ranking) - cull:] if cull else []:
+            parent = rng.choice(parents)
+            child = self.nextId
+            self.nextId += 1
+            del self.members[record['member']]
+            self.members[child] = mutate(self.members[parent], scale, self.schedule.mutationRate, rng)
+            self.parents[child] = parent
+            self.born[child] = self.generation + 1
+
+    # Play one generation, then evolve the population. Returns the generation's ranking
+    def step(self):
+        start = time.time()
+        results = self.play()
+        ranking = self.rank(results)
+        report = {'generation': self.generation, 'games': len(results), 'elapsed': time.time() - start,
+                  'mutation': self.schedule.mutationScale(self.generation),
+                  'meanTurns': float(sum(result['turns'] for result in results)) / len(results),
+                  'ranking': ranking}
+        self.history.append(report)
+        self.save(report)
+        self.evolve(ranking)
+        self.generation += 1
+        return report
+
+    def run(self, generations, onGeneration=None):
+        for i in range(generations):
+            report = self.step()
+            if onGeneration is not None:
+                onGeneration(report)
+        return self.history
+
+    def best(self):
+        return self.history[-1]['ranking'][0]['member'] if self.history else None
+
+    def save(self, report):
+        if self.outDir is None:
+            return
+        if not os.path.isdir(self.outDir):
+            os.makedirs(self.outDir)
+        for member, weights in self.members.items():
+            writeAtomic(os.path.join(self.outDir, 'member%d.txt' % member), json.dumps(weights))
+        for fileName in os.listdir(self.outDir):
+            match = re.match(r'^member(\d+)\.txt$', fileName)
+            if match and int(match.group(1)) not in self.members:
+                os.remove(os.path.join(self.outDir, fileName))
+        best = report['ranking'][0]['member']
+        writeAtomic(os.path.join(self.outDir, 'bestWeights.txt'), json.dumps(self.members[best]))
+        Log(os.path.join(self.outDir, 'report.txt')).append(formatReport(report))
+
+def formatReport(report):
+    lines = ['generation %d: %d games in %.1fs, %.1f turns per game, mutation %.3f' %
+             (report['generation'], report['games'], report['elapsed'], report['meanTurns'], report['mutation']),
+             '  rank  member  parent  born  games  wins  winRate  meanScore']
+    for rank, record in enumerate(report['ranking']):
+        parent = '-' if record['parent'] is None else str(record['parent'])
+        lines.append('  %4d  %6d  %6s  %4d  %5d  %4d  %7.3f  %9.2f' %
+                     (rank + 1, record['member'], parent, record['born'], record['games'], record['wins'],
+                      record['winRate'], record['meanScore']))
+    return '\n'.join(lines)
+
+def printReport(report):
+    print(formatReport(report))
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    generations = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else multiprocessing.cpu_count()
+    rounds = int(sys.argv[4]) if len(sys.argv) > 4 else 2
+    outDir = sys.argv[5] if len(sys.argv) > 5 else 'population'
+    seed = int(sys.argv[6]) if len(sys.argv) > 6 else None
+
+    trainer = PopulationTrainer(size, processes, rounds, seed=seed, outDir=outDir)
+    print('Population of %d, seed %d' % (size, trainer.seed))
+    trainer.run(generations, printReport)
+    print('best: member %d, weights in %s' % (trainer.best(), os.path.join(outDir, 'bestWeights.txt')))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import marshal
+import pstats
+import cProfile
+
+'''
+Opt-in cProfile support for training and tournament runs (--profile). Every game is profiled in
+the process that plays it, the raw stats travel back with the game's result, and the learner or
+tournament merges them into a single ProfileAggregate. write saves the merged stats in pstats
+format along with a text report.
+'''
+
+# Functions whose callers the report lists
+REPORT_CALLERS = ['findResourceCombos', 'updateLongestRoad', 'getPossibleActions', 'evaluateMoveValue']
+
+REPORT_LINES = 40
+
+# Returns fn(*args) and its profile as marshalled pstats data, which pickles cheaply between
+# processes
+def runProfiled(fn, *args):
+    profile = cProfile.Profile()
+    result = profile.runcall(fn, *args)
+    profile.create_stats()
+    return result, marshal.dumps(profile.stats)
+
+# Takes the --profile option out of argv. '--profile' alone profiles to default,
+# '--profile=path' to path. Returns None if the option isn't there
+def popProfileArg(argv, default):
+    for i, arg in enumerate(argv):
+        if arg == '--profile' or arg.startswith('--profile='):
+            del argv[i]
+            return arg.split('=', 1)[1] if '=' in arg else default
+    return None
+
+# pstats.Stats loads anything with create_stats and a stats dict
+class _LoadedProfile(object):
+    def __init__(self, data):
+        self.stats = marshal.loads(data)
+
+    def create_stats(self):
+        pass
+
+class ProfileAggregate(object):
+    """
+    Profiles of many games merged into one pstats.Stats
+    """
+    def __init__(self):
+        self.stats = None
+        self.runs = 0
+
+    def add(self, data):
+        profile = _LoadedProfile(data)
+        if self.stats is None:
+            self.stats = pstats.Stats(profile)
+        else:
+            self.stats.add(profile)
+        self.runs += 1
+
+    def addProfile(self, profile):
+        profile.create_stats()
+        self.add(marshal.dumps(profile.stats))
+
+    # Save the merged stats to path (load them with pstats.Stats(path)) and a report to
+    # path + '.txt': the top functions by cumulative and by own time, and who calls the usual
+    # suspects
+    def write(self, path):
+        if self.stats is None:
+            return
+        self.stats.dump_stats(path)
+        with open(path + '.txt', 'w') as f:
+            stats = pstats.Stats(path, stream=f)
+            f.write('Profile of %d runs\n\n' % self.runs)
+            f.write('Top functions by cumulative time\n')
+            stats.sort_stats('cumulative').print_stats(REPORT_LINES)
+            f.write('Top functions by own time\n')
+            stats.sort_stats('tottime').print_stats(REPORT_LINES)
+            for name in REPORT_CALLERS:
+                stats.sort_stats('cumulative').print_callers(r'\(%s\)' % name)
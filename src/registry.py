@@ -0,0 +1,113 @@
+import os
+import json
+import time
+from log import Log
+
+'''
+Weight sets kept in memory for the length of a training run. Players read and write their
+weights through a Log, and with plain Logs that means parsing the JSON file every time a player
+is built and rewriting it after every update. A WeightRegistry loads each set once, hands out
+copies from memory and keeps a version number per set that goes up with every write. Sets that
+changed are written back every checkpointEvery writes or checkpointSeconds seconds, and on
+checkpoint and close. Each file is written to a temporary file and then renamed over the old
+one, so a crash or a reader never sees half a file. Given a checkpoint.BackgroundWriter, the
+files are written by its thread instead, and close waits for them.
+
+    registry = WeightRegistry(checkpointEvery=200)
+    log = registry.log('WeightedAiWeightsLog0.txt')
+    player = WeightedAI(0, '0', 'orange', log)     # reads from memory
+    ...
+    registry.close()
+'''
+
+class WeightRegistry(object):
+
+    def __init__(self, checkpointEvery=100, checkpointSeconds=None, writer=None):
+        self.checkpointEvery = checkpointEvery
+        self.checkpointSeconds = checkpointSeconds
+        self.writer = writer
+        self.weights = {}
+        self.versions = {}
+        self.dirty = set()
+        self.writes = 0
+        self.lastCheckpoint = time.time()
+
+    # A Log for the weight set saved at path, for players and anything else that takes a Log
+    def log(self, path):
+        return RegistryLog(self, path)
+
+    # A copy of the weights at path, loaded from the file the first time
+    def get(self, path):
+        if path not in self.weights:
+            self.weights[path] = Log(path).readDict()
+            self.versions[path] = 0
+        return dict(self.weights[path])
+
+    def version(self, path):
+        return self.versions.get(path, 0)
+
+    # Replace the weights at path. Returns the new version
+    def put(self, path, weights):
+        self.weights[path] = dict(weights)
+        self.versions[path] = self.versions.get(path, 0) + 1
+        self.dirty.add(path)
+        self.writes += 1
+        if (self.checkpointEvery and self.writes % self.checkpointEvery == 0) or \
+                (self.checkpointSeconds is not None and time.time() - self.lastCheckpoint >= self.checkpointSeconds):
+            self.checkpoint()
+        return self.versions[path]
+
+    # Write every set that changed since the last checkpoint. put replaces a set's dict rather
+    # than changing it, so the writer can be handed the dict itself
+    def checkpoint(self):
+        for path in sorted(self.dirty):
+            if self.writer is not None:
+                self.writer.write(path, writeJson, path, self.weights[path])
+            else:
+                writeJson(path, self.weights[path])
+        self.dirty = set()
+        self.lastCheckpoint = time.time()
+
+    def close(self):
+        self.checkpoint()
+        if self.writer is not None:
+            self.writer.flush()
+
+def writeJson(path, data):
+    writeAtomic(path, json.dumps(data))
+
+# Replace the file at path with text, all at once. The text is on disk before the rename and the
+# rename is on disk before this returns, so after a crash the file is either old or new
+def writeAtomic(path, text):
+    tmpPath = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmpPath, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmpPath, path)
+    syncDirectory(os.path.dirname(path) or '.')
+
+def syncDirectory(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class RegistryLog(Log):
+    """
+    Log view of one weight set in a WeightRegistry. readDict and log_dict go to the registry;
+    the text methods still go to the file.
+    """
+    def __init__(self, registry, path):
+        Log.__init__(self, path)
+        self.registry = registry
+
+    def readDict(self):
+        return self.registry.get(self.filepath)
+
+    def log_dict(self, out_dict):
+        self.registry.put(self.filepath, out_dict)
+
+    def version(self):
+        return self.registry.version(self.filepath)
@@ -0,0 +1,205 @@
+import types
+from engine import Engine
+from players import AiPlayer
+from catanGameBoard import Board, Tile
+from events import *
+
+'''
+Rebuilds games from their event streams (see events.py). A Replayer is an Engine whose players
+never think: placements, trades and cards are applied straight from the stream through the same
+game code the live game used, and whenever that code asks a player to decide something (where
+the robber goes, what to discard or give up, which resource to pick, where Road Building roads
+go) the ReplayPlayer answers with the next record. Nothing is searched, so replaying a game takes
+a small fraction of the time it took to play.
+
+    replayer = Replayer(result['events'])
+    game = replayer.seek(100)     # the position at the start of turn 100
+
+seek only goes forward; start a new Replayer to go back.
+
+A Replayer can also carry on from a game that is already under way, with a stream of what
+happened after it (see extend). The game's own players then take their decisions from the stream.
+That is how ponder.py keeps its copy of a game up to date.
+'''
+
+class ReplayPlayer(AiPlayer):
+    """
+    A seat in a replayed game. Its decisions come from the replayer's stream.
+    """
+    def __init__(self, turn_num, replayer):
+        AiPlayer.__init__(self, turn_num, str(turn_num), None)
+        self.replayer = replayer
+        self.endgameSolver = None
+
+    def moveRobber(self, game, display):
+        record = self.replayer.take(ROBBER)
+        if record is not None:
+            game.set_robber_location(game.board.tiles[record[0]].id, display)
+
+    def over_seven(self):
+        while True:
+            record = self.replayer.take(DISCARD, self.turn_num)
+            if record is None:
+                break
+            self.resources[RESOURCES[record[1]]] -= 1
+            self.numResources -= 1
+            self.numCardsDiscarded += 1
+
+    def give_card(self, oppPlayer):
+        record = self.replayer.take(STEAL, self.turn_num, oppPlayer.turn_num)
+        if record is not None:
+            resource = RESOURCES[record[2]]
+            self.resources[resource] -= 1
+            self.numResources -= 1
+            oppPlayer.resources[resource] += 1
+            oppPlayer.numResources += 1
+
+    def getFavResource(self, giving):
+        record = self.replayer.take(CHOOSE, self.turn_num)
+        assert record is not None, "No resource recorded for player %d" % self.turn_num
+        return RESOURCES[record[1]]
+
+    def pick_road_devcard_ai(self, possRoads):
+        record = self.replayer.take(ROAD, self.turn_num)
+        if record is not None:
+            return self.replayer.road(record)
+
+# The decisions a ReplayPlayer takes from the stream
+DECISIONS = ['moveRobber', 'over_seven', 'give_card', 'getFavResource', 'pick_road_devcard_ai']
+
+# Have any player (one of a copied game's, say) take its decisions from replayer's stream, the way
+# a ReplayPlayer does. Its other methods stay its own
+def followStream(player, replayer):
+    player.replayer = replayer
+    for name in DECISIONS:
+        setattr(player, name, types.MethodType(getattr(ReplayPlayer, name).im_func, player))
+
+class Replayer(Engine):
+    """
+    Replays an EventStream. step applies one record, seek plays on to the start of a turn and run
+    to the end of the stream; self.game is the game as it stands.
+
+    With game given, stream carries on from that game between turns, rather than starting a new
+    one, and its players follow the stream.
+    """
+    def __init__(self, stream, game=None):
+        self.records = stream.records()
+        self.current = None
+        self.turnsStarted = 0
+
+        if game is not None:
+            self.pos = 0
+            for player in game.players:
+                followStream(player, self)
+            Engine.__init__(self, game.players, game=game)
+            return
+
+        kind, args = self.records[0]
+        assert kind == GAME, "An event stream starts with its game record"
+        self.pos = 1
+
+        players = [ReplayPlayer(i, self) for i in range(args[4])]
+        Engine.__init__(self, players, seed=wordsSeed(args[:4]))
+        self.setup()
+
+    # The board comes from the stream's tile records rather than from the seed
+    def generate_board(self):
+        board = Board()
+        self.setTileIds()
+        while self.pos < len(self.records) and self.records[self.pos][0] == TILE:
+            index, resource, value = self.records[self.pos][1]
+            self.pos += 1
+            tile = Tile(RESOURCES[resource], value, RESOURCES[resource] == 'Desert', self.tileIds[index])
+            board.tiles.append(tile)
+            board.setTouchingTiles(tile)
+        assert len(board.tiles) == 19
+        return board
+
+    # Setup placements are ordinary records
+    def first_two_turns(self):
+        pass
+
+    def node(self, code):
+        return self.board.getNode(nodeCoords(code))
+
+    def road(self, record):
+        return (self.node(record[1]), self.node(record[2]))
+
+    # The next record, if it is of this kind and its arguments start with prefix. The players
+    # take the outcomes of their decisions this way
+    def take(self, kind, *prefix):
+        if self.pos < len(self.records):
+            nextKind, args = self.records[self.pos]
+            if nextKind == kind and args[:len(prefix)] == prefix:
+                self.pos += 1
+                return args
+        return None
+
+    def done(self):
+        return self.pos >= len(self.records)
+
+    # Add the records of a stream that carries on from this one
+    def extend(self, stream):
+        self.records.extend(stream.records())
+
+    # Apply the next record
+    def step(self):
+        kind, args = self.records[self.pos]
+        self.pos += 1
+
+        if kind == TURN:
+            self.endTurn()
+            self.current = self.players[args[0]]
+            self.turnsStarted += 1
+            return
+        if kind == ROLL:
+            self.game.distributeResources(args[0], None, self.current)
+            return
+
+        player = self.players[args[0]]
+        if kind == SETTLEMENT:
+            player.place_settlement(self.node(args[1]), self.game, bool(args[2]))
+        elif kind == CITY:
+            player.place_city(self.node(args[1]), self.game)
+        elif kind == ROAD:
+            player.place_road(self.road(args), self.game, bool(args[3]))
+        elif kind == TRADE:
+            self.apply_AI_action(player, ((RESOURCES[args[1]], RESOURCES[args[2]]), args[3]), None)
+        elif kind == BUY:
+            assert self.game.devCards and self.game.devCards[-1] == DEV_CARDS[args[1]], \
+                "The deck doesn't match the stream"
+            self.game.buyDevCard(player)
+        elif kind == DEVCARD:
+            played = self.play_devcard(DEV_CARDS[args[1]], player)
+            assert played, "Player %d has no %s to play" % (args[0], DEV_CARDS[args[1]])
+        elif kind == READY:
+            self.game.updateDevCards(player)
+        else:
+            raise Exception("Unexpected %s record at %d" % (NAMES[kind], self.pos - 1))
+
+    # Close the turn in progress the way the engine does
+    def endTurn(self):
+        if self.current is None:
+            return
+        self.finishTurn(self.current)
+        self.current = None
+
+    # Play on to the start of the given turn (0 is the position after setup), or to the end of the
+    # stream if the game is shorter. Returns the game
+    def seek(self, turn):
+        while not self.done():
+            if self.records[self.pos][0] == TURN and self.turnsStarted == turn:
+                break
+            self.step()
+        self.endTurn()
+        return self.game
+
+    def run(self):
+        while not self.done():
+            self.step()
+        self.endTurn()
+        return self.game
+
+# The game at the start of the given turn
+def replayTo(stream, turn):
+    return Replayer(stream).seek(turn)
@@ -1,107 +1,100 @@
 from log import *
-from play import *
+from engine import *
 from players import *
+from tournament import Tournament
+from train import createPlayer
+from profiling import popProfileArg
 from collections import defaultdict
-import sys 
+import sys
+
+# Compare a trained AI against a baseline
+# python results.py [testName] [baseClass] [testClass] [trainedWeights] [-w baselineWeights] [-p processes] [-n maxGames] [-s weightStore] [--profile[=file]]
+# The test player plays against three baseline players from every seat, in a pool of
+# processes, until the match is decided (see tournament.py). The report goes to testName
+# --profile profiles every game and merges the results into one pstats file (testName.prof by
+# default) with a text report next to it
+# -s puts the weights in a binary weight store at that path, which all the games read from
 
 def main():
-  
-    colors = ['orange', 'red', 'green', 'blue']
 
     # Changes to this may also require changes throughout the rest of the file
     possibleClasses = ['qAI', 'WeightedAI', 'qAI_improved', 'minimax']
 
+    profilePath = popProfileArg(sys.argv, sys.argv[1] + '.prof')
     testName = sys.argv[1]
     baseClass = sys.argv[2]
     testClass = sys.argv[3]
 
     print(testName, baseClass, testClass)
     assert baseClass in possibleClasses and testClass in possibleClasses
-  
+
     # Should take in a trained weights filename created via train.py as the 4th argument
     assert len(sys.argv) >= 5
     trainedWeightsLog = Log(sys.argv[4])
 
+    options = dict(zip(sys.argv[5::2], sys.argv[6::2]))
+    processes = int(options.get('-p', 1))
+    maxGames = int(options.get('-n', 2000))
+    weightStore = options.get('-s')
+
     # Set the baseline weights that we are comparing against. Can either be randomized or
     # defined by us
-    
+
     # If we are using user-defined baseline weights, then pass -w as the fourth argument
-    weightLogSpecified = len(sys.argv) == 7 and sys.argv[5] == '-w'
+    weightLogSpecified = '-w' in options
 
     # If the -w flag is set, then an argument should also be passed with the name
     # of the user-defined weight file
     if weightLogSpecified:
         print('weight log specified')
-        baselineWeights = [Log(sys.argv[6])] * 4
+        baselineWeights = [Log(options['-w'])] * 4
     else:
         # Create new random weights for each of the baseline AIs
         # These will be randomized in players.py as we've been doing
         baselineWeights = [Log('BaselineAiWeightsLog%s.txt' % i) for i in range(4)]
         for i in range(4):
             baselineWeights[i].log_dict({'DELETE ME': -1})
-  
-    dump = Log(testName)
+
+    dump = BufferedLog(testName)
     dump.log('Test: ' + str(testName))
     dump.append('Base class: ' + str(baseClass))
     dump.append('Test class: ' + str(testClass))
     dump.append_dict(trainedWeightsLog.readDict())
     dump.append('\n')
 
-    aggregateWins = 0
-    aggregateGames = 0
-
-    # Run the test player 100 times starting from each of the 4 different turn orders
-    for i in range(4):
-        
-        print('i = ' + str(i))     
-        
-        def createPlayers():
-            players = [] 
-            
-            # Initialize all 4 players of type 'base class'
-            if baseClass == 'qAI':
-                players = [qAI(j, str(j), colors[j], baselineWeights[j]) for j in range(4)]
-            elif baseClass == 'WeightedAI':
-                players = [WeightedAI(j, str(j), colors[j], baselineWeights[j]) for j in range(4)]
-            elif baseClass == 'qAI_improved':
-                players = [qAI_win(j, str(j), colors[j], baselineWeights[j]) for j in range(4)]
-            elif baseClass == 'minimax':
-                players = [qAI_minimax(j, str(j), colors[j], baselineWeights[j]) for j in range(4)]
-                
-
-            # Overwrite 1 player of type 'test class' to start in position i
-            if testClass == 'qAI':
-                players[i] = qAI(i, str(i), colors[i], trainedWeightsLog) 
-            elif testClass == 'WeightedAI':
-                players[i] = WeightedAI(i, str(i), colors[i], trainedWeightsLog) 
-            elif testClass == 'qAI_improved':
-                players[i] = qAI_win(i, str(i), colors[i], trainedWeightsLog) 
-            elif testClass == 'minimax':
-                players[i] = qAI_minimax(i, str(i), colors[i], trainedWeightsLog) 
-            return players
-
-        winners = {p:0 for p in range(4)}
-        for _ in range(25):
-            play = Play(createPlayers())
-            play.main()
-            
-            for player in play.players:
-                if player.score >= 10:
-                    winners[player.turn_num] += 1
-        print('updating aggregate wins')
-        aggregateWins += winners[i]
-        aggregateGames += 25 # Ignore that some games may not have had a winner
-    
-        dump.append('With starting position ' + str(i) + ':')
-        dump.append_dict(winners)
-        dump.append('\n')
-    
+    # Building the players once fills in any placeholder weights, the games themselves get
+    # copies of the weights
+    baseWeights = dict((i, dict(createPlayer(baseClass, i, i, baselineWeights[i]).weights)) for i in range(4))
+    testWeights = dict(createPlayer(testClass, 0, 0, trainedWeightsLog).weights)
+
+    def progress(report):
+        if report['games'] % 25 == 0:
+            print('%d games, %d wins, %d draws, win rate %.3f [%.3f, %.3f]' %
+                  (report['games'], report['wins'], report['draws'], report['winRate'], report['low'], report['high']))
+
+    tournament = Tournament(baseClass, testClass, baseWeights, testWeights, processes=processes,
+                            maxGames=maxGames, onGame=progress, profile=profilePath is not None,
+                            weightStore=weightStore)
+    report = tournament.run()
+    if profilePath:
+        tournament.profile.write(profilePath)
+
     print('final logging')
+    for seat in range(4):
+        dump.append('With starting position ' + str(seat) + ':')
+        dump.append_dict(report['bySeat'][seat])
+        dump.append('\n')
+
     dump.append('\n')
     dump.append('Aggregate from each of 4 starting positions:')
-    dump.append(str(aggregateWins) + ' wins')
-    dump.append(str(aggregateGames) + ' games')
-    dump.append(str(aggregateWins * 1.0 / aggregateGames) + ' win percentage for test class')
+    dump.append(str(report['wins']) + ' wins')
+    dump.append(str(report['decisive']) + ' games with a winner, ' + str(report['draws']) + ' without')
+    dump.append(str(report['winRate']) + ' win percentage for test class')
+    dump.append('Verdict: ' + report['verdict'] + ' (' + str(report['stopReason']) + ')')
+    dump.append_dict(report)
+    dump.append('\n')
+    dump.close()
+    print('verdict: %s after %d games (%s)' % (report['verdict'], report['games'], report['stopReason']))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,49 @@
+import random
+import hashlib
+
+'''
+Seeded random number streams for a game. Every game owns a GameRandom, and everything random
+in it draws from one of its streams: dice, board layout, the dev card deck, and one stream per
+player for the AI's own choices. Streams are derived from the game seed and their name, so they
+don't depend on each other: an agent that makes an extra random choice doesn't change the dice,
+and the same seed always plays the same game.
+
+Nothing here touches the global random module, so several games can run side by side in one
+process or thread.
+'''
+
+# Derive an independent seed from a parent seed and a name
+def deriveSeed(seed, name):
+    digest = hashlib.sha256('%s:%s' % (seed, name)).hexdigest()
+    return int(digest[:16], 16)
+
+# Seeds for n games (or worker processes) from one master seed
+def spawnSeeds(seed, n):
+    return [deriveSeed(seed, 'game%d' % i) for i in range(n)]
+
+# Stream for a player to draw from when it is built, before a game gives it one of its own (see
+# Player's rng argument), e.g. for random starting weights. Unseeded if seed is None
+def playerRandom(seed, seat):
+    if seed is None:
+        return random.Random()
+    return random.Random(deriveSeed(seed, 'player%d' % seat))
+
+class GameRandom(object):
+    """
+    The random streams of a single game. With no seed, one is drawn from the system's entropy
+    source and kept in self.seed, so any game can be replayed afterwards.
+    """
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = random.SystemRandom().randint(0, 2 ** 63 - 1)
+        self.seed = seed
+        self.dice = random.Random(deriveSeed(seed, 'dice'))
+        self.board = random.Random(deriveSeed(seed, 'board'))
+        self.deck = random.Random(deriveSeed(seed, 'deck'))
+        self.agents = {}
+
+    # Stream for the player with this turn_num
+    def agent(self, turn_num):
+        if turn_num not in self.agents:
+            self.agents[turn_num] = random.Random(deriveSeed(self.seed, 'agent%d' % turn_num))
+        return self.agents[turn_num]
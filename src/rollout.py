@@ -0,0 +1,209 @@
+import sys
+import copy
+import multiprocessing
+from collections import defaultdict
+from players import AiPlayer
+from engine import Engine
+from rng import GameRandom, spawnSeeds
+from util import wilsonInterval
+
+'''
+Monte Carlo estimate of each player's chance of winning from a given position.
+
+estimate_win_probability copies the game, swaps every player for a RolloutPlayer (a cheap
+greedy policy) and plays n_rollouts games out on the Engine, to 10 points or its round cap.
+Win rates come back with Wilson confidence intervals. Rollouts can be spread across worker
+processes, and a seed makes the estimate reproducible: the same seed gives the same estimate
+with any number of processes.
+
+The greedy policy is weak, so a good share of rollouts (over a third, from some positions) reach
+the round cap without a winner. By default they count as draws and nobody's win; with
+adjudicate='score' (or any Engine adjudicator) they go to whoever the adjudicator picks, which
+can change the estimate a lot. Either way 'capped' says how many rollouts hit the cap.
+
+Run on its own, this checks that the estimate from a seeded position comes out the same played
+in one process and in a pool:
+
+    python rollout.py [n_rollouts] [processes] [seed]
+'''
+
+# Round cap, the same as in a normal game
+MAX_ROUNDS = 150
+
+class RolloutPlayer(AiPlayer):
+    """
+    Fast policy used to play out rollouts. Buys whatever scores the most points this turn
+    (settlements and cities first, then dev cards) and places pieces at random.
+    """
+    def pickMove(self, game):
+        possible_moves = game.getPossibleActions(self)
+
+        best, bestValue = [], -1
+        for move in possible_moves:
+            value = 0
+            if move:
+                for piece, count in move:
+                    if piece in ('Settlement', 'City'):
+                        value += 2 * count
+                    elif piece == 'buyDevCard':
+                        value += 1
+            if value > bestValue:
+                best, bestValue = [move], value
+            elif value == bestValue:
+                best.append(move)
+
+        move = self.rng.choice(best)
+        if not move: return move
+
+        for action, locations in move.items():
+            piece, count = action
+            if isinstance(piece, tuple) or piece == 'buyDevCard':
+                move[action] = None
+            else:
+                move[action] = self.rng.sample(locations, count)
+        return move
+
+# Turn a copy of any player, human or AI, into a RolloutPlayer in place. Dev cards keep a
+# reference to their owner, so the object itself has to stay the same
+def toRolloutPlayer(player):
+    template = RolloutPlayer(player.turn_num, player.name, player.color)
+    for attr, value in template.__dict__.items():
+        if attr not in player.__dict__:
+            setattr(player, attr, value)
+    player.__class__ = RolloutPlayer
+    player.isAI = True
+    player.endgameSolver = None
+    player.ponderer = None
+
+# Copy the game for rollouts. Weights, logs and search caches are only used by the players'
+# own evaluators, which rollouts never call, so they are shared instead of copied
+def copyForRollout(game):
+    memo = {}
+    for player in game.players:
+        for attr in ('weights', 'weightsLog', 'oppMoveCache', 'evalCache', 'endgameSolver', 'ponderer'):
+            value = getattr(player, attr, None)
+            if value is not None:
+                memo[id(value)] = value
+    gameCopy = copy.deepcopy(game, memo)
+    for player in gameCopy.players:
+        toRolloutPlayer(player)
+    return gameCopy
+
+# Play a copied game to the end, starting with turn turnNum. Returns the turn_num of the winner,
+# or None if nobody reached 10 points before the round cap (and the adjudicator, if any, picked
+# nobody), and whether the game hit the round cap
+def playout(game, turnNum, maxRounds, seed, adjudicate=None):
+    engine = Engine(game.players, game=game, maxRounds=maxRounds, seed=seed, adjudicate=adjudicate)
+    engine.turnNum = turnNum
+    result = engine.run()
+    return result['winner'], result['endReason'] == 'maxRounds'
+
+# Run a batch of rollouts, one per seed, and count the winners and the games that hit the cap
+def runRollouts(args):
+    game, turnNum, maxRounds, adjudicate, seeds = args
+    wins, capped = defaultdict(int), 0
+    for seed in seeds:
+        winner, hitCap = playout(copyForRollout(game), turnNum, maxRounds, seed, adjudicate)
+        wins[winner] += 1
+        capped += int(hitCap)
+    return dict(wins), capped
+
+def estimate_win_probability(game, player, n_rollouts, seed=None, processes=1, turnNum=None, maxRounds=MAX_ROUNDS,
+                             adjudicate=None):
+    """
+    Estimate every player's chance of winning, assuming it is player's turn to roll.
+
+    turnNum is the Engine.turnNum of that turn, so the round cap lines up with the real game;
+    by default the rollouts get the full 150 rounds. adjudicate is passed to the Engine of every
+    rollout, to decide the ones that hit the round cap (see the module docstring). Returns a dict
+    with the number of rollouts, the number that hit the round cap ('capped'), the number that
+    ended without a winner ('draws'), and for each player's turn_num a dict of wins, win rate
+    and the low and high ends of a 95% confidence interval.
+    """
+    if seed is None:
+        seed = GameRandom().seed
+
+    # The engine moves game.players[turnNum % 4], so round turnNum up to the next turn that is
+    # player's
+    numPlayers = len(game.players)
+    first = [p.turn_num for p in game.players].index(player.turn_num)
+    if turnNum is None:
+        turnNum = first
+    turnNum += (first - turnNum) % numPlayers
+
+    seeds = spawnSeeds(seed, n_rollouts)
+    args = (copyForRollout(game), turnNum, maxRounds, adjudicate)
+
+    if processes > 1:
+        chunks = [seeds[i::processes] for i in range(processes)]
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(runRollouts, [args + (chunk,) for chunk in chunks if chunk])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [runRollouts(args + (seeds,))]
+
+    wins, capped = defaultdict(int), 0
+    for result, resultCapped in results:
+        capped += resultCapped
+        for winner, count in result.items():
+            wins[winner] += count
+
+    estimate = {'rollouts': n_rollouts, 'capped': capped, 'draws': wins[None], 'players': {}}
+    for p in game.players:
+        low, high = wilsonInterval(wins[p.turn_num], n_rollouts)
+        estimate['players'][p.turn_num] = {'wins': wins[p.turn_num],
+                                           'winRate': float(wins[p.turn_num]) / n_rollouts if n_rollouts else 0.0,
+                                           'low': low, 'high': high}
+    return estimate
+
+class RolloutAdjudicator(object):
+    """
+    Adjudicator for Engine(adjudicate=...). Gives a game that stopped without a winner to the
+    player with the best estimated chance of winning it within extraRounds more rounds, or to
+    nobody if no rollout is won or the best chance is shared. It is a plain object rather than a
+    function so that it can be sent to worker processes along with the other Engine arguments.
+    """
+    def __init__(self, n_rollouts, extraRounds=50, processes=1):
+        self.n_rollouts = n_rollouts
+        self.extraRounds = extraRounds
+        self.processes = processes
+
+    def __call__(self, engine):
+        maxRounds = engine.turnNum / engine.num_players + self.extraRounds
+        estimate = estimate_win_probability(engine.game, engine.currentPlayer(), self.n_rollouts,
+                                            seed=engine.rng.seed, processes=self.processes,
+                                            turnNum=engine.turnNum, maxRounds=maxRounds)
+        wins = [(result['wins'], turn_num) for turn_num, result in estimate['players'].items()]
+        best = max(count for count, turn_num in wins)
+        leaders = [turn_num for count, turn_num in wins if count == best]
+        return leaders[0] if best > 0 and len(leaders) == 1 else None
+
+# Estimate the chances from turns turns into a seeded game, in one process and in processes,
+# and check that the two agree
+def checkProcesses(n_rollouts=12, processes=2, seed=1, turns=8, maxRounds=40):
+    from benchmarks.positions import benchmarkPlayers
+    engine = Engine(benchmarkPlayers(), seed=seed)
+    engine.setup()
+    for i in range(turns):
+        engine.play_turn()
+
+    estimates = [estimate_win_probability(engine.game, engine.currentPlayer(), n_rollouts, seed=seed,
+                                          processes=count, turnNum=engine.turnNum, maxRounds=maxRounds)
+                 for count in (1, processes)]
+    for count, estimate in zip((1, processes), estimates):
+        wins = dict((turn_num, result['wins']) for turn_num, result in estimate['players'].items())
+        print('%d process(es): wins %s, draws %d, capped %d' % (count, wins, estimate['draws'], estimate['capped']))
+    assert estimates[0] == estimates[1], "The estimate depends on the number of processes"
+    print('Estimates match')
+
+def main():
+    n_rollouts = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    checkProcesses(n_rollouts, processes, seed)
+
+if __name__ == '__main__':
+    main()
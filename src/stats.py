@@ -0,0 +1,39 @@
+import time
+from collections import defaultdict
+
+'''
+Lightweight timing and counters for the game loop and the agents. The Engine keeps one Stats per
+player and points game.stats at the one for the player whose turn it is, so everything the
+agents' code records (move generation, evaluations, do_move/undo_move, search nodes) is charged
+to the agent doing the work. Timing happens around whole phases of a turn ('search' is the whole
+of pickMove, 'devCards', 'apply' and so on); the tight loops inside them (move generation,
+evaluations, do_move/undo_move) only count, so it is cheap enough to leave on.
+'''
+
+class Stats(object):
+    """
+    Seconds per phase and a count per event. Copies of a game (search copies, ponder and rollout
+    copies) start with an empty Stats, so their work is not charged to the real game.
+    """
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def __deepcopy__(self, memo):
+        return Stats()
+
+    # Add the time since start (a time.time() value) to phase
+    def addTime(self, phase, start):
+        self.times[phase] += time.time() - start
+
+    def count(self, event, n=1):
+        self.counts[event] += n
+
+    def merge(self, other):
+        for phase, seconds in other.times.items():
+            self.times[phase] += seconds
+        for event, n in other.counts.items():
+            self.counts[event] += n
+
+    def asDict(self):
+        return {'times': dict(self.times), 'counts': dict(self.counts)}
@@ -0,0 +1,103 @@
+import numpy as np
+
+'''
+TD(lambda) learning of linear evaluator weights, for the qAI players. qAI.updateWeights does
+TD(0) on feature dicts: every decision only corrects the one before it, so the end of game
+signal crawls back one decision per game. A TdLearner keeps the weights and an eligibility trace
+as NumPy arrays; each decision decays the trace and adds the previous feature vector to it, and
+the TD error updates every weight in the trace at once:
+
+    e = gamma * lambda * e + x(t-1)
+    delta = gamma * v(t) - v(t-1)        (at the end of the game: target - v(t-1))
+    w = w + alpha * delta * e
+
+Feature dicts are turned into vectors over the learner's feature names, which grow as new
+features turn up. The step size alpha comes from a schedule:
+
+- 'constant': stepSize
+- 'inverse': stepSize / (1 + games / halfLife), falling as training goes on
+- 'normalized': stepSize / (x . x), like normalized LMS, which keeps steps sane whatever the
+  scale of the features (a few of them run into the hundreds)
+'''
+
+SCHEDULES = ['constant', 'inverse', 'normalized']
+
+class TdLearner(object):
+    """
+    TD(lambda) learner for one player's game, starting from the weights dict weights. games is the
+    number of training games played before this one, for the 'inverse' schedule.
+    """
+    def __init__(self, weights, lam=0.7, gamma=1.0, stepSize=0.01, schedule='normalized', halfLife=1000.0, games=0):
+        assert schedule in SCHEDULES, "Unknown step size schedule " + schedule
+        self.lam = lam
+        self.gamma = gamma
+        self.stepSize = stepSize
+        self.schedule = schedule
+        self.halfLife = halfLife
+        self.games = games
+
+        self.names = list(weights.keys())
+        self.index = dict((name, i) for i, name in enumerate(self.names))
+        self.weights = np.array([weights[name] for name in self.names], dtype=np.float64)
+        self.trace = np.zeros(len(self.names))
+        self.prev = None
+        self.steps = 0
+
+    # Feature dict as a vector over self.names, adding any feature not seen before
+    def vector(self, features):
+        for name in features:
+            if name not in self.index:
+                self.index[name] = len(self.names)
+                self.names.append(name)
+        if len(self.names) > len(self.weights):
+            grow = len(self.names) - len(self.weights)
+            self.weights = np.concatenate([self.weights, np.zeros(grow)])
+            self.trace = np.concatenate([self.trace, np.zeros(grow)])
+            if self.prev is not None:
+                self.prev = np.concatenate([self.prev, np.zeros(grow)])
+        x = np.zeros(len(self.names))
+        x[[self.index[name] for name in features]] = [float(value) for value in features.values()]
+        return x
+
+    def value(self, x):
+        return np.dot(self.weights, x)
+
+    def alpha(self, x):
+        if self.schedule == 'inverse':
+            return self.stepSize / (1.0 + self.games / self.halfLife)
+        if self.schedule == 'normalized':
+            return self.stepSize / max(np.dot(x, x), 1.0)
+        return self.stepSize
+
+    # Move the value of the previous decision towards target. Returns the TD error
+    def update(self, target):
+        delta = target - self.value(self.prev)
+        self.trace *= self.gamma * self.lam
+        self.trace += self.prev
+        self.weights += self.alpha(self.prev) * delta * self.trace
+        self.steps += 1
+        return delta
+
+    # A decision with these features: learn from the step since the last one. Returns the TD
+    # error, or None for the first decision of the game
+    def observe(self, features):
+        x = self.vector(features)
+        delta = None
+        if self.prev is not None:
+            delta = self.update(self.gamma * self.value(x))
+        self.prev = x
+        return delta
+
+    # The game is over and worth target. Returns the previous prediction minus target, as
+    # qAI.endGameUpdate does, or None if there was no decision to learn from
+    def endGame(self, target):
+        if self.prev is None:
+            return None
+        delta = self.update(target)
+        self.prev = None
+        self.trace[:] = 0.0
+        return -delta
+
+    # Copy the weights into the weights dict d
+    def copyTo(self, d):
+        d.update(zip(self.names, self.weights.tolist()))
@@ -1,4 +1,5 @@
-from play import *
+from engine import *
+from log import Log
 from collections import defaultdict
 
 '''
@@ -30,7 +31,7 @@ eval_score_wins = 0
 
 
 for i in range(runs):
-    play = Play(weightLogs)
+    play = Engine(weightLogs)
     play.main()
 
     # if not winners:
@@ -0,0 +1,232 @@
+import math
+import time
+import itertools
+import traceback
+import multiprocessing
+from collections import defaultdict
+from engine import Engine
+from log import DictLog
+from rng import GameRandom, spawnSeeds
+from train import createPlayer
+from util import wilsonInterval
+from profiling import ProfileAggregate, runProfiled
+from weightstore import WeightStore, StoredWeights
+
+'''
+Match runner for A/B comparisons. One test player plays against three baseline players, taking
+each seat in turn, and games are played in a pool of worker processes. Results are streamed back
+in game order and the match stops as soon as it is decided:
+
+- Only games with a winner count. Between players of equal strength the test player wins a
+  quarter of them, so its win rate is compared against p0 = 1/4.
+- Two SPRTs run side by side, one for "stronger" (p0 + delta against p0) and one for "weaker"
+  (p0 - delta against p0). The match is decided when either accepts its alternative, and is a
+  draw when both accept p0, i.e. any difference is smaller than delta.
+- Otherwise the match ends after maxGames. The report carries a 95% interval on the win rate
+  either way; it is not used for stopping, since checking an interval after every game stops
+  on noise far more often than 5% of the time.
+
+Game seeds come from the match seed and are handed out in order, so a match with the same seed
+plays the same games and stops at the same point with any number of workers.
+'''
+
+NUM_PLAYERS = 4
+
+class Sprt(object):
+    """
+    Wald's sequential probability ratio test of p1 against p0 for a Bernoulli rate. update adds one
+    outcome; decision is 'H1', 'H0' or None while the test is still running. Once decided, later
+    outcomes are ignored.
+    """
+    def __init__(self, p0, p1, alpha=0.05, beta=0.05):
+        self.winLlr = math.log(p1 / p0)
+        self.lossLlr = math.log((1 - p1) / (1 - p0))
+        self.upper = math.log((1 - beta) / alpha)
+        self.lower = math.log(beta / (1 - alpha))
+        self.llr = 0.0
+
+    def update(self, won):
+        if self.decision() is not None:
+            return
+        self.llr += self.winLlr if won else self.lossLlr
+
+    def decision(self):
+        if self.llr >= self.upper:
+            return 'H1'
+        if self.llr <= self.lower:
+            return 'H0'
+        return None
+
+# Worker entry point: plays one game of the match, under cProfile if profile is set, and catches
+# any error so that it reaches the tournament
+def playMatchGame(args):
+    gameArgs, profile = args[:-1], args[-1]
+    try:
+        if not profile:
+            return matchGame(*gameArgs)
+        result, profileData = runProfiled(matchGame, *gameArgs)
+        result['profile'] = profileData
+        return result
+    except Exception:
+        return {'error': traceback.format_exc()}
+
+# Build a player of the match. weights is either a dict, or a StoredWeights that the player reads
+# from the shared weight store
+def matchPlayer(playerClass, seat, weights):
+    if isinstance(weights, StoredWeights):
+        player = createPlayer(playerClass, seat, seat, DictLog())
+        player.weights = weights.view()
+        return player
+    return createPlayer(playerClass, seat, seat, DictLog(weights))
+
+# Play one game of the match. The test player takes testSeat, the baseline players the other
+# seats. Weights come in as dicts or StoredWeights so that nothing is read from or written to a
+# weights file
+def matchGame(baseClass, testClass, baseWeights, testWeights, testSeat, seed, engineArgs):
+    players = []
+    for seat in range(NUM_PLAYERS):
+        if seat == testSeat:
+            players.append(matchPlayer(testClass, seat, testWeights))
+        else:
+            players.append(matchPlayer(baseClass, seat, baseWeights[seat]))
+    result = Engine(players, seed=seed, **(engineArgs or {})).main()
+    return {'seat': testSeat, 'seed': seed, 'winner': result['winner'], 'turns': result['turns'],
+            'endReason': result['endReason'], 'testScore': result['scores'][testSeat]}
+
+class Tournament(object):
+    """
+    Runs a match of testClass with testWeights against baseClass with baseWeights (one dict per
+    seat) and returns a report, see run. onGame, if given, is called with the report so far after
+    every game. With profile set, every game is profiled and the merged profile is kept in
+    self.profile (a ProfileAggregate). engineArgs are passed on to every game's Engine, for
+    stall detection, time limits or adjudication.
+
+    With weightStore set to a path, the weights are written to a binary weight store there
+    (see weightstore.py) and every game's players read them from it, instead of each game
+    carrying its own copy of the dicts.
+    """
+    def __init__(self, baseClass, testClass, baseWeights, testWeights, processes=1, seed=None,
+                 maxGames=2000, delta=0.05, alpha=0.05, beta=0.05, onGame=None, profile=False,
+                 engineArgs=None, weightStore=None):
+        self.baseClass = baseClass
+        self.testClass = testClass
+        self.baseWeights = baseWeights
+        self.testWeights = testWeights
+        if weightStore is not None:
+            sets = dict(('base%d' % seat, weights) for seat, weights in baseWeights.items())
+            sets['test'] = testWeights
+            WeightStore.create(weightStore, sets)
+            self.baseWeights = dict((seat, StoredWeights(weightStore, 'base%d' % seat)) for seat in baseWeights)
+            self.testWeights = StoredWeights(weightStore, 'test')
+        self.processes = processes
+        self.seed = seed if seed is not None else GameRandom().seed
+        self.maxGames = maxGames
+        self.delta = delta
+        self.onGame = onGame
+        self.engineArgs = engineArgs
+        self.profile = ProfileAggregate() if profile else None
+
+        self.p0 = 1.0 / NUM_PLAYERS
+        self.stronger = Sprt(self.p0, self.p0 + delta, alpha, beta)
+        self.weaker = Sprt(self.p0, self.p0 - delta, alpha, beta)
+
+        self.games = 0
+        self.wins = 0
+        self.draws = 0
+        self.turns = 0
+        self.bySeat = dict((seat, {'games': 0, 'wins': 0, 'draws': 0}) for seat in range(NUM_PLAYERS))
+        self.endReasons = defaultdict(int)
+        self.verdict = None
+        self.stopReason = None
+        self.start = None
+
+    def gameArgs(self):
+        seeds = spawnSeeds(self.seed, self.maxGames)
+        for i in range(self.maxGames):
+            yield (self.baseClass, self.testClass, self.baseWeights, self.testWeights, i % NUM_PLAYERS, seeds[i],
+                   self.engineArgs, self.profile is not None)
+
+    # Play games until the match is decided. Returns the report
+    def run(self):
+        self.start = time.time()
+        if self.processes > 1:
+            pool = multiprocessing.Pool(self.processes)
+            results = pool.imap(playMatchGame, self.gameArgs())
+        else:
+            pool = None
+            results = itertools.imap(playMatchGame, self.gameArgs())
+
+        try:
+            for result in results:
+                if 'error' in result:
+                    raise Exception('Match game failed:\n' + result['error'])
+                if self.profile is not None:
+                    self.profile.add(result.pop('profile'))
+                self.addResult(result)
+                if self.onGame is not None:
+                    self.onGame(self.report())
+                if self.verdict is not None:
+                    break
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        if self.verdict is None:
+            self.verdict, self.stopReason = 'undecided', 'max games'
+        return self.report()
+
+    def addResult(self, result):
+        seat = result['seat']
+        self.games += 1
+        self.turns += result['turns']
+        self.endReasons[result['endReason']] += 1
+        self.bySeat[seat]['games'] += 1
+
+        if result['winner'] is None:
+            self.draws += 1
+            self.bySeat[seat]['draws'] += 1
+            return
+
+        won = result['winner'] == seat
+        if won:
+            self.wins += 1
+            self.bySeat[seat]['wins'] += 1
+        self.stronger.update(won)
+        self.weaker.update(won)
+        self.checkStop()
+
+    def checkStop(self):
+        stronger, weaker = self.stronger.decision(), self.weaker.decision()
+        if stronger == 'H1':
+            self.verdict, self.stopReason = 'stronger', 'sprt'
+        elif weaker == 'H1':
+            self.verdict, self.stopReason = 'weaker', 'sprt'
+        elif stronger == 'H0' and weaker == 'H0':
+            self.verdict, self.stopReason = 'equal', 'sprt'
+
+    def report(self):
+        decisive = self.games - self.draws
+        low, high = wilsonInterval(self.wins, decisive)
+        elapsed = time.time() - self.start
+        return {'baseClass': self.baseClass,
+                'testClass': self.testClass,
+                'seed': self.seed,
+                'games': self.games,
+                'decisive': decisive,
+                'wins': self.wins,
+                'draws': self.draws,
+                'winRate': float(self.wins) / decisive if decisive else 0.0,
+                'low': low,
+                'high': high,
+                'p0': self.p0,
+                'delta': self.delta,
+                'llrStronger': self.stronger.llr,
+                'llrWeaker': self.weaker.llr,
+                'verdict': self.verdict,
+                'stopReason': self.stopReason,
+                'bySeat': self.bySeat,
+                'endReasons': dict(self.endReasons),
+                'meanTurns': float(self.turns) / self.games if self.games else 0.0,
+                'elapsed': elapsed,
+                'gamesPerSec': self.games / elapsed if elapsed > 0 else 0.0}
@@ -1,47 +1,227 @@
-from play import *
+from engine import *
 from players import *
 from log import *
+from registry import WeightRegistry
+from checkpoint import Checkpointer, BackgroundWriter, randomState, setRandomState, intKeys
+from experience import SeatReplay
+from weightstore import WeightStore, StoredWeights
+from rng import GameRandom, spawnSeeds, playerRandom
+from profiling import ProfileAggregate, runProfiled, popProfileArg
 from collections import defaultdict
-import sys 
+import multiprocessing
+import traceback
+import cProfile
+import random
+import Queue
+import time
+import sys
 import numpy as np
 
 # Framework to train an AI
-# python train.py [AI type] [numIters]
+# python train.py [AI type] [numIters] [numWorkers] [maxStaleness] [reportEvery] [--profile[=file]]
+#                  [--checkpoint[=dir]] [--resume[=dir]] [--checkpoint-every=games]
+#                  [--td[=lambda[,stepSize[,schedule]]]] [--replay[=capacity[,batchSize[,updates[,stepSize]]]]]
+#                  [--prioritized] [--weight-store[=file]]
 # The user can specify one type in the command line args, and then
 # four of that type will train against each other. All of the weights will
 # be output to log files, and the filename of the winningest player will be logged
+# (population.py evolves a whole population of WeightedAI weights in parallel instead)
+#
+# With numWorkers > 1, games are played in that many worker processes (see trainParallel).
+# maxStaleness is the number of updates a game's weights may be behind by before its result is
+# thrown away, and reportEvery the number of seconds between progress reports
+#
+# --profile runs every game under cProfile (in whichever process plays it) and merges the results
+# into one pstats file, train.prof by default, with a text report next to it (see profiling.py)
+#
+# --checkpoint saves the state of the run (weights, win counts, random state, games played) to
+# dir, checkpoints by default, every checkpoint-every games (see checkpoint.py). --resume picks
+# the run up from the latest checkpoint in dir and carries on checkpointing there, or in the
+# --checkpoint dir if one is given. A sequential run resumes exactly where it stopped; a parallel
+# one restarts the games that were in flight. Replay buffers are too big to checkpoint, so a run
+# with --replay can't be resumed
+#
+# --weight-store has a parallel run publish the weights its games play with to a binary weight
+# store, trainWeights.bin by default, which the workers map instead of being sent the weights with
+# every game (see weightstore.py)
+#
+# --td trains the qAI classes with TD(lambda) instead of TD(0) (see td.py), with lambda 0.7, step
+# size 0.01 and the 'normalized' step size schedule unless given
+#
+# --replay keeps each seat's recent qAI transitions in a replay buffer (see experience.py) and
+# trains on updates mini-batches from it after every game: 100000 transitions, 32 batches of 64
+# and step size 0.01 unless given. --prioritized (or --prioritized=true; =false turns it off)
+# samples by TD error instead of uniformly. The buffers aren't checkpointed: after --resume they
+# start out empty and fill up again
 
-def main():
+TRAIN_CLASSES = {'qAI': qAI, 'WeightedAI': WeightedAI, 'qAI_improved': qAI_improved, 'minimax': minimax}
+
+LOG_NAMES = {'qAI': 'qAiWeightsLog%s.txt',
+             'WeightedAI': 'WeightedAiWeightsLog%s.txt',
+             'qAI_improved': 'qAi_win_WeightsLog%s.txt',
+             'minimax': 'qAi_minimax_WeightsLog%s.txt'}
+
+COLORS = ['orange', 'red', 'green', 'blue']
+
+CHECKPOINT_DIR = 'checkpoints'
+CHECKPOINT_EVERY = 50
+WEIGHT_STORE = 'trainWeights.bin'
+
+# Build one player of the class being trained. seat is the player's name and the index of its
+# weights log, turn_num its position in this game. With tdArgs, a qAI player learns by TD(lambda)
+# with these TdLearner arguments. rng is the player's random stream until a game gives it one,
+# which is what draws random starting weights for a weights log that is still a placeholder.
+# Given a StoredWeights instead of a weights log, the player reads its weights from the weight store
+def createPlayer(trainClass, turn_num, seat, weightsLog, tdArgs=None, rng=None):
+    stored = weightsLog if isinstance(weightsLog, StoredWeights) else None
+    if stored is not None:
+        weightsLog = DictLog()
+    player = TRAIN_CLASSES[trainClass](turn_num, str(seat), COLORS[seat], weightsLog, rng=rng)
+    if stored is not None:
+        player.weights = stored.view()
+    if tdArgs is not None and isinstance(player, qAI):
+        player.useTd(**tdArgs)
+    return player
+
+# TdLearner arguments from the value of --td
+def parseTdArgs(value):
+    parts = value.split(',')
+    tdArgs = {'lam': float(parts[0])}
+    if len(parts) > 1: tdArgs['stepSize'] = float(parts[1])
+    if len(parts) > 2: tdArgs['schedule'] = parts[2]
+    return tdArgs
 
-    colors = ['orange', 'red', 'green', 'blue']
+# Replay buffers for the four seats from the value of --replay
+def parseReplay(value, prioritized):
+    parts = value.split(',')
+    replayArgs = {'prioritized': prioritized}
+    if len(parts) > 1: replayArgs['batchSize'] = int(parts[1])
+    if len(parts) > 2: replayArgs['updates'] = int(parts[2])
+    if len(parts) > 3: replayArgs['stepSize'] = float(parts[3])
+    return SeatReplay(range(4), int(parts[0]), **replayArgs)
+
+# Remove --name or --name=value from argv. Returns the value, default for a bare --name, or None
+# if it isn't there
+def popOption(argv, name, default):
+    for i, arg in enumerate(argv):
+        if arg == name or arg.startswith(name + '='):
+            del argv[i]
+            return arg.split('=', 1)[1] if '=' in arg else default
+    return None
+
+# Remove the on/off option --name, --name=true or --name=false from argv. Returns whether it is on
+def popFlag(argv, name):
+    value = popOption(argv, name, 'true')
+    if value is None:
+        return False
+    assert value.lower() in ('true', '1', 'yes', 'false', '0', 'no'), "Bad value for %s: %s" % (name, value)
+    return value.lower() in ('true', '1', 'yes')
+
+# Save the state of a run after iteration games. weights are the seats' weight dicts
+def saveCheckpoint(checkpointer, iteration, trainClass, seed, weights, winners, **extra):
+    state = {'trainClass': trainClass, 'seed': seed, 'winners': dict(winners),
+             'weights': dict((j, dict(weights[j])) for j in range(4))}
+    state.update(extra)
+    checkpointer.save(iteration, state)
+
+def main():
 
+    profilePath = popProfileArg(sys.argv, 'train.prof')
+    resumeDir = popOption(sys.argv, '--resume', CHECKPOINT_DIR)
+    checkpointDir = popOption(sys.argv, '--checkpoint', CHECKPOINT_DIR) or resumeDir
+    checkpointEvery = int(popOption(sys.argv, '--checkpoint-every', CHECKPOINT_EVERY) or CHECKPOINT_EVERY)
+    td = popOption(sys.argv, '--td', '0.7')
+    tdArgs = parseTdArgs(td) if td else None
+    replayValue = popOption(sys.argv, '--replay', '100000')
+    prioritized = popFlag(sys.argv, '--prioritized')
+    replay = parseReplay(replayValue, prioritized) if replayValue else None
+    weightStore = popOption(sys.argv, '--weight-store', WEIGHT_STORE)
     possibleClasses = ['qAI', 'WeightedAI', 'qAI_improved', 'minimax']
     trainClass = sys.argv[1]
     numIters = int(sys.argv[2])
-    
+    numWorkers = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
     assert trainClass in possibleClasses
-    
+    assert replay is None or trainClass != 'WeightedAI', "Experience replay is for the qAI classes"
+    assert replay is None or not resumeDir, "Replay buffers are not checkpointed, so a --replay run can't be resumed"
+    assert weightStore is None or numWorkers > 1, "A weight store is for parallel runs"
+
+    # Checkpoints and weight files are written by a background thread, so games never wait on
+    # the disk
+    writer = BackgroundWriter()
+    checkpointer = Checkpointer(checkpointDir, writer=writer) if checkpointDir else None
+    state = None
+    if resumeDir:
+        state = Checkpointer(resumeDir).load()
+        assert state is not None, "No checkpoint to resume in " + resumeDir
+        assert state['trainClass'] == trainClass, "The checkpoint is of a %s run" % state['trainClass']
+        print('Resuming after %d games' % state['iteration'])
+
     weights = {}
-        
-    # Initialize the four weight logs that will be used for each of these players
+
+    # Initialize the four weight logs that will be used for each of these players, or restore
+    # them from the checkpoint. They are read for every player and updated after every game, so
+    # they are kept in memory by a registry and written to their files every 100 updates
+    registry = WeightRegistry(checkpointEvery=100, writer=writer)
     for i in range(4):
-        if trainClass == 'qAI':
-            weights[i] = Log('qAiWeightsLog%s.txt' % i)
-        elif trainClass == 'WeightedAI':
-            weights[i] = Log('WeightedAiWeightsLog%s.txt' % i)
-        elif trainClass == 'qAIWin':
-            weights[i] = Log('qAi_win_WeightsLog%s.txt' % i) 
-        elif trainClass == 'minimax':
-            weights[i] = Log('qAi_minimax_WeightsLog%s.txt' % i) 
-        weights[i].log_dict({'DELETE ME': -1})
+        weights[i] = registry.log(LOG_NAMES[trainClass] % i)
+        weights[i].log_dict(state['weights'][str(i)] if state else {'DELETE ME': -1})
+
+    trainArgs = {'checkpointer': checkpointer, 'checkpointEvery': checkpointEvery, 'state': state,
+                 'tdArgs': tdArgs, 'replay': replay}
+
+    if numWorkers > 1:
+        kwargs = {}
+        if len(sys.argv) > 4: kwargs['maxStaleness'] = int(sys.argv[4])
+        if len(sys.argv) > 5: kwargs['reportEvery'] = float(sys.argv[5])
+        kwargs.update(trainArgs, weightStore=weightStore)
+        winners = trainParallel(trainClass, numIters, weights, numWorkers, profilePath=profilePath, **kwargs)
+    elif profilePath:
+        profile = cProfile.Profile()
+        winners = profile.runcall(trainSequential, trainClass, numIters, weights, **trainArgs)
+        aggregate = ProfileAggregate()
+        aggregate.addProfile(profile)
+        aggregate.write(profilePath)
+    else:
+        winners = trainSequential(trainClass, numIters, weights, **trainArgs)
+
+    # Pull out the player who won the largest number of games
+    # Can modify this if we want access to the others as well
+    winningestPlayer = None
+    for k, v in winners.items():
+        if v == max(winners.values()):
+            winningestPlayer = k
+            break
+    assert winningestPlayer is not None
+    bestWeights = Log('bestWeights.txt')
+    bestWeights.log_dict(weights[winningestPlayer].readDict())
+    registry.close()
+    writer.close()
+
+    print('finished')
+
+# Play numIters training games one after the other. With a checkpointer, the run is checkpointed
+# every checkpointEvery games; state is a checkpoint to carry on from. tdArgs turn on TD(lambda),
+# and with replay (a SeatReplay) the qAI classes also learn from replayed transitions
+def trainSequential(trainClass, numIters, weights, checkpointer=None, checkpointEvery=CHECKPOINT_EVERY,
+                    state=None, seed=None, tdArgs=None, replay=None):
 
     # Give each a default win, just so as to avoid errors later
-    winners = defaultdict(int) 
+    winners = defaultdict(int)
     for i in range(4):
         winners[i] = 1
 
+    first = 0
+    if state is not None:
+        winners.update(intKeys(state['winners']))
+        setRandomState(random, state['random'])
+        seed, first = state['seed'], state['iteration']
+    if seed is None:
+        seed = GameRandom().seed
+    seeds = spawnSeeds(seed, numIters)
+
     # Run numIters training examples
-    for i in range(numIters):
+    for i in range(first, numIters):
         print(i)
         # In order to switch up the turn order, each player will randomly draw from this array
         # to determine their order
@@ -50,19 +230,14 @@ def main():
         # Load new players for this game
         # Alternate the order that players start in, so hopefully as to mitigate any
         # advantage of going first
-        if trainClass == 'qAI':
-            players = [qAI(nums.pop(random.randint(0, len(nums) - 1)), str(j), colors[j], weights[j]) for j in range(4)] 
-        elif trainClass == 'WeightedAI':
-            players = [WeightedAI(nums.pop(random.randint(0, len(nums) - 1)), str(j), colors[j], weights[j]) for j in range(4)] 
-        elif trainClass == 'qAI_improved':
-            players = [qAI_win(nums.pop(random.randint(0, len(nums) - 1)), str(j), colors[j], weights[j]) for j in range(4)] 
-        elif trainClass == 'minimax':
-            players = [qAI_minimax(nums.pop(random.randint(0, len(nums) - 1)), str(j), colors[j], weights[j]) for j in range(4)] 
-             
+        gameTdArgs = dict(tdArgs, games=i) if tdArgs is not None else None
+        players = [createPlayer(trainClass, nums.pop(random.randint(0, len(nums) - 1)), j, weights[j], gameTdArgs,
+                                playerRandom(seeds[i], j)) for j in range(4)]
+
         players.sort(key = lambda p: p.turn_num)
-        play = Play(players)
+        play = Engine(players, seed=seeds[i])
         play.main()
-   
+
         for player in play.players:
             if player.score >= 10:
                 winners[int(player.name)] += 1
@@ -71,22 +246,25 @@ def main():
         if trainClass == 'qAI' or trainClass == 'qAI_improved' or trainClass == 'minimax':
             for player in play.players:
                 player.endGameUpdate(play.game)
-           
+                if replay is not None:
+                    replay.learn(int(player.name), player.gameTransitions(), player.weights)
+                    player.weightsLog.log_dict(player.weights)
+
         # Otherwise, do what we were doing before, with updating the players' weights toward the
         # best player
         elif trainClass == 'WeightedAI':
             playerScores = [(player_, score) for player_, score in winners.items()]
             playerScores.sort(key = lambda x: x[1])
             worstId = playerScores[random.randint(0, 1)][0]
-            bestPlayer, bestScore = None, 0 
-            worstPlayer = None 
-        
+            bestPlayer, bestScore = None, 0
+            worstPlayer = None
+
             for player in play.players:
                 if player.turn_num == playerScores[3][0]:
                     bestPlayer, bestScore = player, player.score
                 if player.turn_num == worstId:
                     worstPlayer = player # Randomly select one of the two least winning players
-          
+
             assert bestPlayer is not None
             assert worstPlayer is not None
             bestWeights = bestPlayer.weights
@@ -99,19 +277,229 @@ def main():
                         scoreDiff = bestScore - player.score
                         updatedWeights = player.update_weights(bestPlayer.feature_extractor(), bestWeights, scoreDiff)
                         player.weightsLog.log_dict(updatedWeights)
-   
-    # Pull out the player who won the largest number of games
-    # Can modify this if we want access to the others as well
-    winningestPlayer = None
-    for k, v in winners.items():
-        if v == max(winners.values()):
-            winningestPlayer = k
-            break
-    assert winningestPlayer is not None
-    bestWeights = Log('bestWeights.txt')
-    bestWeights.log_dict(weights[winningestPlayer].readDict())
 
-    print('finished')
+        if checkpointer is not None and ((i + 1) % checkpointEvery == 0 or i + 1 == numIters):
+            saveCheckpoint(checkpointer, i + 1, trainClass, seed, dict((j, weights[j].readDict()) for j in range(4)),
+                           winners, random=randomState(random))
+
+    return winners
+
+#############################################################################
+##########################  Parallel self-play  #############################
+#############################################################################
+
+# Worker entry point: plays a training game, under cProfile if profile is set, and catches any
+# error so that it reaches the learner
+def playTrainingGame(args):
+    gameArgs, profile = args[:-1], args[-1]
+    try:
+        if not profile:
+            return trainingGame(*gameArgs)
+        result, profileData = runProfiled(trainingGame, *gameArgs)
+        result['profile'] = profileData
+        return result
+    except Exception:
+        return {'error': traceback.format_exc()}
+
+# Play one training game with a snapshot of the weights. Nothing is written to the weight files:
+# the result carries each seat's score, its end of game features, the prediction error
+# endGameUpdate returned and the change its weights went through (in-game TD updates plus
+# endGameUpdate), for the learner to apply. engineArgs are extra Engine arguments, such as stall
+# detection and time limits, and tdArgs TdLearner arguments. The snapshot's version stands in for
+# the number of games played for the step size schedule. With transitions set, each seat's
+# transitions come back too, for experience replay. The snapshot's seats can also be StoredWeights,
+# for weights the learner publishes to a weight store
+def trainingGame(trainClass, snapshot, version, seed, engineArgs=None, tdArgs=None, transitions=False):
+    # Same shuffled turn order as trainSequential, but drawn from the game's seed
+    nums = [0, 1, 2, 3]
+    random.Random(seed).shuffle(nums)
+    gameTdArgs = dict(tdArgs, games=version) if tdArgs is not None else None
+    logs = dict((j, snapshot[j] if isinstance(snapshot[j], StoredWeights) else DictLog(snapshot[j])) for j in range(4))
+    players = [createPlayer(trainClass, nums[j], j, logs[j], gameTdArgs, playerRandom(seed, j)) for j in range(4)]
+    players.sort(key = lambda p: p.turn_num)
+
+    play = Engine(players, seed=seed, **(engineArgs or {}))
+    result = play.main()
+
+    endDiffs = {}
+    if trainClass != 'WeightedAI':
+        for player in play.players:
+            endDiffs[int(player.name)] = player.endGameUpdate(play.game)
+
+    seats = {}
+    for player in play.players:
+        seat = int(player.name)
+        if isinstance(snapshot[seat], StoredWeights):
+            delta = player.weights.changes()
+        else:
+            start = snapshot[seat]
+            delta = {}
+            for feature, weight in player.weights.items():
+                change = weight - start.get(feature, 0.0)
+                if change:
+                    delta[feature] = change
+        seats[seat] = {'score': player.score, 'delta': delta, 'endDiff': endDiffs.get(seat),
+                       'features': dict(player.feature_extractor())}
+        if transitions:
+            seats[seat]['transitions'] = player.gameTransitions()
+    return {'version': version, 'turns': result['turns'], 'endReason': result['endReason'],
+            'seed': seed, 'seats': seats}
+
+def trainParallel(trainClass, numIters, weights, numWorkers, syncEvery=None, maxStaleness=None,
+                  reportEvery=30.0, seed=None, profilePath=None, engineArgs=None, checkpointer=None,
+                  checkpointEvery=CHECKPOINT_EVERY, state=None, tdArgs=None, replay=None, weightStore=None):
+    """
+    Self-play training with numWorkers worker processes.
+
+    This process is the learner. It keeps the master copy of every seat's weights, hands out
+    games that carry a snapshot of them, and applies results as they come back: TD classes add
+    the weight changes their players made during the game, WeightedAI runs the same
+    move-towards-the-best-player update as trainSequential. The snapshot handed to new games is
+    refreshed every syncEvery results (by default once per worker). A result whose snapshot is
+    more than maxStaleness updates old (by default 4 per worker) is dropped. Games per second and
+    the number of dropped results are printed every reportEvery seconds. With profilePath set,
+    every game is profiled and the merged profile is written there at the end. engineArgs are
+    passed on to every game's Engine, e.g. {'stallRounds': 20} to cut stalled games short.
+
+    With a checkpointer, the learner checkpoints every checkpointEvery games. Given a checkpoint
+    as state, the run carries on from the games it had finished; the games that were in flight
+    are played again. tdArgs, if given, make the qAI classes learn by TD(lambda) in their games.
+    With replay (a SeatReplay), games send back their transitions and the learner also trains on
+    them by experience replay.
+
+    With weightStore set to a path, the snapshot is published to a binary weight store there (see
+    weightstore.py) instead of being sent with every game: the games' players read it from the
+    mapping, and see every refresh of the snapshot as soon as it is published, even in the middle
+    of a game. A game is still judged stale by the version it was handed out with.
+    """
+    if syncEvery is None:
+        syncEvery = numWorkers
+    if maxStaleness is None:
+        maxStaleness = 4 * numWorkers
+    finished, applied, stale = 0, 0, 0
+    if state is not None:
+        seed, finished = state['seed'], state['iteration']
+        applied, stale = state['applied'], state['stale']
+    if seed is None:
+        seed = GameRandom().seed
+    seeds = spawnSeeds(seed, numIters)
+
+    # The learner's players hold the master weights. Building them initializes any weights log
+    # that is still a placeholder, the same way the first game of trainSequential would
+    learners = dict((j, createPlayer(trainClass, j, j, weights[j], rng=playerRandom(seed, j))) for j in range(4))
+    for j in range(4):
+        learners[j].weights = defaultdict(float, learners[j].weights)
+
+    def takeSnapshot():
+        return dict((j, dict(learners[j].weights)) for j in range(4))
+
+    winners = defaultdict(int)
+    for i in range(4):
+        winners[i] = 1
+    if state is not None:
+        winners.update(intKeys(state['winners']))
+
+    profile = ProfileAggregate() if profilePath else None
+    version, snapshot, snapshotVersion = applied, takeSnapshot(), applied
+
+    # Games are handed the weights to play with: the snapshot itself, or references to the sets
+    # it is published to
+    gameWeights = snapshot
+    if weightStore is not None:
+        store = WeightStore.create(weightStore, dict(('seat%d' % j, snapshot[j]) for j in range(4)))
+        gameWeights = dict((j, StoredWeights(weightStore, 'seat%d' % j)) for j in range(4))
+    done = Queue.Queue()
+    pool = multiprocessing.Pool(numWorkers)
+    first = submitted = finished
+    start = lastReport = time.time()
+
+    def submit():
+        args = (trainClass, gameWeights, snapshotVersion, seeds[submitted], engineArgs, tdArgs, replay is not None,
+                profile is not None)
+        pool.apply_async(playTrainingGame, (args,), callback=done.put)
+
+    try:
+        # Keep two games queued per worker so no worker waits on the learner
+        while submitted < min(numIters, first + 2 * numWorkers):
+            submit()
+            submitted += 1
+
+        while finished < numIters:
+            result = done.get()
+            finished += 1
+            if 'error' in result:
+                raise Exception('Training game failed:\n' + result['error'])
+            if profile is not None:
+                profile.add(result.pop('profile'))
+
+            if version - result['version'] > maxStaleness:
+                stale += 1
+            else:
+                applyTrainingResult(trainClass, learners, winners, result, applied, replay)
+                applied += 1
+                version += 1
+                if version - snapshotVersion >= syncEvery:
+                    snapshot, snapshotVersion = takeSnapshot(), version
+                    if weightStore is None:
+                        gameWeights = snapshot
+                    else:
+                        for j in range(4):
+                            store.publish('seat%d' % j, snapshot[j])
+
+            if submitted < numIters:
+                submit()
+                submitted += 1
+
+            if checkpointer is not None and (finished % checkpointEvery == 0 or finished == numIters):
+                saveCheckpoint(checkpointer, finished, trainClass, seed, takeSnapshot(), winners,
+                               applied=applied, stale=stale)
+
+            now = time.time()
+            if now - lastReport >= reportEvery or finished == numIters:
+                lastReport = now
+                print('%d/%d games, %.2f games/sec, %d stale results dropped' %
+                      (finished, numIters, (finished - first) / (now - start), stale))
+    finally:
+        pool.terminate()
+        pool.join()
+
+    for j in range(4):
+        weights[j].log_dict(learners[j].weights)
+    if profile is not None:
+        profile.write(profilePath)
+    return winners
+
+# Apply one game's result to the learner's players (and their weight logs), then train them on
+# their replay buffers if there is a replay
+def applyTrainingResult(trainClass, learners, winners, result, gameNum, replay=None):
+    seats = result['seats']
+    for seat, outcome in seats.items():
+        if outcome['score'] >= 10:
+            winners[seat] += 1
+
+    if trainClass != 'WeightedAI':
+        for seat, outcome in seats.items():
+            player = learners[seat]
+            for feature, change in outcome['delta'].items():
+                player.weights[feature] += change
+            if replay is not None:
+                replay.learn(seat, outcome['transitions'], player.weights)
+            player.weightsLog.log_dict(player.weights)
+        return
+
+    # Move everybody towards the seat with the most wins, as trainSequential does. Every tenth
+    # game is skipped, which is all the weight reset there amounts to
+    if gameNum % 10 == 0:
+        return
+    bestSeat = max(winners.items(), key = lambda x: x[1])[0]
+    bestScore = seats[bestSeat]['score']
+    bestFeatures = seats[bestSeat]['features']
+    bestWeights = dict(learners[bestSeat].weights)
+    for seat, outcome in seats.items():
+        if seat != bestSeat:
+            player = learners[seat]
+            scoreDiff = bestScore - outcome['score']
+            player.weightsLog.log_dict(player.update_weights(bestFeatures, bestWeights, scoreDiff))
 
 if __name__ == '__main__':
     main()
@@ -1,6 +1,5 @@
-from components import *
-from random import *
-from players import *
+import random
+import math
 
 # Prompt the user to identify an input
 def getResourceInput():
@@ -40,9 +39,9 @@ def get_devcard_prompt():
 
 
 # Function that defines die roll for the game
-def rollDice():
-    die1 = randint(1,6)
-    die2 = randint(1,6)
+def rollDice(rng=random):
+    die1 = rng.randint(1,6)
+    die2 = rng.randint(1,6)
     return die1 + die2
 
 # Print the players stats
@@ -109,16 +108,99 @@ def moveRobber(game, display):
     display.placeRobber(position)
     game.set_robber_location(position, display)
 
+# Static priors used to rank candidate moves before they are fully evaluated (see AiPlayer.pruneMoves)
+PORT_PRIOR = 0.05
+ANY_PORT_PRIOR = 0.03
+FRONTIER_PRIOR = 0.01
+PIECE_PRIORS = {'Settlement': 1.0, 'City': 1.0, 'Road': 0.1, 'buyDevCard': 0.3}
+
+# z value for 95% confidence intervals
+Z_95 = 1.96
+
+# Wilson score interval for k successes in n trials
+def wilsonInterval(k, n, z=Z_95):
+    if n == 0:
+        return 0.0, 1.0
+    p = float(k) / n
+    denom = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, centre - half), min(1.0, centre + half)
+
 #Gets the probability of a certain roll
 def rollProb(roll):
             dist = abs(roll - 7)
             num = float(6 - dist)
             return num / 36
 
-# Pulled from sentiment assignment to do an efficient dot product
+# Pulled from sentiment assignment to do an efficient dot product. Weights that aren't a dict
+# (weightstore.MappedWeights) work it out themselves with dot
 def dotProduct(d1, d2):
+    if not isinstance(d1, dict):
+        return d1.dot(d2)
+    if not isinstance(d2, dict):
+        return d2.dot(d1)
     if len(d1) < len(d2):
         return dotProduct(d2, d1)
     else:
         return sum(d1.get(f, 0) * v for f, v in d2.items())
 
+# Check if two moves in pickMove format place the same pieces at the same locations
+def sameMove(move1, move2):
+    if not move1 or not move2:
+        return not move1 and not move2
+    if set(move1.keys()) != set(move2.keys()):
+        return False
+    for action in move1:
+        if locationSet(action[0], move1[action]) != locationSet(action[0], move2[action]):
+            return False
+    return True
+
+# Order-insensitive form of the locations in a move. Roads are unordered pairs of nodes
+def locationSet(piece, locations):
+    if locations is None:
+        return None
+    if piece == 'Road':
+        return set(frozenset(road) for road in locations)
+    return set(locations)
+
+# A single location as it is on every copy of the board: a node's (row, col), a road's pair of
+# those, or None
+def locationKey(location):
+    if location is None:
+        return None
+    if isinstance(location, tuple):
+        return tuple((node.row, node.col) for node in location)
+    return (location.row, location.col)
+
+# Update a touching dict (node -> nodes it shares a road with) for a newly built road. roads
+# should already include the new road. Returns the unique list of nodes on the roads
+def addTouchingRoad(touching, roads, road):
+    roadNodes = list(set(list(sum(roads, ())))) # Flatten the roads into a (unique) list of nodes
+    nn1, nn2 = road # new node 1, 2 (for the new node)
+    for node in roadNodes:
+        # If a road exists between the two, they are touching
+        if (nn1, node) in roads or (node, nn1) in roads:
+            touching[nn1].append(node)
+            touching[node].append(nn1)
+        if (nn2, node) in roads or (node, nn2) in roads:
+            touching[nn2].append(node)
+            touching[node].append(nn2)
+    return roadNodes
+
+# Use a touching dict to get the longest path starting from any of roadNodes
+def longestRoadLength(touching, roadNodes):
+    longestPaths = []
+    for startNode in roadNodes:
+        visited = []
+
+        def longestPath(node, length, last, path):
+            toVisit = [n for n in touching[node] if n != last]
+            if node in visited or len(toVisit) == 0:
+                return length
+            visited.append(node)
+            return max(longestPath(neighbor, length + 1, node, path + [neighbor]) for neighbor in toVisit)
+
+        longestPaths.append(longestPath(startNode, 0, None, [startNode]))
+
+    return max(longestPaths)
@@ -0,0 +1,328 @@
+import os
+import sys
+import json
+import time
+import numpy as np
+from collections import defaultdict
+from log import Log
+
+'''
+Binary weight store. Several named weight sets (one per seat, say) live in one file as a float64
+array with a row per set, and a schema file next to it (path + '.schema<version>') lists the
+feature names for the columns and the set names for the rows.
+
+Every process opens the store with numpy.memmap, so they all share the same pages: a player's
+weights are a MappedWeights view that reads its set's row of the mapping by column, and whatever
+the writer publishes reaches every reader by its next evaluation. Nothing is parsed or copied per
+process or per game.
+
+Publishing a row in place is guarded by a sequence number in the header, like a seqlock: the
+writer makes it odd, writes the row, then makes it even again. Readers read while the sequence
+number is even and unchanged, retrying if the writer got in the way, so an evaluation never mixes
+two publishes. A writer that dies in the middle of a publish leaves the number odd; readers give
+up after READ_TIMEOUT seconds, and opening the store writable again makes the number even (the
+row keeps whatever the dead writer got to write).
+
+Publishing a new set or a feature the schema doesn't have writes the schema file for the next
+schema version, then a new data file that is renamed over the old one. Each data file names its
+schema version in the header, so a reader always pairs it with the right schema file; the one
+before it is kept for readers that mapped the old data just before the rename. Readers keep their
+old mapping until they call refresh, which notices the new file and maps it; views then look up
+their set's row again.
+
+The JSON weight files convert both ways, see fromJson and toJson, or from the command line:
+
+    python weightstore.py fromjson store.bin seat0=qAiWeightsLog0.txt seat1=qAiWeightsLog1.txt
+    python weightstore.py tojson store.bin seat0 bestWeights.txt
+'''
+
+MAGIC = 0x434154414e575453   # 'CATANWTS'
+FORMAT_VERSION = 2
+HEADER_SIZE = 8              # int64s: magic, format, schema version, sets, features, publishes,
+                             # write sequence
+PUBLISHES = 5
+SEQUENCE = 6
+
+# Seconds a reader waits for the sequence number to become even before giving up on the writer
+READ_TIMEOUT = 1.0
+
+def schemaPath(path, schemaVersion):
+    return '%s.schema%d' % (path, schemaVersion)
+
+class WeightStore(object):
+    """
+    A weight store opened for reading, or for reading and writing with writable set. Use
+    WeightStore.create to make a new one.
+    """
+    def __init__(self, path, writable=False):
+        self.path = path
+        self.writable = writable
+        self.map()
+        if writable and self.sequence() % 2:
+            # The last writer died in the middle of a publish
+            self.header[SEQUENCE] += 1
+
+    @staticmethod
+    def create(path, weightSets, schemaVersion=1):
+        features = sorted(set(feature for weights in weightSets.values() for feature in weights))
+        names = sorted(weightSets)
+        data = np.zeros((len(names), len(features)))
+        for row, name in enumerate(names):
+            for column, feature in enumerate(features):
+                data[row, column] = weightSets[name].get(feature, 0.0)
+
+        header = np.array([MAGIC, FORMAT_VERSION, schemaVersion, len(names), len(features), 0], dtype=np.int64)
+        header = np.concatenate([header, np.zeros(HEADER_SIZE - len(header), dtype=np.int64)])
+
+        # The schema goes under its own version's name first, then the data file replaces the
+        # old one in one rename. Schemas older than the previous one can go after that
+        tmpPath = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmpPath + '.schema', 'w') as f:
+            json.dump({'version': schemaVersion, 'features': features, 'sets': names}, f)
+        with open(tmpPath, 'wb') as f:
+            f.write(header.tostring())
+            f.write(data.tostring())
+        os.rename(tmpPath + '.schema', schemaPath(path, schemaVersion))
+        os.rename(tmpPath, path)
+        for old in range(1, schemaVersion - 1):
+            if os.path.exists(schemaPath(path, old)):
+                os.remove(schemaPath(path, old))
+        return WeightStore(path, writable=True)
+
+    # Map the file and read its schema
+    def map(self):
+        mode = 'r+' if self.writable else 'r'
+        while True:
+            inode = os.stat(self.path).st_ino
+            header = np.memmap(self.path, dtype=np.int64, mode=mode, shape=(HEADER_SIZE,))
+            assert header[0] == MAGIC and header[1] == FORMAT_VERSION, "Not a weight store: " + self.path
+            try:
+                with open(schemaPath(self.path, header[2])) as f:
+                    schema = json.load(f)
+                break
+            except IOError:
+                # Only a store replaced twice since we opened it has lost its schema; map the new one
+                if os.stat(self.path).st_ino == inode:
+                    raise
+        self.inode = inode
+        self.header = header
+        self.schemaVersion = schema['version']
+        self.features = schema['features']
+        self.names = schema['sets']
+        self.columns = dict((feature, column) for column, feature in enumerate(self.features))
+        self.rows = dict((name, row) for row, name in enumerate(self.names))
+        self.data = np.memmap(self.path, dtype=np.float64, mode=mode, offset=HEADER_SIZE * 8,
+                              shape=(len(self.names), len(self.features)))
+        # Plain ndarrays over the mapping, whose item() reads are much cheaper than indexing the
+        # memmaps, for the views
+        self.headerArray = self.header.view(np.ndarray)
+        self.dataArray = self.data.view(np.ndarray)
+
+    # Map the store again if it was replaced by one with a new schema. Returns True if it was
+    def refresh(self):
+        if os.stat(self.path).st_ino == self.inode:
+            return False
+        self.map()
+        return True
+
+    # Number of publishes so far
+    def version(self):
+        return int(self.header[PUBLISHES])
+
+    def sequence(self):
+        return self.headerArray.item(SEQUENCE)
+
+    # Weights of a set that read from the shared mapping. Writes to the view stay in the view
+    def view(self, name):
+        assert name in self.rows, "No weight set " + name
+        return MappedWeights(self, name)
+
+    # Returns read(*args), called while no publish was in progress, again if one got in the way
+    def readConsistent(self, read, *args):
+        deadline = None
+        while True:
+            before = self.sequence()
+            if not before % 2:
+                result = read(*args)
+                if self.sequence() == before:
+                    return result
+            if deadline is None:
+                deadline = time.time() + READ_TIMEOUT
+            elif time.time() > deadline:
+                raise Exception('Weight store %s has been in the middle of a publish for %.1fs; if its writer '
+                                'died, opening it writable recovers it' % (self.path, READ_TIMEOUT))
+
+    # The values of a row
+    def readRow(self, row):
+        return self.readConsistent(lambda: self.dataArray[row].tolist())
+
+    # A dict copy of a set
+    def snapshot(self, name):
+        return dict(zip(self.features, self.readRow(self.rows[name])))
+
+    # Replace the weights of a set
+    def publish(self, name, weights):
+        assert self.writable, "Weight store opened read-only"
+        if name not in self.rows or any(feature not in self.columns for feature in weights):
+            sets = dict((other, self.snapshot(other)) for other in self.names)
+            sets[name] = dict(weights)
+            store = WeightStore.create(self.path, sets, self.schemaVersion + 1)
+            store.header[PUBLISHES] = self.version() + 1
+            store.header.flush()
+            self.map()
+            return
+        row = np.zeros(len(self.features))
+        for feature, weight in weights.items():
+            row[self.columns[feature]] = weight
+        self.header[SEQUENCE] += 1
+        self.data[self.rows[name]] = row
+        self.header[SEQUENCE] += 1
+        self.header[PUBLISHES] += 1
+
+    def flush(self):
+        self.data.flush()
+        self.header.flush()
+
+    # Build a store from JSON weight files, given as {set name: file name}
+    @staticmethod
+    def fromJson(path, jsonFiles):
+        return WeightStore.create(path, dict((name, Log(fileName).readDict()) for name, fileName in jsonFiles.items()))
+
+    def toJson(self, name, fileName):
+        Log(fileName).log_dict(self.snapshot(name))
+
+class MappedWeights(object):
+    """
+    View of the set name in a WeightStore, for a player's weights. It reads the set's row of the
+    mapping by column and keeps no copy of it. util.dotProduct evaluates through dot, which reads
+    every weight it needs under the store's sequence number, so an evaluation never sees half of a
+    publish. Unknown features read as 0 like the defaultdicts players usually have. Writes (the TD
+    updates some players make during a game) go to a private overlay and never reach the store;
+    changes gives what they changed.
+    """
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self.overlay = {}
+        # Weight of each overlay feature before its first write
+        self.base = {}
+        self.locate()
+
+    # Find the set's row in the store's mapping, again once it was mapped again (when the set may
+    # have moved to another row)
+    def locate(self):
+        store = self.store
+        self.schemaVersion = store.schemaVersion
+        self.features = store.features
+        self.columns = store.columns
+        self.row = store.rows[self.name]
+        self.values = store.dataArray[self.row]
+        # Overlay features the schema doesn't have
+        self.extra = [feature for feature in self.overlay if feature not in self.columns]
+
+    def check(self):
+        if self.schemaVersion != self.store.schemaVersion:
+            self.locate()
+
+    def get(self, feature, default=0.0):
+        if feature in self.overlay:
+            return self.overlay[feature]
+        self.check()
+        column = self.columns.get(feature)
+        return default if column is None else self.values.item(column)
+
+    def __getitem__(self, feature):
+        return self.get(feature)
+
+    def __setitem__(self, feature, weight):
+        if feature not in self.overlay:
+            self.base[feature] = self.get(feature)
+            if feature not in self.columns:
+                self.extra.append(feature)
+        self.overlay[feature] = weight
+
+    # How much the writes moved each weight they changed
+    def changes(self):
+        return dict((feature, weight - self.base[feature]) for feature, weight in self.overlay.items()
+                    if weight != self.base[feature])
+
+    def update(self, weights):
+        for feature, weight in (weights.items() if hasattr(weights, 'items') else weights):
+            self[feature] = weight
+
+    def __contains__(self, feature):
+        return feature in self.overlay or feature in self.columns
+
+    def __len__(self):
+        self.check()
+        return len(self.features) + len(self.extra)
+
+    def keys(self):
+        self.check()
+        return self.features + self.extra
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        self.check()
+        weights = dict(zip(self.features, self.store.readRow(self.row)))
+        weights.update(self.overlay)
+        return weights.items()
+
+    # Sum of weight * value over the features dict features, as util.dotProduct works it out
+    def dot(self, features):
+        self.check()
+        return self.store.readConsistent(self.weightedSum, features)
+
+    def weightedSum(self, features):
+        columns, item, overlay = self.columns, self.values.item, self.overlay
+        total = 0
+        for feature, value in features.items():
+            if overlay and feature in overlay:
+                total += overlay[feature] * value
+            else:
+                column = columns.get(feature)
+                if column is not None:
+                    total += item(column) * value
+        return total
+
+    # Copies (of a game being searched, or sent to another process) get a plain dict of the
+    # weights as they are now, without the mapping
+    def __deepcopy__(self, memo):
+        return defaultdict(float, self.items())
+
+    def __reduce__(self):
+        return (defaultdict, (float, dict(self.items())))
+
+# The stores this process has open, by path
+_openStores = {}
+
+class StoredWeights(object):
+    """
+    Reference to a set in a weight store that can be sent to a worker process. view maps the store
+    the first time it is used in a process and picks up a replaced store after that.
+    """
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+
+    def view(self):
+        store = _openStores.get(self.path)
+        if store is None:
+            store = _openStores[self.path] = WeightStore(self.path)
+        else:
+            store.refresh()
+        return store.view(self.name)
+
+def main():
+    command, path = sys.argv[1], sys.argv[2]
+    if command == 'fromjson':
+        WeightStore.fromJson(path, dict(arg.split('=', 1) for arg in sys.argv[3:]))
+    elif command == 'tojson':
+        WeightStore(path).toJson(sys.argv[3], sys.argv[4])
+    else:
+        print('Unknown command ' + command)
+
+if __name__ == '__main__':
+    main()